@@ -8,5 +8,14 @@ with st.status("Creating daily summaries...") as status:
     load_dotenv()
     mongo_manager = MongoManager()
     embedding_generator = EmbeddingGenerator()
-    SummaryManager(mongo_manager, embedding_generator).create_daily_summaries()
-    status.update(label="Daily summaries created successfully!", state="complete")
+    summary_manager = SummaryManager(mongo_manager, embedding_generator)
+    reports = [summary_manager.create_daily_summaries()]
+    reports += summary_manager.create_rollup_summaries()
+    for report in reports:
+        st.json(report.model_dump(mode="json"))
+    failed = sum(report.failed for report in reports)
+    status.update(
+        label=f"Summaries created: {', '.join(f'{r.summarized} {r.job}' for r in reports)}, "
+        f"{failed} failed",
+        state="error" if failed else "complete",
+    )
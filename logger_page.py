@@ -2,6 +2,7 @@ import streamlit as st
 import os
 from datetime import datetime
 import glob
+from src.metrics import get_metrics
 
 
 def get_log_files():
@@ -45,6 +46,9 @@ def parse_log_line(line):
 def main():
     st.title("Log Viewer")
 
+    with st.expander("Metrics"):
+        st.json(get_metrics().snapshot())
+
     # Get list of log files
     log_files = get_log_files()
 
@@ -61,7 +61,7 @@ class Authentication:
             return
 
         try:
-            users = self.mongo_manager.get_users()
+            users = self.mongo_manager.get_users(projection="ids-only")
             if any(user["user_id"] == user_id for user in users):
                 st.error("ID Utente già esistente!")
                 return
@@ -139,6 +139,7 @@ def show_chat_interface(chat_manager):
     st.write(f"Benvenuto, {st.session_state.user_id}!")
     chat_manager.initialize_chat()
     if st.button("Disconnetti"):
+        chat_manager.end_session()
         st.session_state.authenticated = False
         st.session_state.user_id = None
         st.experimental_rerun()
@@ -176,13 +177,12 @@ def show_chat_interface(chat_manager):
                 unsafe_allow_html=True,
             )
 
-        if assistant_message := chat_manager.handle_chat_input(prompt):
-            with st.chat_message("assistant"):
-                st.markdown(assistant_message.content)
-                st.markdown(
-                    f"<span style='color: gray; font-size: 0.8em;'>{message.timestamp.strftime('%H:%M')}</span>",
-                    unsafe_allow_html=True,
-                )
+        with st.chat_message("assistant"):
+            st.write_stream(chat_manager.stream_chat_input(prompt))
+            st.markdown(
+                f"<span style='color: gray; font-size: 0.8em;'>{chat_manager.messages[-1].timestamp.strftime('%H:%M')}</span>",
+                unsafe_allow_html=True,
+            )
 
 
 main()
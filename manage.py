@@ -0,0 +1,217 @@
+import argparse
+from dotenv import load_dotenv
+from src.logger import get_logger
+from src.mongo import MongoManager
+from src.mongo_indexes import INDEX_REGISTRY
+from src.chat_manager import SummaryManager
+from src.embedding import EmbeddingGenerator
+from src.embedding_backends import get_embedding_backend
+from src.reembed import reembed_collections
+from src.rollups import LEVELS
+from datetime import date, timedelta
+from src.CONSTANTS import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    EMBEDDING_STORAGE_DTYPE,
+    MONGO_BULK_BATCH_SIZE,
+)
+
+logger = get_logger(name="manage", log_level="INFO")
+
+VECTOR_COLLECTIONS = [
+    "conversations",
+    "summaries",
+    "documents",
+    "conversation_chunks",
+    "document_chunks",
+]
+
+
+def resync_segments(args):
+    mongo_manager = MongoManager()
+    for collection in args.collections:
+        rows = mongo_manager.resync_embedding_segments(collection)
+        logger.info(f"{collection}: {rows} embeddings written to segments")
+
+
+def compact_segments(args):
+    mongo_manager = MongoManager()
+    for collection in args.collections:
+        rows = mongo_manager.segment_store.compact(collection)
+        logger.info(f"{collection}: compacted to {rows} live embeddings")
+
+
+def segment_stats(args):
+    mongo_manager = MongoManager()
+    for collection in args.collections:
+        logger.info(str(mongo_manager.segment_store.stats(collection)))
+
+
+def ensure_indexes(args):
+    mongo_manager = MongoManager(ensure_indexes=False)
+    mongo_manager.ensure_indexes(verify=args.verify)
+
+
+def dedupe(args):
+    mongo_manager = MongoManager(ensure_indexes=False)
+    counts = mongo_manager.remove_duplicates(args.collections, dry_run=args.dry_run)
+    for collection, count in counts.items():
+        verb = "would be removed" if args.dry_run else "removed"
+        logger.info(f"{collection}: {count} duplicate documents {verb}")
+    if not args.dry_run:
+        mongo_manager.ensure_indexes()
+
+
+def migrate_embeddings(args):
+    mongo_manager = MongoManager()
+    for collection in args.collections:
+        count = mongo_manager.migrate_embedding_storage(
+            collection, dtype=args.dtype, batch_size=args.batch_size
+        )
+        logger.info(f"{collection}: {count} embeddings re-encoded as {args.dtype}")
+        if mongo_manager.segment_store.has_collection(collection):
+            rows = mongo_manager.resync_embedding_segments(collection)
+            logger.info(f"{collection}: {rows} embeddings written to segments")
+
+
+def reembed(args):
+    generator = EmbeddingGenerator(
+        backend=get_embedding_backend(args.backend, model=args.model)
+    )
+    mongo_manager = MongoManager(embedding_model=generator.model)
+    counts = reembed_collections(
+        mongo_manager, generator, args.collections, batch_size=args.batch_size
+    )
+    for collection, count in counts.items():
+        logger.info(f"{collection}: {count} documents re-embedded with {generator.model}")
+    for collection in args.collections:
+        rows = mongo_manager.resync_embedding_segments(collection)
+        logger.info(f"{collection}: {rows} embeddings written to segments")
+    logger.info(f"Set EMBEDDING_MODEL to {generator.model} to search the new vectors")
+
+
+def export_summary_batch(args):
+    summary_manager = SummaryManager(MongoManager(), EmbeddingGenerator())
+    count = summary_manager.export_batch_requests(
+        args.output, model=args.model, day=args.day, job=args.level
+    )
+    logger.info(f"{count} summary requests written to {args.output}")
+
+
+def rollup_summaries(args):
+    summary_manager = SummaryManager(MongoManager(), EmbeddingGenerator())
+    day = args.start
+    while day <= args.end:
+        for report in summary_manager.create_rollup_summaries(model=args.model, day=day):
+            logger.info(
+                f"{report.job} {report.day}: {report.summarized} rollups stored, "
+                f"{report.empty} empty, {report.failed} failed"
+            )
+        day += timedelta(days=1)
+
+
+def import_summary_batch(args):
+    summary_manager = SummaryManager(MongoManager(), EmbeddingGenerator())
+    for report in summary_manager.import_batch_results(args.input):
+        logger.info(
+            f"{report.job} {report.day}: {report.summarized} summaries stored, "
+            f"{report.failed} failed, {report.skipped} already done"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meddy maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name, handler, help_text in [
+        ("resync-segments", resync_segments, "Rebuild embedding segments from Mongo"),
+        ("compact-segments", compact_segments, "Drop tombstoned embedding rows"),
+        ("segment-stats", segment_stats, "Show embedding segment statistics"),
+    ]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument(
+            "--collections", nargs="+", default=VECTOR_COLLECTIONS, choices=VECTOR_COLLECTIONS
+        )
+        command.set_defaults(handler=handler)
+
+    command = commands.add_parser("ensure-indexes", help="Apply the index registry")
+    command.add_argument(
+        "--verify", action="store_true", help="Fail if a query shape would COLLSCAN"
+    )
+    command.set_defaults(handler=ensure_indexes)
+
+    command = commands.add_parser(
+        "dedupe",
+        help="Remove documents with duplicate unique keys, then apply the index registry",
+    )
+    command.add_argument(
+        "--collections", nargs="+", default=list(INDEX_REGISTRY), choices=list(INDEX_REGISTRY)
+    )
+    command.add_argument(
+        "--dry-run", action="store_true", help="Only count the duplicates"
+    )
+    command.set_defaults(handler=dedupe)
+
+    command = commands.add_parser(
+        "migrate-embeddings", help="Re-encode stored embeddings in a storage dtype"
+    )
+    command.add_argument(
+        "--collections", nargs="+", default=VECTOR_COLLECTIONS, choices=VECTOR_COLLECTIONS
+    )
+    command.add_argument(
+        "--dtype",
+        default=EMBEDDING_STORAGE_DTYPE,
+        choices=["float32", "float16", "int8", "list"],
+    )
+    command.add_argument("--batch-size", type=int, default=MONGO_BULK_BATCH_SIZE)
+    command.set_defaults(handler=migrate_embeddings)
+
+    command = commands.add_parser(
+        "reembed", help="Re-embed vectors of other models and rebuild the segments"
+    )
+    command.add_argument(
+        "--collections", nargs="+", default=VECTOR_COLLECTIONS, choices=VECTOR_COLLECTIONS
+    )
+    command.add_argument(
+        "--backend",
+        default=EMBEDDING_BACKEND,
+        choices=["openai", "sentence-transformers"],
+    )
+    command.add_argument("--model", default=EMBEDDING_MODEL)
+    command.add_argument("--batch-size", type=int, default=MONGO_BULK_BATCH_SIZE)
+    command.set_defaults(handler=reembed)
+
+    command = commands.add_parser(
+        "export-summary-batch", help="Write daily summary requests to a batch input file"
+    )
+    command.add_argument("--output", required=True, help="JSONL file, appended to")
+    command.add_argument(
+        "--day", type=date.fromisoformat, default=None, help="YYYY-MM-DD, default yesterday"
+    )
+    command.add_argument("--model", default=None)
+    command.add_argument(
+        "--level", default="daily", choices=LEVELS, help="Rollups export the period of --day"
+    )
+    command.set_defaults(handler=export_summary_batch)
+
+    command = commands.add_parser(
+        "import-summary-batch", help="Store the summaries of a batch results file"
+    )
+    command.add_argument("--input", required=True, help="JSONL results file")
+    command.set_defaults(handler=import_summary_batch)
+
+    command = commands.add_parser(
+        "rollup-summaries", help="Build the weekly and monthly rollups ending in a date range"
+    )
+    command.add_argument("--start", type=date.fromisoformat, required=True)
+    command.add_argument("--end", type=date.fromisoformat, required=True)
+    command.add_argument("--model", default=None)
+    command.set_defaults(handler=rollup_summaries)
+
+    args = parser.parse_args()
+    load_dotenv()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
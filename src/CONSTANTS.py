@@ -6,15 +6,97 @@ DEFAULT_PARAMETERS = {
 }
 MAX_CONV_TOKENS = 128000
 
+# ================== OPENAI CLIENT SETTINGS ==================
+OPENAI_MAX_CONNECTIONS = 50  # Shared by every agent and embedding call of the process
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+OPENAI_KEEPALIVE_EXPIRY = 60  # Seconds an idle connection is kept open
+OPENAI_TIMEOUT = 60  # Seconds per request
+OPENAI_CONNECT_TIMEOUT = 5
+OPENAI_MAX_RETRIES = 2
+OPENAI_HTTP2 = False  # Requires the optional h2 package (httpx[http2])
+PROMPT_CACHE_VERIFY = False  # Log cached vs uncached prompt tokens of every call
+
+# ================== TOOL CALLING SETTINGS ==================
+AGENT_MAX_TOOL_ROUNDS = 5  # Model turns with tool calls before a text answer is required
+TOOL_WORKERS = 8  # Tool calls of a turn run concurrently on this many threads
+TOOL_TIMEOUT = 20  # Seconds per tool call, unless registered with its own
+TOOL_MAX_RESULT_CHARS = 8000  # Longer tool results are truncated
+
 # ================== MONGODB CONFIGURATION ==================
 MONGO_DB_NAME = "medassistant"
 MONGO_CONVERSATIONS_COLLECTION = "conversations"
 MONGO_SUMMARIES_COLLECTION = "summaries"
 MONGO_DOCUMENTS_COLLECTION = "documents"
+MONGO_ENSURE_INDEXES = True  # Apply the index registry on first connection
+MONGO_VERIFY_QUERY_PLANS = False  # Fail startup if a hot query would COLLSCAN
+MONGO_MAX_POOL_SIZE = 50  # Shared by every session of the process
+MONGO_MIN_POOL_SIZE = 2
+MONGO_MAX_IDLE_TIME_MS = 60000
+MONGO_WAIT_QUEUE_TIMEOUT_MS = 5000
+MONGO_CONNECT_TIMEOUT_MS = 5000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 10000
+MONGO_BULK_BATCH_SIZE = 500  # Documents per insert_many / bulk_write round-trip
 
 # ================== CONVERSATION HISTORY SETTINGS ==================
 N_PREVIOUS_DAYS = 7
 CHAT_HISTORY_MODE = "truncate"  # Options: "truncate", "reword_query"
+EMBEDDING_REFRESH_MESSAGES = 6  # Re-embed a conversation after this many new messages
+CONTEXT_TOKEN_BUDGET = 8000  # Tokens of summaries, sessions and documents in the system prompt
+CONTEXT_RECENCY_HALF_LIFE_HOURS = 72  # Age at which an item's recency score halves
+CONTEXT_RELEVANCE_WEIGHT = 0.5  # Weight of embedding similarity vs recency
+CONTEXT_MAX_DOCUMENTS = 3  # Document passages considered for the prompt
+CONTEXT_QUERY_MESSAGES = 6  # Latest messages of today embedded as the relevance query
+CONTEXT_SUMMARY_BUDGET = 3000  # Tokens of summaries; older periods use coarser rollups
+CONTEXT_ROLLUP_WEEKS = 8  # Weekly rollups loaded for the context
+CONTEXT_ROLLUP_MONTHS = 12  # Monthly rollups loaded for the context
+
+# ================== WRITE-BEHIND PERSISTENCE ==================
+WRITE_BEHIND_WORKERS = 4
+WRITE_BEHIND_MAX_PENDING = 256  # Sessions waiting to be stored before submit blocks
+WRITE_BEHIND_SHUTDOWN_TIMEOUT = 30  # Seconds to drain the queue at exit
+
+# ================== SUMMARY ENGINE SETTINGS ==================
+SUMMARY_WORKERS = 8  # Users summarized concurrently by the nightly job
+SUMMARY_REQUESTS_PER_MINUTE = 500  # Shared rate limit of the summary model calls
+SUMMARY_TOKENS_PER_MINUTE = 200000
+SUMMARY_OUTPUT_TOKENS_ESTIMATE = 1500  # Reserved per call in the token budget
+SUMMARY_RETRIES = 3
+SUMMARY_CHECKPOINT_BATCH = 20  # Summaries stored and checkpointed together
+SUMMARY_PROGRESS_INTERVAL = 30  # Seconds between progress logs
+ROLLING_SUMMARY_MODEL = "o1-mini"  # Model folding ended sessions into the day's summary
+ROLLING_SUMMARY_TTL_DAYS = 7  # Rolling summaries are deleted once this old
+
+# ================== EMBEDDING SETTINGS ==================
+EMBEDDING_BACKEND = "openai"  # Options: "openai", "sentence-transformers"
+EMBEDDING_MODEL = "text-embedding-3-small"  # e.g. "paraphrase-multilingual-MiniLM-L12-v2" locally
+LEGACY_EMBEDDING_MODEL = "text-embedding-3-small"  # Model of vectors stored without embedding_model
+LOCAL_EMBEDDING_DEVICE = "cpu"
+LOCAL_EMBEDDING_THREADS = 0  # torch intra-op threads, 0 keeps torch's default
+LOCAL_EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_MAX_TOKENS = 8191  # Input limit of the OpenAI embedding models
+EMBEDDING_BATCH_MAX_ITEMS = 2048  # Inputs per embeddings request (API limit)
+EMBEDDING_BATCH_MAX_TOKENS = 250000  # Total tokens per request, below the 300k API limit
+EMBEDDING_BATCH_RETRIES = 3
+EMBEDDING_BATCH_CONCURRENCY = 1  # Requests in flight at once for create_batch
+EMBEDDING_CACHE_PATH = "data/embedding_cache.sqlite3"  # Persistent tier, None to disable
+EMBEDDING_CACHE_MAX_ENTRIES = 10000  # Vectors kept in the in-memory LRU
+EMBEDDING_STORAGE_DTYPE = "float32"  # Options: "float32", "float16", "int8", "list" (legacy)
+CHUNK_MAX_TOKENS = 512  # Tokens per embedded conversation/document window
+CHUNK_OVERLAP_TOKENS = 64  # Tokens repeated between consecutive windows
+
+# ================== VECTOR INDEX SETTINGS ==================
+VECTOR_INDEX_EXACT_THRESHOLD = 5000  # Partitions up to this size use exact search
+VECTOR_INDEX_NPROBE = 8  # IVF lists scanned per query on large partitions
+VECTOR_INDEX_TTL_SECONDS = 600  # Reload partitions to pick up other processes' writes
+VECTOR_INDEX_OVERSAMPLE = 4  # Candidate multiplier when extra filters are applied
+EMBEDDING_SEGMENTS_DIR = "data/embeddings"  # mmap segment store, enabled by a resync
+EMBEDDING_SEGMENT_MAX_ROWS = 100000
+
+# ================== KEYWORD SEARCH SETTINGS ==================
+BM25_K1 = 1.2
+BM25_B = 0.75
+KEYWORDS_PER_DOCUMENT = 20
+RRF_K = 60  # Reciprocal-rank fusion damping constant
 
 # ================== SYSTEM PROMPTS ==================
 DEFAULT_SYSTEM_PROMPT = """Sei Meddy, un assistente virtuale specializzato nel monitoraggio della salute dei pazienti.
@@ -35,11 +117,19 @@ Approccio:
 - Cerca di costruire un rapporto di fiducia
 - Non fare troppe domande assieme, lascia spazio per risposte dettagliate e sii coinciso
 
-Questa nuova conversazione inizia alle {current_time}. Di seguito puoi trovare il riassunto degli ultimi {n} giorni di conversazioni con {patient} e a seguire gli scambi delle sessioni precedenti avvenute durante a giornata odierna.
-Usali per contestualizzare la conversazione e fornire un supporto più personalizzato ma citali solo quando necessario.
+Di seguito puoi trovare il riassunto degli ultimi {n} giorni di conversazioni con {patient}, l'orario di inizio di questa conversazione e gli scambi delle sessioni precedenti avvenute durante la giornata odierna.
+Usali per contestualizzare la conversazione e fornire un supporto più personalizzato ma citali solo quando necessario."""
 
-RIASSUNTI:
-{summaries}
+# Appended after DEFAULT_SYSTEM_PROMPT: summaries only change once a day
+DEFAULT_SUMMARIES_PROMPT = """RIASSUNTI:
+{summaries}"""
+
+# Passages of the patient's documents relevant to the latest exchanges, if any
+DEFAULT_DOCUMENTS_PROMPT = """DOCUMENTI RILEVANTI (per leggere un documento per intero usa lo strumento get_document con l'identificativo tra parentesi quadre):
+{documents}"""
+
+# Appended last: changes at every session
+DEFAULT_SESSION_PROMPT = """Questa nuova conversazione inizia alle {current_time}.
 
 SESSIONI PRECEDENTI ODIERNE:
 {previous_sessions}"""
@@ -63,16 +153,15 @@ Approccio:
 - Mostra empatia e supporto e sii sempre professionale ma flessibile
 - Usa un linguaggio chiaro e accessibile
 - Cerca di costruire un rapporto di fiducia
-- Non fare troppe domande assieme, lascia spazio per risposte dettagliate e sii coinciso
+- Non fare troppe domande assieme, lascia spazio per risposte dettagliate e sii coinciso"""
 
-Questa nuova conversazione inizia alle {current_time}."""
+FIRST_TIME_SESSION_PROMPT = """Questa nuova conversazione inizia alle {current_time}."""
 
 FIRST_TIME_STARTING_MESSAGE = """Ciao! Sono Meddy, il tuo assistente virtuale per il monitoraggio della salute. Per iniziare, mi piacerebbe conoscere meglio la tua situazione attuale. Vuoi raccontarmi del tuo stato di salute?"""
 
 # ================== DAILY SUMMARIZATION PROMPT ==================
-SUMMARIZATION_PROMPT = """{conv_block}
-
-Questi sono tutti gli scambi avvenuti fra Meddy, il diario virtuale a scopo medico, e il paziente ieri.
+# Instructions first and conversations last, so the shared prefix can be cached
+SUMMARIZATION_PROMPT = """Di seguito trovi tutti gli scambi avvenuti fra Meddy, il diario virtuale a scopo medico, e il paziente ieri.
 Analizza e riassumine il contenuto in modo strutturato, seguendo questo formato:
 [Timestamp]: [Riassunto dettagliato]
 
@@ -98,4 +187,58 @@ Esempio di riassunto:
 2024-01-15 09:30: Paziente riferisce dolore moderato (6/10) al ginocchio sinistro, peggiorato rispetto a ieri. Qualità del sonno scarsa (4h totali). Continua terapia con ibuprofene 600mg bid con beneficio parziale. Umore stabile.
 2024-01-15 15:45: Miglioramento del dolore (3/10) dopo riposo. Riferisce lieve nausea post-pranzo. Ansia moderata per visita specialistica imminente.
 
-Assicurati che il riassunto sia completo ma conciso, evidenziando tutti gli elementi clinicamente rilevanti per il monitoraggio longitudinale del paziente. Escudi dal riassunto informazioni non pertinenti o ripetitive e i contenuti prodotti da Meddy."""
+Assicurati che il riassunto sia completo ma conciso, evidenziando tutti gli elementi clinicamente rilevanti per il monitoraggio longitudinale del paziente. Escudi dal riassunto informazioni non pertinenti o ripetitive e i contenuti prodotti da Meddy.
+
+SCAMBI:
+{conv_block}"""
+
+# ================== ROLLUP SUMMARIZATION PROMPT ==================
+# Weekly summaries roll up daily ones, monthly summaries roll up weekly ones
+ROLLUP_PROMPT = """Di seguito trovi i riassunti {sources} delle conversazioni fra Meddy, il diario virtuale a scopo medico, e il paziente dal {start} al {end}.
+Uniscili in un unico riassunto del periodo, più breve della loro somma, che permetta di seguire l'andamento del paziente nel tempo.
+
+Il riassunto deve includere in modo esplicito:
+1. Andamento dei sintomi fisici e della loro intensità
+2. Andamento dello stato emotivo e psicologico
+3. Terapie in corso, aderenza, risposta ed eventuali effetti collaterali
+4. Qualità del sonno e livelli di energia
+5. Eventi significativi, nuovi sintomi o preoccupazioni emerse nel periodo
+
+Linee guida per il riassunto:
+- Usa un linguaggio clinico ma chiaro
+- Evidenzia tendenze, miglioramenti e peggioramenti invece di ripetere ogni giorno
+- Riporta le date e le misurazioni specifiche degli eventi clinicamente rilevanti
+- Escludi informazioni non pertinenti o ripetitive
+
+RIASSUNTI:
+{summaries_block}"""
+
+ROLLUP_SOURCE_NAMES = {"daily": "giornalieri", "weekly": "settimanali"}
+
+# ================== ROLLING SUMMARIZATION PROMPT ==================
+# Folds the new exchanges of the day into its summary so far, at session end
+ROLLING_SUMMARY_PROMPT = """Di seguito trovi il riassunto delle conversazioni avvenute oggi fra Meddy, il diario virtuale a scopo medico, e il paziente, seguito dai nuovi scambi non ancora riassunti.
+Aggiorna il riassunto integrando i nuovi scambi, seguendo questo formato:
+[Timestamp]: [Riassunto dettagliato]
+
+Il riassunto deve includere in modo esplicito:
+1. Sintomi fisici riportati e loro intensità/variazioni
+2. Stato emotivo e psicologico
+3. Aderenza e risposta alle terapie in corso
+4. Qualità del sonno e livelli di energia
+5. Eventi significativi o cambiamenti nella routine
+6. Eventuali effetti collaterali dei farmaci
+7. Nuovi sintomi o preoccupazioni emerse
+
+Linee guida per il riassunto:
+- Usa un linguaggio clinico ma chiaro
+- Mantieni l'ordine cronologico degli eventi e tutte le informazioni del riassunto precedente
+- Riporta le parole esatte del paziente per sintomi o preoccupazioni importanti
+- Escludi informazioni non pertinenti o ripetitive e i contenuti prodotti da Meddy
+- Rispondi solo con il riassunto aggiornato
+
+RIASSUNTO PRECEDENTE:
+{previous_summary}
+
+NUOVI SCAMBI:
+{conv_block}"""
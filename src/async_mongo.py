@@ -0,0 +1,1044 @@
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from src.models import (
+    ConversationEntry,
+    SummaryEntry,
+    DocumentEntry,
+    User,
+    Message,
+    ChunkEntry,
+    BulkWriteReport,
+    RollingSummary,
+)
+from src.mongo import (
+    CHUNK_LOCATION_PROJECTION,
+    COLLECTION_KEYS,
+    Projection,
+    _SearchIndexSync,
+    _append_messages_update,
+    _best_chunks,
+    _combine_rankings,
+    _day_range,
+    _embedding_model_filter,
+    _resolve_projection,
+    _search_partition,
+    _session_messages_pipeline,
+    _summary_filter,
+    _upsert_operation,
+    _strip_fields,
+    _with_fields,
+)
+from src.chunking import CHUNK_COLLECTIONS
+from src.embedding_codec import (
+    STORED_EMBEDDING_QUERY,
+    decode_embedding,
+    encode_embedding,
+    stored_dtype,
+)
+from src.vector_index import VectorIndex, get_vector_index
+from src.segment_store import EmbeddingSegmentStore, get_segment_store
+from src.text_index import (
+    TEXT_FIELDS,
+    TextIndex,
+    extract_keywords,
+    get_text_index,
+)
+from src.mongo_indexes import (
+    INDEX_REGISTRY,
+    ensure_indexes_async,
+    find_duplicates_async,
+    verify_query_plans_async,
+)
+from src.mongo_pool import get_async_mongo_client, get_pool_stats
+from src.CONSTANTS import (
+    EMBEDDING_MODEL,
+    EMBEDDING_STORAGE_DTYPE,
+    VECTOR_INDEX_OVERSAMPLE,
+    MONGO_BULK_BATCH_SIZE,
+    MONGO_VERIFY_QUERY_PLANS,
+)
+from datetime import date, datetime
+
+if TYPE_CHECKING:
+    from src.embedding import EmbeddingGenerator
+
+
+class AsyncMongoManager(_SearchIndexSync):
+    """
+    asyncio twin of MongoManager on Motor.
+
+    Every method has the same name, arguments and return value as its
+    MongoManager counterpart, but is a coroutine, so many queries can be in
+    flight on one event loop. Both managers share the process-wide vector,
+    segment and BM25 indexes, so writes made through either are searchable
+    from both.
+    """
+
+    def __init__(
+        self,
+        db_name: str = "medassistant",
+        vector_index: Optional[VectorIndex] = None,
+        segment_store: Optional[EmbeddingSegmentStore] = None,
+        text_index: Optional[TextIndex] = None,
+        embedding_model: str = EMBEDDING_MODEL,
+        embedding_generator: Optional["EmbeddingGenerator"] = None,
+    ):
+        self.logger = logging.getLogger()
+        self.vector_index = vector_index or get_vector_index()
+        self.segment_store = segment_store or get_segment_store()
+        self.text_index = text_index or get_text_index()
+        # Model of the vectors searched and of untagged vectors written
+        self.embedding_model = embedding_model
+        # Embeds the chunks of documents; without it they are only indexed by text
+        self.embedding_generator = embedding_generator
+        # Concurrent searches on a cold partition wait for a single load
+        self._partition_locks: Dict[Tuple[str, str, Optional[str]], asyncio.Lock] = {}
+        try:
+            self.client = get_async_mongo_client()
+            self.db = self.client[db_name]
+            self.conversations = self.db.conversations
+            self.summaries = self.db.summaries
+            self.documents = self.db.documents
+            self.users = self.db.users
+            self.conversation_chunks = self.db.conversation_chunks
+            self.document_chunks = self.db.document_chunks
+            self.summary_checkpoints = self.db.summary_checkpoints
+            self.rolling_summaries = self.db.rolling_summaries
+            self.logger.info(f"Created async MongoDB manager for database: {db_name}")
+        except Exception as e:
+            self.logger.error(f"Failed to connect to MongoDB: {str(e)}")
+            raise
+
+    def pool_stats(self) -> dict:
+        """Counters of the process-wide Motor connection pool"""
+        return get_pool_stats(asynchronous=True)
+
+    async def ensure_indexes(self, verify: bool = MONGO_VERIFY_QUERY_PLANS) -> None:
+        """
+        Apply the index registry and optionally check that no hot query
+        shape is planned as a collection scan (raises QueryPlanError).
+        Not run implicitly: constructors cannot await.
+        """
+        try:
+            created = await ensure_indexes_async(self.db)
+            self.logger.info(f"Ensured MongoDB indexes: {created}")
+            if verify:
+                await verify_query_plans_async(self.db)
+                self.logger.info("All registered query shapes use an index")
+        except Exception as e:
+            self.logger.error(f"Failed to provision MongoDB indexes: {str(e)}")
+            raise
+
+    async def remove_duplicates(
+        self, collection_names: Optional[Sequence[str]] = None, dry_run: bool = False
+    ) -> Dict[str, int]:
+        """See MongoManager.remove_duplicates"""
+        counts = {}
+        for collection_name in collection_names or list(INDEX_REGISTRY):
+            try:
+                duplicates = await find_duplicates_async(self.db, collection_name)
+                counts[collection_name] = len(duplicates)
+                if dry_run or not duplicates:
+                    continue
+                await self.db[collection_name].delete_many({"_id": {"$in": duplicates}})
+                if collection_name in TEXT_FIELDS:
+                    self._unindex_documents(
+                        collection_name, [str(doc_id) for doc_id in duplicates]
+                    )
+                self.logger.info(
+                    f"Removed {len(duplicates)} duplicate documents from {collection_name}"
+                )
+            except Exception as e:
+                self.logger.error(
+                    f"Failed to remove duplicates from {collection_name}: {str(e)}"
+                )
+                raise
+        return counts
+
+    async def create_conversation(self, conversation: ConversationEntry) -> str:
+        try:
+            inserted_id = await self._insert_indexed("conversations", conversation)
+            self.logger.info(f"Created new conversation with ID: {inserted_id}")
+            return str(inserted_id)
+        except Exception as e:
+            self.logger.error(f"Failed to create conversation: {str(e)}")
+            raise
+
+    async def create_summary(self, summary: SummaryEntry) -> str:
+        try:
+            inserted_id = await self._insert_indexed("summaries", summary)
+            self.logger.info(f"Created new summary with ID: {inserted_id}")
+            return str(inserted_id)
+        except Exception as e:
+            self.logger.error(f"Failed to create summary: {str(e)}")
+            raise
+
+    async def create_document(self, document: DocumentEntry) -> str:
+        """See MongoManager.create_document"""
+        try:
+            # Embedding the chunks blocks on the embedding backend
+            chunks, embedding = await asyncio.to_thread(
+                self._chunk_document, document.document_id, document.user_id, document.text
+            )
+            if document.embedding is None and embedding:
+                document = document.copy(
+                    update={
+                        "embedding": embedding,
+                        "embedding_model": self.embedding_generator.model,
+                    }
+                )
+            inserted_id = await self._insert_indexed("documents", document)
+            await self.upsert_chunks(
+                "documents", document.document_id, chunks, total_chunks=len(chunks)
+            )
+            self.logger.info(f"Created new document with ID: {inserted_id}")
+            return str(inserted_id)
+        except Exception as e:
+            self.logger.error(f"Failed to create document: {str(e)}")
+            raise
+
+    async def create_user(self, user: User) -> str:
+        try:
+            result = await self.users.insert_one(user.dict())
+            self.logger.info(f"Created new user with ID: {result.inserted_id}")
+            return str(result.inserted_id)
+        except Exception as e:
+            self.logger.error(f"Failed to create user: {str(e)}")
+            raise
+
+    async def update_conversation(self, session_id: str, updates: dict):
+        try:
+            await self._update_one("conversations", {"session_id": session_id}, updates)
+            self.logger.info(f"Updated conversation: {session_id}")
+        except Exception as e:
+            self.logger.error(f"Failed to update conversation {session_id}: {str(e)}")
+            raise
+
+    async def append_conversation_messages(
+        self,
+        session_id: str,
+        user_id: str,
+        messages: List[Message],
+        embedding: Optional[List[float]] = None,
+        embedding_model: Optional[str] = None,
+    ) -> None:
+        """See MongoManager.append_conversation_messages"""
+        try:
+            updates, new_text = _append_messages_update(
+                user_id, messages, embedding, embedding_model or self.embedding_model
+            )
+            projection = {"_id": 1}
+            if embedding is not None:
+                projection["text_content"] = 1
+            document = await self.conversations.find_one_and_update(
+                {"session_id": session_id},
+                [{"$set": updates}],
+                projection=projection,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            doc_id = str(document["_id"])
+            if embedding is not None:
+                await self.conversations.update_one(
+                    {"_id": document["_id"]},
+                    {"$set": {"keywords": extract_keywords(document.get("text_content"))}},
+                )
+            self.text_index.append("conversations", user_id, doc_id, new_text)
+            if embedding is not None:
+                self._index_document(
+                    "conversations", doc_id, {"user_id": user_id, "embedding": embedding}
+                )
+            self.logger.info(
+                f"Appended {len(messages)} messages to conversation: {session_id}"
+            )
+        except Exception as e:
+            self.logger.error(
+                f"Failed to append messages to conversation {session_id}: {str(e)}"
+            )
+            raise
+
+    async def update_summary(self, summary_id: str, updates: dict):
+        try:
+            await self._update_one("summaries", {"summary_id": summary_id}, updates)
+            self.logger.info(f"Updated summary: {summary_id}")
+        except Exception as e:
+            self.logger.error(f"Failed to update summary {summary_id}: {str(e)}")
+            raise
+
+    async def update_document(self, document_id: str, updates: dict):
+        """See MongoManager.update_document"""
+        try:
+            chunks = None
+            if "text" in updates:
+                stored = await self.documents.find_one(
+                    {"document_id": document_id}, {"user_id": 1}
+                )
+                if stored:
+                    chunks, embedding = await asyncio.to_thread(
+                        self._chunk_document, document_id, stored["user_id"], updates["text"]
+                    )
+                    if embedding and "embedding" not in updates:
+                        updates = {
+                            **updates,
+                            "embedding": embedding,
+                            "embedding_model": self.embedding_generator.model,
+                        }
+            await self._update_one("documents", {"document_id": document_id}, updates)
+            if chunks is not None:
+                await self.upsert_chunks(
+                    "documents", document_id, chunks, total_chunks=len(chunks)
+                )
+            self.logger.info(f"Updated document: {document_id}")
+        except Exception as e:
+            self.logger.error(f"Failed to update document {document_id}: {str(e)}")
+            raise
+
+    async def update_user(self, user_id: str, updates: dict):
+        try:
+            await self.users.update_one({"user_id": user_id}, {"$set": updates})
+            self.logger.info(f"Updated user: {user_id}")
+        except Exception as e:
+            self.logger.error(f"Failed to update user {user_id}: {str(e)}")
+            raise
+
+    async def create_many(
+        self,
+        collection_name: str,
+        entries: Sequence,
+        ordered: bool = False,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> BulkWriteReport:
+        """See MongoManager.create_many"""
+        key_field = COLLECTION_KEYS[collection_name]
+        collection = getattr(self, collection_name)
+        report = BulkWriteReport(requested=len(entries))
+        try:
+            for offset in range(0, len(entries), batch_size):
+                documents = [
+                    self._prepare_document(collection_name, entry)
+                    for entry in entries[offset : offset + batch_size]
+                ]
+                errors = []
+                try:
+                    await collection.insert_many(documents, ordered=ordered)
+                except BulkWriteError as e:
+                    errors = self._bulk_errors(e, offset, documents, key_field)
+                    report.errors.extend(errors)
+
+                failed = {error.index - offset for error in errors}
+                stop = min(failed) if ordered and failed else len(documents)
+                written = [
+                    (document["_id"], document)
+                    for i, document in enumerate(documents[:stop])
+                    if i not in failed
+                ]
+                report.inserted += len(written)
+                # Index updates are CPU-bound, keep them off the event loop
+                await asyncio.to_thread(self._index_documents, collection_name, written)
+                if ordered and failed:
+                    break
+
+            self.logger.info(
+                f"Inserted {report.inserted}/{report.requested} documents into {collection_name} ({len(report.errors)} errors)"
+            )
+            return report
+        except Exception as e:
+            self.logger.error(f"Failed bulk insert into {collection_name}: {str(e)}")
+            raise
+
+    async def bulk_upsert(
+        self,
+        collection_name: str,
+        entries: Sequence,
+        ordered: bool = False,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> BulkWriteReport:
+        """See MongoManager.bulk_upsert"""
+        key_field = COLLECTION_KEYS[collection_name]
+        collection = getattr(self, collection_name)
+        report = BulkWriteReport(requested=len(entries))
+        try:
+            for offset in range(0, len(entries), batch_size):
+                documents = [
+                    self._prepare_document(collection_name, entry)
+                    for entry in entries[offset : offset + batch_size]
+                ]
+                operations = [
+                    _upsert_operation(document, key_field) for document in documents
+                ]
+
+                errors = []
+                try:
+                    result = await collection.bulk_write(operations, ordered=ordered)
+                    details = result.bulk_api_result
+                except BulkWriteError as e:
+                    details = e.details
+                    errors = self._bulk_errors(e, offset, documents, key_field)
+                    report.errors.extend(errors)
+                report.upserted += details.get("nUpserted", 0)
+                report.matched += details.get("nMatched", 0)
+                report.modified += details.get("nModified", 0)
+
+                failed = {error.index - offset for error in errors}
+                stop = min(failed) if ordered and failed else len(documents)
+                written = {
+                    document[key_field]: document
+                    for i, document in enumerate(documents[:stop])
+                    if i not in failed
+                }
+                if collection_name in TEXT_FIELDS and written:
+                    stored = await collection.find(
+                        {key_field: {"$in": list(written)}}, {"_id": 1, key_field: 1}
+                    ).to_list(None)
+                    await asyncio.to_thread(
+                        self._index_documents,
+                        collection_name,
+                        [(doc["_id"], written[doc[key_field]]) for doc in stored],
+                    )
+                if ordered and failed:
+                    break
+
+            self.logger.info(
+                f"Upserted {report.upserted} and updated {report.matched} of {report.requested} documents in {collection_name} ({len(report.errors)} errors)"
+            )
+            return report
+        except Exception as e:
+            self.logger.error(f"Failed bulk upsert into {collection_name}: {str(e)}")
+            raise
+
+    async def set_embeddings(
+        self,
+        collection_name: str,
+        embeddings: Sequence[Tuple[str, Optional[str], List[float]]],
+        embedding_model: str,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> int:
+        """See MongoManager.set_embeddings"""
+        collection = getattr(self, collection_name)
+        modified = 0
+        try:
+            for offset in range(0, len(embeddings), batch_size):
+                batch = embeddings[offset : offset + batch_size]
+                result = await collection.bulk_write(
+                    [
+                        UpdateOne(
+                            {"_id": ObjectId(doc_id)},
+                            {
+                                "$set": {
+                                    "embedding": encode_embedding(embedding),
+                                    "embedding_model": embedding_model,
+                                }
+                            },
+                        )
+                        for doc_id, _, embedding in batch
+                    ],
+                    ordered=False,
+                )
+                modified += result.modified_count
+                await asyncio.to_thread(
+                    self._index_documents,
+                    collection_name,
+                    [
+                        (
+                            doc_id,
+                            {
+                                "user_id": user_id,
+                                "embedding": embedding,
+                                "embedding_model": embedding_model,
+                            },
+                        )
+                        for doc_id, user_id, embedding in batch
+                    ],
+                )
+            self.logger.info(
+                f"Set {modified} {embedding_model} embeddings in {collection_name}"
+            )
+            return modified
+        except Exception as e:
+            self.logger.error(
+                f"Failed to set embeddings in {collection_name}: {str(e)}"
+            )
+            raise
+
+    async def migrate_embedding_storage(
+        self,
+        collection_name: str,
+        dtype: str = EMBEDDING_STORAGE_DTYPE,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> int:
+        """See MongoManager.migrate_embedding_storage"""
+        collection = getattr(self, collection_name)
+        migrated = 0
+        try:
+            cursor = collection.find(
+                STORED_EMBEDDING_QUERY, {"_id": 1, "embedding": 1}
+            ).batch_size(batch_size)
+            operations = []
+            async for document in cursor:
+                if stored_dtype(document["embedding"]) == dtype:
+                    continue
+                vector = decode_embedding(document["embedding"])
+                operations.append(
+                    UpdateOne(
+                        {"_id": document["_id"]},
+                        {"$set": {"embedding": encode_embedding(vector, dtype)}},
+                    )
+                )
+                if len(operations) >= batch_size:
+                    result = await collection.bulk_write(operations, ordered=False)
+                    migrated += result.modified_count
+                    operations = []
+            if operations:
+                result = await collection.bulk_write(operations, ordered=False)
+                migrated += result.modified_count
+            self.logger.info(
+                f"Re-encoded {migrated} embeddings of {collection_name} as {dtype}"
+            )
+            return migrated
+        except Exception as e:
+            self.logger.error(
+                f"Failed to migrate embeddings of {collection_name}: {str(e)}"
+            )
+            raise
+
+    async def _insert_indexed(self, collection_name: str, entry) -> ObjectId:
+        document = self._prepare_document(collection_name, entry)
+        result = await getattr(self, collection_name).insert_one(document)
+        self._index_document(collection_name, result.inserted_id, document)
+        return result.inserted_id
+
+    async def _update_one(self, collection_name: str, query: dict, updates: dict):
+        collection = getattr(self, collection_name)
+        text_field = TEXT_FIELDS[collection_name]
+        updates = self._prepare_updates(collection_name, updates)
+        if text_field not in updates and "embedding" not in updates:
+            return await collection.update_one(query, {"$set": updates})
+
+        document = await collection.find_one_and_update(
+            query,
+            {"$set": updates},
+            projection={"_id": 1, "user_id": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document:
+            self._index_document(
+                collection_name,
+                document["_id"],
+                {**updates, "user_id": document.get("user_id")},
+            )
+        return document
+
+    def _partition_lock(
+        self, kind: str, collection_name: str, user_id: Optional[str]
+    ) -> asyncio.Lock:
+        return self._partition_locks.setdefault(
+            (kind, collection_name, user_id), asyncio.Lock()
+        )
+
+    async def _ensure_vector_partition(
+        self, collection_name: str, user_id: Optional[str]
+    ) -> None:
+        async with self._partition_lock("vector", collection_name, user_id):
+            if self.vector_index.is_loaded(collection_name, user_id):
+                return
+            if self._segments_usable(collection_name):
+                ids, vectors, owners = await asyncio.to_thread(
+                    self.segment_store.load, collection_name, user_id
+                )
+                self.vector_index.load(collection_name, user_id, ids, vectors, owners)
+                self.logger.info(
+                    f"Loaded {len(ids)} vectors for {collection_name} partition {user_id} from segments"
+                )
+                return
+
+            query = {
+                **STORED_EMBEDDING_QUERY,
+                **_embedding_model_filter(self.embedding_model),
+            }
+            if user_id is not None:
+                query["user_id"] = user_id
+
+            ids, vectors, owners = [], [], []
+            cursor = getattr(self, collection_name).find(
+                query, {"_id": 1, "user_id": 1, "embedding": 1}
+            )
+            async for document in cursor:
+                vector = decode_embedding(document["embedding"])
+                if vectors and len(vector) != len(vectors[0]):
+                    continue
+                ids.append(str(document["_id"]))
+                vectors.append(vector)
+                owners.append(document.get("user_id"))
+            self.vector_index.load(collection_name, user_id, ids, vectors, owners)
+            self.logger.info(
+                f"Loaded {len(ids)} vectors for {collection_name} partition {user_id}"
+            )
+
+    async def _ensure_text_partition(
+        self, collection_name: str, user_id: Optional[str]
+    ) -> None:
+        async with self._partition_lock("text", collection_name, user_id):
+            if self.text_index.is_loaded(collection_name, user_id):
+                return
+            text_field = TEXT_FIELDS[collection_name]
+            query = {text_field: {"$type": "string"}}
+            if user_id is not None:
+                query["user_id"] = user_id
+
+            ids, texts, owners = [], [], []
+            cursor = getattr(self, collection_name).find(
+                query, {"_id": 1, "user_id": 1, text_field: 1}
+            )
+            async for document in cursor:
+                ids.append(str(document["_id"]))
+                texts.append(document[text_field])
+                owners.append(document.get("user_id"))
+            self.text_index.load(collection_name, user_id, ids, texts, owners)
+            self.logger.info(
+                f"Loaded {len(ids)} texts for {collection_name} partition {user_id}"
+            )
+
+    async def _ranked_fetch(
+        self,
+        collection_name: str,
+        rank: Callable[[int], List[Tuple[str, float]]],
+        filters: dict,
+        partition_only: bool,
+        limit: int,
+        score_field: str,
+        projection: Optional[dict] = None,
+    ) -> List[dict]:
+        collection = getattr(self, collection_name)
+        projection, hidden = _with_fields(projection, ["_id"])
+        k = limit if partition_only else limit * VECTOR_INDEX_OVERSAMPLE
+        while True:
+            hits = rank(k)
+            scores = dict(hits)
+            query = {"_id": {"$in": [ObjectId(doc_id) for doc_id in scores]}}
+            if filters:
+                query = {"$and": [filters, query]}
+            results = await collection.find(query, projection).to_list(None)
+            if len(results) >= limit or len(hits) < k:
+                break
+            k *= VECTOR_INDEX_OVERSAMPLE
+
+        for document in results:
+            document[score_field] = scores[str(document["_id"])]
+        results.sort(key=lambda document: document[score_field], reverse=True)
+        return _strip_fields(results[:limit], hidden)
+
+    async def _chunk_fetch(
+        self,
+        collection_name: str,
+        rank: Callable[[int], List[Tuple[str, float]]],
+        filters: dict,
+        limit: int,
+        score_field: str,
+        projection: Optional[dict] = None,
+    ) -> List[dict]:
+        collection = getattr(self, collection_name)
+        chunk_collection = getattr(self, CHUNK_COLLECTIONS[collection_name])
+        key_field = COLLECTION_KEYS[collection_name]
+        projection, hidden = _with_fields(projection, [key_field])
+        k = limit * VECTOR_INDEX_OVERSAMPLE
+        while True:
+            hits = rank(k)
+            best = _best_chunks(
+                await chunk_collection.find(
+                    {"_id": {"$in": [ObjectId(doc_id) for doc_id, _ in hits]}},
+                    CHUNK_LOCATION_PROJECTION,
+                ).to_list(None),
+                dict(hits),
+            )
+            query = {key_field: {"$in": list(best)}}
+            if filters:
+                query = {"$and": [filters, query]}
+            results = await collection.find(query, projection).to_list(None)
+            if len(results) >= limit or len(hits) < k:
+                break
+            k *= VECTOR_INDEX_OVERSAMPLE
+
+        for document in results:
+            document["best_chunk"] = best[document[key_field]]
+            document[score_field] = document["best_chunk"]["score"]
+        results.sort(key=lambda document: document[score_field], reverse=True)
+        return _strip_fields(results[:limit], hidden)
+
+    async def upsert_chunks(
+        self,
+        collection_name: str,
+        parent_id: str,
+        chunks: Sequence[ChunkEntry],
+        total_chunks: Optional[int] = None,
+    ) -> BulkWriteReport:
+        """See MongoManager.upsert_chunks"""
+        chunk_collection_name = CHUNK_COLLECTIONS[collection_name]
+        chunk_collection = getattr(self, chunk_collection_name)
+        try:
+            report = await self.bulk_upsert(chunk_collection_name, chunks)
+            if total_chunks is not None:
+                stale = [
+                    str(chunk["_id"])
+                    for chunk in await chunk_collection.find(
+                        {"parent_id": parent_id, "chunk_index": {"$gte": total_chunks}},
+                        {"_id": 1},
+                    ).to_list(None)
+                ]
+                if stale:
+                    await chunk_collection.delete_many(
+                        {"_id": {"$in": [ObjectId(doc_id) for doc_id in stale]}}
+                    )
+                    self._unindex_documents(chunk_collection_name, stale)
+            self.logger.info(
+                f"Stored {len(chunks)} chunks of {collection_name} {parent_id}"
+            )
+            return report
+        except Exception as e:
+            self.logger.error(
+                f"Failed to store chunks of {collection_name} {parent_id}: {str(e)}"
+            )
+            raise
+
+    async def resync_embedding_segments(self, collection_name: str) -> int:
+        """Rebuild the on-disk embedding segments of a collection from Mongo"""
+        try:
+            # The segment store streams a blocking PyMongo cursor, so run it
+            # on Motor's underlying collection in a worker thread
+            rows = await asyncio.to_thread(
+                self.segment_store.resync,
+                collection_name,
+                getattr(self, collection_name).delegate,
+                query=_embedding_model_filter(self.embedding_model),
+                model=self.embedding_model,
+            )
+            self.vector_index.invalidate(collection_name)
+            return rows
+        except Exception as e:
+            self.logger.error(
+                f"Failed to resync embedding segments for {collection_name}: {str(e)}"
+            )
+            raise
+
+    async def hybrid_search(
+        self,
+        collection_name: str,
+        text_query: str = None,
+        embedding_query: List[float] = None,
+        filters: dict = None,
+        limit: int = 10,
+        projection: Projection = None,
+        chunks: bool = False,
+    ) -> List[dict]:
+        """See MongoManager.hybrid_search"""
+        try:
+            filters = filters or {}
+            projection = _resolve_projection(projection)
+            user_id, partition_only = _search_partition(filters)
+
+            search_collection = (
+                CHUNK_COLLECTIONS[collection_name] if chunks else collection_name
+            )
+            rankings = []
+            if text_query:
+                await self._ensure_text_partition(search_collection, user_id)
+                rankings.append(
+                    lambda k: self.text_index.search(
+                        search_collection, user_id, text_query, k
+                    )
+                )
+            if embedding_query:
+                await self._ensure_vector_partition(search_collection, user_id)
+                rankings.append(
+                    lambda k: self.vector_index.search(
+                        search_collection, user_id, embedding_query, k
+                    )
+                )
+
+            if not rankings:
+                results = await (
+                    getattr(self, collection_name)
+                    .find(filters, projection)
+                    .limit(limit)
+                    .to_list(None)
+                )
+            else:
+                rank, score_field = _combine_rankings(rankings, text_query)
+                if chunks:
+                    results = await self._chunk_fetch(
+                        collection_name, rank, filters, limit, score_field, projection
+                    )
+                else:
+                    results = await self._ranked_fetch(
+                        collection_name,
+                        rank,
+                        filters,
+                        partition_only,
+                        limit,
+                        score_field,
+                        projection,
+                    )
+            self.logger.info(
+                f"Hybrid search completed in {collection_name}, found {len(results)} results"
+            )
+            return results
+        except Exception as e:
+            self.logger.error(f"Failed to perform hybrid search: {str(e)}")
+            raise
+
+    async def get_summary_checkpoints(
+        self, job: str, day: date, statuses: Optional[Sequence[str]] = None
+    ) -> Dict[str, dict]:
+        """See MongoManager.get_summary_checkpoints"""
+        try:
+            query = {"job": job, "day": datetime.combine(day, datetime.min.time())}
+            if statuses:
+                query["status"] = {"$in": list(statuses)}
+            return {
+                checkpoint["user_id"]: checkpoint
+                for checkpoint in await self.summary_checkpoints.find(
+                    query, {"_id": 0}
+                ).to_list(None)
+            }
+        except Exception as e:
+            self.logger.error(f"Failed to get {job} summary checkpoints for {day}: {str(e)}")
+            raise
+
+    async def set_summary_checkpoints(
+        self, job: str, day: date, outcomes: Dict[str, dict]
+    ) -> None:
+        """See MongoManager.set_summary_checkpoints"""
+        if not outcomes:
+            return
+        day_start = datetime.combine(day, datetime.min.time())
+        now = datetime.now()
+        try:
+            await self.summary_checkpoints.bulk_write(
+                [
+                    UpdateOne(
+                        {"job": job, "day": day_start, "user_id": user_id},
+                        {"$set": {**outcome, "updated_at": now}, "$inc": {"attempts": 1}},
+                        upsert=True,
+                    )
+                    for user_id, outcome in outcomes.items()
+                ],
+                ordered=False,
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to set {job} summary checkpoints for {day}: {str(e)}")
+            raise
+
+    async def get_rolling_summary(
+        self, user_id: str, day: date
+    ) -> Optional[RollingSummary]:
+        """See MongoManager.get_rolling_summary"""
+        try:
+            result = await self.rolling_summaries.find_one(
+                {"user_id": user_id, "day": datetime.combine(day, datetime.min.time())},
+                {"_id": 0},
+            )
+            return RollingSummary(**result) if result else None
+        except Exception as e:
+            self.logger.error(
+                f"Failed to get rolling summary of user {user_id} on {day}: {str(e)}"
+            )
+            raise
+
+    async def replace_rolling_summary(
+        self, rolling: RollingSummary, expected_version: int
+    ) -> bool:
+        """See MongoManager.replace_rolling_summary"""
+        try:
+            if expected_version == 0:
+                try:
+                    await self.rolling_summaries.insert_one(rolling.model_dump())
+                except DuplicateKeyError:
+                    return False
+                return True
+            result = await self.rolling_summaries.replace_one(
+                {
+                    "user_id": rolling.user_id,
+                    "day": rolling.day,
+                    "version": expected_version,
+                },
+                rolling.model_dump(),
+            )
+            return result.matched_count == 1
+        except Exception as e:
+            self.logger.error(
+                f"Failed to store rolling summary of user {rolling.user_id}: {str(e)}"
+            )
+            raise
+
+    async def get_summarized_users(
+        self, start_date: date, end_date: date, level: str = "daily"
+    ) -> set:
+        """See MongoManager.get_summarized_users"""
+        try:
+            query = _summary_filter({"day": _day_range(start_date, end_date)}, level)
+            return set(await self.summaries.distinct("user_id", query))
+        except Exception as e:
+            self.logger.error(f"Failed to get summarized users: {str(e)}")
+            raise
+
+    async def get_users(self, projection: Projection = None) -> List[dict]:
+        try:
+            results = await self.users.find(
+                {}, _resolve_projection(projection)
+            ).to_list(None)
+            self.logger.info(f"Retrieved {len(results)} users")
+            return results
+        except Exception as e:
+            self.logger.error(f"Failed to get users: {str(e)}")
+            raise
+
+    async def check_user(self, user_id: str, password: str) -> bool:
+        try:
+            result = await self.users.find_one(
+                {"user_id": user_id, "password": password}, {"name": 1}
+            )
+            if result:
+                self.logger.info(f"User {user_id} authenticated")
+                return result["name"]
+            else:
+                self.logger.warning(f"Invalid credentials for user {user_id}")
+                return False
+        except Exception as e:
+            self.logger.error(f"Failed to authenticate user {user_id}: {str(e)}")
+            raise
+
+    async def get_conversations_by_user(
+        self, user_id: str, projection: Projection = None
+    ) -> List[dict]:
+        try:
+            results = await self.conversations.find(
+                {"user_id": user_id}, _resolve_projection(projection)
+            ).to_list(None)
+            self.logger.info(
+                f"Retrieved {len(results)} conversations for user: {user_id}"
+            )
+            return results
+        except Exception as e:
+            self.logger.error(
+                f"Failed to get conversations for user {user_id}: {str(e)}"
+            )
+            raise
+
+    async def get_conversation_by_session_id(
+        self, session_id: str, projection: Projection = None
+    ) -> Optional[dict]:
+        try:
+            result = await self.conversations.find_one(
+                {"session_id": session_id}, _resolve_projection(projection)
+            )
+            if result:
+                self.logger.info(f"Retrieved conversation: {session_id}")
+                return result
+            else:
+                self.logger.warning(f"Conversation not found: {session_id}")
+                return None
+        except Exception as e:
+            self.logger.error(f"Failed to get conversation {session_id}: {str(e)}")
+            raise
+
+    async def get_conversations_by_date_range(
+        self,
+        user_id: str,
+        start_date: date,
+        end_date: date,
+        projection: Projection = None,
+    ) -> List[dict]:
+        try:
+            created_at = _day_range(start_date, end_date)
+            results = await self.conversations.find(
+                {"user_id": user_id, "created_at": created_at},
+                _resolve_projection(projection),
+            ).to_list(None)
+            self.logger.info(
+                f"Retrieved {len(results)} conversations for user {user_id} between {created_at['$gte']} and {created_at['$lte']}"
+            )
+            return results
+        except Exception as e:
+            self.logger.error(f"Failed to get conversations for date range: {str(e)}")
+            raise
+
+    async def get_session_messages_by_date_range(
+        self,
+        user_id: str,
+        start_date: date,
+        end_date: date,
+        exclude_roles: Sequence[str] = ("system",),
+    ) -> List[dict]:
+        """See MongoManager.get_session_messages_by_date_range"""
+        try:
+            pipeline = _session_messages_pipeline(
+                user_id, start_date, end_date, exclude_roles
+            )
+            results = await self.conversations.aggregate(pipeline).to_list(None)
+            self.logger.info(
+                f"Retrieved messages of {len(results)} conversations for user {user_id}"
+            )
+            return results
+        except Exception as e:
+            self.logger.error(f"Failed to get session messages for date range: {str(e)}")
+            raise
+
+    async def get_summaries_by_date_range(
+        self,
+        user_id: str,
+        start_date: date,
+        end_date: date,
+        projection: Projection = None,
+        level: Optional[str] = None,
+    ) -> List[dict]:
+        """Summaries with day in a date range, of one level or (level=None) all"""
+        try:
+            day = _day_range(start_date, end_date)
+            results = await self.summaries.find(
+                _summary_filter({"user_id": user_id, "day": day}, level),
+                _resolve_projection(projection),
+            ).to_list(None)
+            self.logger.info(
+                f"Retrieved {len(results)} summaries for user {user_id} between {day['$gte']} and {day['$lte']}"
+            )
+            return results
+        except Exception as e:
+            self.logger.error(f"Failed to get summaries for date range: {str(e)}")
+            raise
+
+    async def get_last_summaries_by_user(
+        self, user_id: str, last_n: int = 5, projection: Projection = None
+    ) -> List[dict]:
+        try:
+            results = await (
+                self.summaries.find({"user_id": user_id}, _resolve_projection(projection))
+                .sort("created_at", -1)
+                .limit(last_n)
+                .to_list(None)
+            )
+            self.logger.info(
+                f"Retrieved last {len(results)} summaries for user {user_id}"
+            )
+            return results
+        except Exception as e:
+            self.logger.error(
+                f"Failed to get last summaries for user {user_id}: {str(e)}"
+            )
+            raise
+
+    async def get_document_by_id(
+        self, user_id: str, document_id: str, projection: Projection = None
+    ) -> Optional[dict]:
+        try:
+            result = await self.documents.find_one(
+                {"user_id": user_id, "document_id": document_id},
+                _resolve_projection(projection),
+            )
+            self.logger.info(f"Retrieved document {document_id} for user {user_id}")
+            return result
+        except Exception as e:
+            self.logger.error(f"Failed to get document {document_id}: {str(e)}")
+            raise
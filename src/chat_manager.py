@@ -1,25 +1,73 @@
 from datetime import datetime, date, timedelta
-from src.models import Message, ConversationEntry, SummaryEntry
+from src.models import (
+    Message,
+    SummaryEntry,
+    ChunkEntry,
+    ContextReport,
+    BulkWriteReport,
+    SummaryRunReport,
+    RollingSummary,
+)
 from src.openai import DailyAgent
+from src.tool_manager import ToolManager
 from src.CONSTANTS import (
     DEFAULT_SYSTEM_PROMPT,
+    DEFAULT_SUMMARIES_PROMPT,
+    DEFAULT_DOCUMENTS_PROMPT,
+    DEFAULT_SESSION_PROMPT,
     N_PREVIOUS_DAYS,
     FIRST_TIME_SYSTEM_PROMPT,
+    FIRST_TIME_SESSION_PROMPT,
     FIRST_TIME_STARTING_MESSAGE,
     DEFAULT_STARTING_MESSAGE,
     MAX_CONV_TOKENS,
     CHAT_HISTORY_MODE,
     SUMMARIZATION_PROMPT,
+    ROLLUP_PROMPT,
+    ROLLUP_SOURCE_NAMES,
+    ROLLING_SUMMARY_PROMPT,
+    ROLLING_SUMMARY_MODEL,
+    EMBEDDING_REFRESH_MESSAGES,
+    CONTEXT_SUMMARY_BUDGET,
+    CONTEXT_ROLLUP_WEEKS,
+    CONTEXT_ROLLUP_MONTHS,
+    MONGO_BULK_BATCH_SIZE,
+    SUMMARY_CHECKPOINT_BATCH,
 )
 import logging
-from typing import List, Optional, Dict, Any, Literal
+from typing import Callable, Iterator, List, Optional, Dict, Any, Literal, Tuple
 from src.mongo import MongoManager
 from src.embedding import EmbeddingGenerator
-import tiktoken
+from src.write_behind import WriteBehindQueue, get_write_behind_queue
+from src.tokens import TokenLedger
+from src.chunking import chunk_messages, mean_embedding
+from src.context_builder import ContextBuilder
+from src.summary_engine import SummaryEngine, pending_users, store_and_checkpoint
+from src.summary_batch import read_results, write_request
+from src.rollups import (
+    months_before,
+    period_start,
+    rollup_counts,
+    rollup_sources,
+    rollups_due,
+    select_summary_levels,
+    summary_key,
+    summary_label,
+)
+from src.prompts import DAILY, SESSION, STATIC, PromptSegment, assemble_prompt
 
 logger = logging.getLogger(__name__)
 
 
+def _format_exchanges(messages: List[Message]) -> str:
+    """Transcript of the non-system messages, one per line, for summary prompts"""
+    return "\n".join(
+        f"[{msg.timestamp}]{msg.role}: {msg.content}"
+        for msg in messages
+        if msg.role != "system"
+    )
+
+
 class ChatManager:
     """
     Manages chat interactions, message history, and conversation storage.
@@ -40,6 +88,7 @@ class ChatManager:
         user_name: str,
         session_id: str,
         user_id: str,
+        write_behind: Optional[WriteBehindQueue] = None,
     ) -> None:
         """
         Initialize ChatManager with required components.
@@ -50,6 +99,7 @@ class ChatManager:
             user_name: Name of the user
             session_id: Unique session identifier
             user_id: Unique user identifier
+            write_behind: Background persistence queue, shared by default
         """
         logger.info(
             f"Initializing ChatManager for user: {user_name}, session: {session_id}"
@@ -59,7 +109,38 @@ class ChatManager:
         self.user_name = user_name
         self.session_id = session_id
         self.user_id = user_id
+        self.write_behind = write_behind or get_write_behind_queue()
         self.messages: List[Message] = []
+        # Persistence bookkeeping: messages already stored, and stored since
+        # the conversation embedding was last refreshed (None: never embedded)
+        self._persisted_count = 0
+        self._messages_since_embedding: Optional[int] = None
+        # (text, embedding) of the chunk windows stored for this session
+        self._stored_chunks: List[tuple] = []
+        # Token budget of the history sent to the model, fed incrementally
+        self._ledger = TokenLedger(MAX_CONV_TOKENS)
+        self._ledger_count = 0
+        # Tools the model can call during the session, scoped to this user
+        self.tool_manager = ToolManager()
+        self.tool_manager.register_tool("get_document", self.get_document)
+        self.agent = DailyAgent(tool_manager=self.tool_manager)
+        # What the context assembly of initialize_chat kept and dropped
+        self.context_report: Optional[ContextReport] = None
+        self._summary_manager: Optional["SummaryManager"] = None
+
+    def get_document(self, document_id: str) -> Any:
+        """
+        Read the full text of one of the patient's documents.
+
+        Args:
+            document_id: Identifier of the document, shown in brackets before its passages
+        """
+        document = self.mongo_manager.get_document_by_id(
+            self.user_id,
+            document_id,
+            projection={"_id": 0, "document_id": 1, "created_at": 1, "summary": 1, "text": 1},
+        )
+        return document or f"Document {document_id} not found"
 
     def initialize_chat(self) -> None:
         """
@@ -71,71 +152,87 @@ class ChatManager:
             end_date = date.today()
             conversation_start_date = datetime.combine(end_date, datetime.min.time())
 
-            # Retrieve summaries and previous sessions
-            summaries: List[Dict[str, Any]] = (
-                self.mongo_manager.get_last_summaries_by_user(
-                    self.user_id, N_PREVIOUS_DAYS
-                )
+            # Retrieve summaries, coarser for older periods, and previous sessions
+            summaries = select_summary_levels(
+                self._load_summaries(end_date), CONTEXT_SUMMARY_BUDGET
             )
-            logger.debug(f"Found {len(summaries)} previous summaries")
+            logger.debug(f"Selected previous summaries: {rollup_counts(summaries)}")
 
-            conversations = self.mongo_manager.get_conversations_by_date_range(
+            # System messages and messages without timestamp are filtered server-side
+            conversations = self.mongo_manager.get_session_messages_by_date_range(
                 self.user_id, conversation_start_date, end_date
             )
-            conversations = [
-                {
-                    **conv,
-                    "messages": [
-                        msg
-                        for msg in conv.get("messages", [])
-                        if msg["role"] != "system" and msg.get("timestamp")
-                    ],
-                }
-                for conv in conversations
-            ]
             logger.debug(f"Found {len(conversations)} previous conversations")
 
-            # Turn summaries into a summaries string block
-            summaries_block = (
-                "\n".join(
-                    [
-                        f"Day {s['day'].strftime('%Y-%m-%d')}:\n{s['summary']}"
-                        for s in summaries
-                    ]
+            # Today's messages already folded into the rolling summary are not resent
+            rolling = self.mongo_manager.get_rolling_summary(self.user_id, end_date)
+            unfolded = False
+            for conv in conversations:
+                folded = rolling.message_counts.get(conv["session_id"], 0) if rolling else 0
+                unfolded = unfolded or len(conv["messages"]) > folded
+                conv["messages"] = conv["messages"][folded:]
+            # Sessions that ended without end_session (e.g. a closed tab) are
+            # folded in the background, for the next session of the day
+            if unfolded:
+                self.write_behind.submit(
+                    ("rolling", self.user_id), lambda: self._update_rolling_summary(end_date)
                 )
-                if summaries
+
+            # Keep the most recent and relevant items within the token budget
+            context = ContextBuilder(
+                self.mongo_manager, self.embedding_generator
+            ).build(self.user_id, summaries, conversations, rolling)
+            self.context_report = context.report
+
+            summaries_block = (
+                "\n".join(item.text for item in context.summaries)
+                if context.summaries
                 else "Nessuna interazione ritrovata nei giorni precedenti."
             )
-
-            # Turn previous sessions into a previous_sessions string block
             previous_sessions_block = (
-                "\n".join(
-                    [
-                        f"[{msg['timestamp']}] {msg['role']}: {msg['content']}"
-                        for conv in conversations
-                        for msg in conv["messages"]
-                    ]
-                )
-                if conversations
+                "\n".join(item.text for item in context.turns)
+                if context.turns
                 else "Nessuna sessione precedente trovata."
             )
+            documents_block = "\n\n".join(item.text for item in context.documents)
+
+            # Days of history covered by the summaries kept
+            n_days = (
+                (end_date - context.summaries[0].timestamp.date()).days
+                if context.summaries
+                else N_PREVIOUS_DAYS
+            )
 
-            # Format the correct system message
+            # Format the correct system message, volatile segments last
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
             if not summaries and not conversations:
                 logger.info("First-time user detected, using first-time prompt")
-                formatted_prompt = FIRST_TIME_SYSTEM_PROMPT.format(
+                formatted_prompt = assemble_prompt(
+                    [
+                        PromptSegment(FIRST_TIME_SYSTEM_PROMPT, STATIC),
+                        PromptSegment(FIRST_TIME_SESSION_PROMPT, SESSION),
+                    ],
                     patient=self.user_name.split(" ")[0],
-                    current_time=datetime.now(),
+                    current_time=current_time,
                 )
                 starting_message_content = FIRST_TIME_STARTING_MESSAGE
             else:
                 logger.info("Returning user detected, using default prompt")
-                formatted_prompt = DEFAULT_SYSTEM_PROMPT.format(
+                segments = [
+                    PromptSegment(DEFAULT_SYSTEM_PROMPT, STATIC),
+                    PromptSegment(DEFAULT_SUMMARIES_PROMPT, DAILY),
+                    PromptSegment(DEFAULT_SESSION_PROMPT, SESSION),
+                ]
+                if documents_block:
+                    segments.insert(2, PromptSegment(DEFAULT_DOCUMENTS_PROMPT, SESSION))
+                formatted_prompt = assemble_prompt(
+                    segments,
                     patient=self.user_name.split(" ")[0],
-                    n=N_PREVIOUS_DAYS,
+                    n=n_days,
                     summaries=summaries_block,
+                    documents=documents_block,
                     previous_sessions=previous_sessions_block,
-                    current_time=datetime.now(),
+                    current_time=current_time,
                 )
                 starting_message_content = DEFAULT_STARTING_MESSAGE
 
@@ -153,6 +250,29 @@ class ChatManager:
                 ),
             ]
 
+    def _load_summaries(self, today: date) -> List[Dict[str, Any]]:
+        """
+        Daily summaries of the last N_PREVIOUS_DAYS and the weekly and monthly
+        rollups of the last months. Windows start on period boundaries, so a
+        loaded rollup can be replaced by its sources when they fit.
+        """
+        first_month = months_before(today, CONTEXT_ROLLUP_MONTHS)
+        first_week = rollup_sources(
+            "monthly",
+            period_start("monthly", today - timedelta(weeks=CONTEXT_ROLLUP_WEEKS)),
+        )[1]
+        first_day = period_start("weekly", today - timedelta(days=N_PREVIOUS_DAYS))
+        summaries = []
+        for level, start in [
+            ("monthly", first_month),
+            ("weekly", first_week),
+            ("daily", first_day),
+        ]:
+            summaries += self.mongo_manager.get_summaries_by_date_range(
+                self.user_id, start, today, projection="summary-text", level=level
+            )
+        return summaries
+
     def handle_chat_input(self, prompt: str) -> Optional[Message]:
         """
         Process user input and generate assistant response.
@@ -172,66 +292,198 @@ class ChatManager:
         self.messages.append(user_message)
 
         try:
-            agent = DailyAgent()
             logger.info("Current chat history: {}".format(self.messages))
-            preprocessed_chat_history = self.preprocess_chat_history(
-                self.messages, mode=CHAT_HISTORY_MODE
-            )
+            preprocessed_chat_history = self._context_window()
             logger.info(
                 "Preprocessed chat history, {} messages".format(
                     len(preprocessed_chat_history)
                 )
             )
             logger.info("Current chat history: {}".format(self.messages))
-            assistant_message = agent.create(
+            assistant_message = self.agent.create(
                 chat_history=preprocessed_chat_history,
             )
             self.messages.append(assistant_message)
             logger.debug("Successfully generated assistant response")
 
-            self._store_conversation()
+            self.schedule_store()
             return assistant_message
 
         except Exception as e:
             logger.error(f"Error processing chat input: {str(e)}", exc_info=True)
             error_message = Message(role="system", content=f"Chat error: {str(e)}")
             self.messages.append(error_message)
-            self._store_conversation()
+            self.schedule_store()
             return None
 
+    def stream_chat_input(self, prompt: str) -> Iterator[str]:
+        """
+        Process user input like handle_chat_input, yielding the assistant's
+        response as it is generated (e.g. for st.write_stream). The message
+        is appended to the history and stored once the stream ends, also when
+        the consumer closes it early.
+
+        Args:
+            prompt: User input text
+
+        Yields:
+            str: Content deltas of the assistant's response
+        """
+        if not prompt:
+            logger.warning("Empty prompt received, ignoring")
+            return
+
+        logger.info(f"Streaming chat input for session: {self.session_id}")
+        user_message = Message(role="user", content=prompt, timestamp=datetime.now())
+        self.messages.append(user_message)
+
+        deltas = []
+        error_message = None
+        try:
+            for delta in self.agent.stream(chat_history=self._context_window()):
+                deltas.append(delta)
+                yield delta
+            logger.debug("Successfully streamed assistant response")
+        except Exception as e:
+            logger.error(f"Error streaming chat input: {str(e)}", exc_info=True)
+            error_message = Message(role="system", content=f"Chat error: {str(e)}")
+        finally:
+            # Also when the consumer stops early (GeneratorExit at the yield):
+            # keep what the user already saw
+            if deltas:
+                self.messages.append(
+                    Message(
+                        role="assistant", content="".join(deltas), timestamp=datetime.now()
+                    )
+                )
+            if error_message:
+                self.messages.append(error_message)
+            self.schedule_store()
+
+    def _context_window(self) -> List[Message]:
+        """
+        Truncated history for the model: the ledger only counts the messages
+        added since the previous turn
+        """
+        if CHAT_HISTORY_MODE != "truncate":
+            return self.preprocess_chat_history(self.messages, mode=CHAT_HISTORY_MODE)
+        if len(self.messages) < self._ledger_count:
+            # History was replaced, start over
+            self._ledger = TokenLedger(MAX_CONV_TOKENS)
+            self._ledger_count = 0
+        self._ledger.extend(self.messages[self._ledger_count :])
+        self._ledger_count = len(self.messages)
+        return self._ledger.window()
+
+    def schedule_store(self) -> None:
+        """Persist the conversation in the background write-behind queue"""
+        self.write_behind.submit(self.session_id, self._store_conversation)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every scheduled write of this session reached the database"""
+        return self.write_behind.flush(self.session_id, timeout)
+
+    def end_session(self) -> None:
+        """
+        Store the conversation and fold it into the rolling summary of the
+        day in the background, so that the next session of the day starts
+        from the summary instead of the raw transcript
+        """
+        self.write_behind.submit(self.session_id, self._store_and_summarize)
+
+    def _store_and_summarize(self) -> None:
+        self._store_conversation()
+        day = self.messages[0].timestamp.date() if self.messages else date.today()
+        self._update_rolling_summary(day)
+
+    def _update_rolling_summary(self, day: date) -> None:
+        if self._summary_manager is None:
+            self._summary_manager = SummaryManager(
+                self.mongo_manager, self.embedding_generator
+            )
+        self._summary_manager.update_rolling_summary(self.user_id, day)
+
     def _store_conversation(self) -> None:
         """
-        Store or update the current conversation in the database.
-        Generates embeddings and maintains conversation history.
+        Append the messages not yet stored to the conversation in the database.
+        The conversation chunks and embedding are only refreshed once
+        EMBEDDING_REFRESH_MESSAGES new messages have accumulated since the last time.
+
+        Runs on the write-behind queue, which never runs two jobs of the same
+        session at once; see schedule_store.
         """
-        logger.info(f"Storing conversation for session: {self.session_id}")
+        new_messages = self.messages[self._persisted_count :]
+        if not new_messages:
+            return
+        logger.info(
+            f"Storing {len(new_messages)} new messages for session: {self.session_id}"
+        )
 
-        conversation = ConversationEntry(
-            session_id=self.session_id,
-            user_id=self.user_id,
-            messages=self.messages,
-            text_content="\n".join(
-                [msg.role + ": " + msg.content for msg in self.messages]
-            ),
-            embedding=self.embedding_generator.create(
-                " ".join([msg.content for msg in self.messages])
-            ),
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
+        since_embedding = (self._messages_since_embedding or 0) + len(new_messages)
+        embedding = None
+        if (
+            self._messages_since_embedding is None
+            or since_embedding >= EMBEDDING_REFRESH_MESSAGES
+        ):
+            logger.debug("Refreshing conversation embedding")
+            embedding = self._store_chunks()
+
+        self.mongo_manager.append_conversation_messages(
+            self.session_id,
+            self.user_id,
+            new_messages,
+            embedding,
+            self.embedding_generator.model,
         )
+        self._persisted_count += len(new_messages)
+        self._messages_since_embedding = 0 if embedding else since_embedding
 
-        existing_conversation: Optional[Dict[str, Any]] = (
-            self.mongo_manager.get_conversation_by_session_id(self.session_id)
+    def _store_chunks(self) -> Optional[List[float]]:
+        """
+        Re-chunk the conversation, embed and store only the windows that
+        changed, and return the conversation embedding: the normalized mean
+        of the chunk embeddings, so no part of a long session is truncated away
+        """
+        chunks = chunk_messages(self.messages)
+        changed = [
+            i
+            for i, chunk in enumerate(chunks)
+            if i >= len(self._stored_chunks) or self._stored_chunks[i][0] != chunk.text
+        ]
+        new_embeddings = self.embedding_generator.create_batch(
+            [chunks[i].text for i in changed]
         )
-        if existing_conversation:
-            logger.debug("Updating existing conversation")
-            conversation.created_at = existing_conversation["created_at"]
-            self.mongo_manager.update_conversation(
-                self.session_id, conversation.model_dump()
-            )
-        else:
-            logger.debug("Creating new conversation")
-            self.mongo_manager.create_conversation(conversation)
+        embeddings = [
+            stored_embedding for _, stored_embedding in self._stored_chunks[: len(chunks)]
+        ]
+        embeddings += [None] * (len(chunks) - len(embeddings))
+        for i, embedding in zip(changed, new_embeddings):
+            embeddings[i] = embedding
+
+        self.mongo_manager.upsert_chunks(
+            "conversations",
+            self.session_id,
+            [
+                ChunkEntry(
+                    chunk_id=f"{self.session_id}:{i}",
+                    parent_id=self.session_id,
+                    user_id=self.user_id,
+                    chunk_index=i,
+                    start=chunks[i].start,
+                    end=chunks[i].end,
+                    text=chunks[i].text,
+                    embedding=embeddings[i],
+                    embedding_model=self.embedding_generator.model,
+                )
+                for i in changed
+            ],
+            total_chunks=len(chunks),
+        )
+        self._stored_chunks = [
+            (chunk.text, embedding) for chunk, embedding in zip(chunks, embeddings)
+        ]
+
+        return mean_embedding(embeddings)
 
     @staticmethod
     def preprocess_chat_history(
@@ -292,28 +544,15 @@ class ChatManager:
         ]
 
     @staticmethod
-    def _truncate_messages(messages: List[Message]) -> List[Message]:
-        encoding = tiktoken.encoding_for_model("gpt-4o")
-        max_tokens = 100000  # Conservative limit for GPT-4
-
+    def _truncate_messages(
+        messages: List[Message], max_tokens: int = MAX_CONV_TOKENS
+    ) -> List[Message]:
         # Always keep system message
-        system_message = next((msg for msg in messages if msg.role == "system"), None)
-        if not system_message:
+        if not any(msg.role == "system" for msg in messages):
             return messages
-
-        other_messages = [msg for msg in messages if msg.role != "system"]
-        current_tokens = len(encoding.encode(system_message.content))
-
-        # Add messages from the end until we hit token limit
-        included_messages = []
-        for msg in reversed(other_messages):
-            tokens = len(encoding.encode(msg.content))
-            if current_tokens + tokens > max_tokens:
-                break
-            included_messages.insert(0, msg)
-            current_tokens += tokens
-
-        return [system_message] + included_messages
+        ledger = TokenLedger(max_tokens)
+        ledger.extend(messages)
+        return ledger.window()
 
 
 class SummaryManager:
@@ -328,76 +567,351 @@ class SummaryManager:
         self.embedding_generator = embedding_generator
         self.agent = DailyAgent()
 
-    def create_daily_summaries(self, model: str = None) -> None:
+    def create_daily_summaries(
+        self, model: str = None, day: Optional[date] = None
+    ) -> SummaryRunReport:
         """
-        Creates summaries for all conversations from the previous day.
+        Creates summaries for all conversations of a day (default: yesterday),
+        skipping the users already summarized by a previous run.
         """
-        summary_prompt = SUMMARIZATION_PROMPT
-        yesterday = date.today() - timedelta(days=1)
-        start_date = datetime.combine(yesterday, datetime.min.time())
-        end_date = datetime.combine(yesterday, datetime.max.time())
-        model = model or "o1-mini"
+        day = day or date.today() - timedelta(days=1)
+        return SummaryEngine(self).run("daily", day, model or "o1-mini")
+
+    def create_rollup_summaries(
+        self, model: str = None, day: Optional[date] = None
+    ) -> List[SummaryRunReport]:
+        """
+        Rolls up the summaries of the periods ending on day (default:
+        yesterday): its week when day is a Sunday, and its month as well
+        when it is the last Sunday of the month. Run after the daily job.
+        """
+        day = day or date.today() - timedelta(days=1)
+        return [
+            SummaryEngine(self).run(level, start, model or "o1-mini")
+            for level, start in rollups_due(day)
+        ]
 
-        # Get all users
-        users = [user["user_id"] for user in self.mongo_manager.get_users()]
-        for user in users:
-            # Check if summary already exists for this user and date
-            existing_summary = self.mongo_manager.get_summaries_by_date_range(
-                user, yesterday, yesterday
+    def export_batch_requests(
+        self,
+        path: str,
+        model: str = None,
+        day: Optional[date] = None,
+        job: str = "daily",
+    ) -> int:
+        """
+        Append the summary prompt of every user not yet summarized or exported
+        for the period of the job (a summary level) containing day to an
+        OpenAI batch input file; returns the number of requests.
+        The results file of the batch is then loaded with import_batch_results.
+        """
+        day = period_start(job, day or date.today() - timedelta(days=1))
+        model = model or "o1-mini"
+        todo, total = pending_users(
+            self.mongo_manager, job, day, finished_statuses=("done", "empty", "exported")
+        )
+        logger.info(
+            f"Exporting {job} summary requests for {day}: {len(todo)} users, "
+            f"{total - len(todo)} already done or exported"
+        )
+        exported = 0
+        outcomes: Dict[str, dict] = {}
+        with open(path, "a", encoding="utf-8") as file:
+            for user_id in todo:
+                summary_prompt = self._summary_prompt(user_id, day, job)
+                if summary_prompt is None:
+                    outcomes[user_id] = {"status": "empty"}
+                else:
+                    prompt, session_ids, source_ids = summary_prompt
+                    custom_id = write_request(file, job, user_id, day, model, prompt)
+                    outcomes[user_id] = {
+                        "status": "exported",
+                        "custom_id": custom_id,
+                        "session_ids": session_ids,
+                        "source_ids": source_ids,
+                    }
+                    exported += 1
+                if len(outcomes) >= SUMMARY_CHECKPOINT_BATCH:
+                    file.flush()
+                    self.mongo_manager.set_summary_checkpoints(job, day, outcomes)
+                    outcomes = {}
+        self.mongo_manager.set_summary_checkpoints(job, day, outcomes)
+        logger.info(f"Exported {exported} {job} summary requests for {day} to {path}")
+        return exported
+
+    def import_batch_results(self, path: str) -> List[SummaryRunReport]:
+        """
+        Store the summaries of a batch results file written for the requests
+        of export_batch_requests, one report per job and day in the file.
+        Results of users already summarized are skipped, failed requests are
+        checkpointed as failed so that the next export includes them again.
+        """
+        grouped: Dict[Tuple[str, date], list] = {}
+        with open(path, encoding="utf-8") as file:
+            for result in read_results(file):
+                grouped.setdefault((result.job, result.day), []).append(result)
+
+        reports = []
+        for (job, day), results in grouped.items():
+            started = datetime.now()
+            checkpoints = self.mongo_manager.get_summary_checkpoints(job, day)
+            finished = {
+                user_id
+                for user_id, checkpoint in checkpoints.items()
+                if checkpoint.get("status") in ("done", "empty")
+            } | self.mongo_manager.get_summarized_users(day, day, level=job)
+            report = SummaryRunReport(job=job, day=day, users=len(results))
+
+            pending: List[SummaryEntry] = []
+            outcomes: Dict[str, dict] = {}
+            for result in results:
+                if result.user_id in finished:
+                    report.skipped += 1
+                    continue
+                report.prompt_tokens += result.prompt_tokens
+                if result.content is None:
+                    logger.error(
+                        f"Batch summary of user {result.user_id} on {day} failed: {result.error}"
+                    )
+                    report.failed += 1
+                    outcomes[result.user_id] = {"status": "failed", "error": result.error}
+                    continue
+                checkpoint = checkpoints.get(result.user_id, {})
+                pending.append(
+                    SummaryEntry(
+                        user_id=result.user_id,
+                        level=job,
+                        day=datetime.combine(day, datetime.min.time()),
+                        created_at=datetime.now(),
+                        summary=result.content,
+                        session_ids=checkpoint.get("session_ids", []),
+                        source_ids=checkpoint.get("source_ids", []),
+                    )
+                )
+                if len(pending) >= MONGO_BULK_BATCH_SIZE:
+                    store_and_checkpoint(self, job, day, pending, outcomes, report)
+                    pending, outcomes = [], {}
+            store_and_checkpoint(self, job, day, pending, outcomes, report)
+
+            report.elapsed_seconds = (datetime.now() - started).total_seconds()
+            processed = report.summarized + report.failed
+            report.users_per_second = (
+                processed / report.elapsed_seconds if report.elapsed_seconds else 0.0
             )
-            if existing_summary:
-                logger.info(f"Summary already exists for user {user} on {yesterday}")
-                continue
+            logger.info(f"Imported {job} batch summaries: {report}")
+            reports.append(report)
+        return reports
 
-            conversations = self.mongo_manager.get_conversations_by_date_range(
-                user, start_date, end_date
+    def summarize_user(
+        self,
+        user_id: str,
+        day: date,
+        model: str,
+        acquire: Optional[Callable[[str], None]] = None,
+        level: str = "daily",
+    ) -> Optional[SummaryEntry]:
+        """
+        Summarize the conversations of a user on a day, or roll up the
+        summaries of the weekly or monthly period starting on day; None if
+        there was nothing to summarize.
+
+        acquire, if given, is called with the prompt before the model call
+        (e.g. to wait for a rate limiter). Raises if the model call fails.
+        """
+        if level == "daily":
+            promoted = self._promote_rolling_summary(user_id, day, model, acquire)
+            if promoted is not None:
+                return promoted
+
+        summary_prompt = self._summary_prompt(user_id, day, level)
+        if summary_prompt is None:
+            return None
+        prompt, session_ids, source_ids = summary_prompt
+        if acquire:
+            acquire(prompt)
+
+        # Generate summary using the agent
+        logger.info(f"Generating {level} summary for user {user_id} on {day}")
+        summary_message = self.agent.create(
+            [Message(role="user", content=prompt)], model=model
+        )
+        return SummaryEntry(
+            user_id=user_id,
+            level=level,
+            day=datetime.combine(day, datetime.min.time()),
+            created_at=datetime.now(),
+            summary=summary_message.content,
+            session_ids=session_ids,
+            source_ids=source_ids,
+        )
+
+    def update_rolling_summary(
+        self,
+        user_id: str,
+        day: date,
+        model: str = ROLLING_SUMMARY_MODEL,
+        acquire: Optional[Callable[[str], None]] = None,
+    ) -> Optional[RollingSummary]:
+        """
+        Fold the stored messages of a user's day that are not yet in its
+        rolling summary into it, and return the summary; None if the user
+        has no conversations that day. Only the new messages are sent to
+        the model. If another process updated the summary meanwhile, its
+        version is kept and returned.
+        """
+        rolling = self.mongo_manager.get_rolling_summary(user_id, day)
+        conversations = self.mongo_manager.get_session_messages_by_date_range(
+            user_id,
+            datetime.combine(day, datetime.min.time()),
+            datetime.combine(day, datetime.max.time()),
+        )
+        message_counts = dict(rolling.message_counts) if rolling else {}
+        new_messages = []
+        for conv in conversations:
+            messages = conv.get("messages", [])
+            folded = message_counts.get(conv["session_id"], 0)
+            new_messages.extend(Message(**msg) for msg in messages[folded:])
+            message_counts[conv["session_id"]] = len(messages)
+        if not new_messages:
+            return rolling
+
+        prompt = ROLLING_SUMMARY_PROMPT.format(
+            previous_summary=rolling.summary if rolling else "Nessuno.",
+            conv_block=_format_exchanges(new_messages),
+        )
+        if acquire:
+            acquire(prompt)
+        logger.info(
+            f"Folding {len(new_messages)} messages into the rolling summary "
+            f"of user {user_id} on {day}"
+        )
+        summary_message = self.agent.create(
+            [Message(role="user", content=prompt)], model=model
+        )
+        updated = RollingSummary(
+            user_id=user_id,
+            day=datetime.combine(day, datetime.min.time()),
+            summary=summary_message.content,
+            message_counts=message_counts,
+            covered_until=max(msg.timestamp for msg in new_messages),
+            version=rolling.version + 1 if rolling else 1,
+            created_at=rolling.created_at if rolling else datetime.now(),
+        )
+        if not self.mongo_manager.replace_rolling_summary(
+            updated, expected_version=rolling.version if rolling else 0
+        ):
+            logger.warning(
+                f"Rolling summary of user {user_id} on {day} was updated concurrently, "
+                f"keeping the stored one"
             )
+            return self.mongo_manager.get_rolling_summary(user_id, day)
+        return updated
 
-            if conversations:
-                chat_history = []
-                for conv in conversations:
-                    chat_history.extend(
-                        [Message(**msg) for msg in conv.get("messages", [])]
-                    )
-                logger.info(
-                    f"Found {len(chat_history)} messages for user {user} on {yesterday}"
-                )
-                conv_block = "\n".join(
-                    [
-                        f"[{msg.timestamp}]{msg.role}: {msg.content}"
-                        for msg in chat_history
-                        if msg.role != "system"
-                    ]
-                )
-                # Generate summary using the agent
-                logger.info(f"Generating summary for user {user} on {yesterday}")
-                logger.info(f"Conversation block:\n{conv_block}")
-                summary_message = self.agent.create(
-                    [
-                        Message(
-                            role="user",
-                            content=summary_prompt.format(conv_block=conv_block),
-                        )
-                    ],
-                    model=model,
-                )
+    def _promote_rolling_summary(
+        self,
+        user_id: str,
+        day: date,
+        model: str,
+        acquire: Optional[Callable[[str], None]] = None,
+    ) -> Optional[SummaryEntry]:
+        """
+        The day's rolling summary, brought up to date, as its daily summary;
+        None if the day has no rolling summary
+        """
+        if self.mongo_manager.get_rolling_summary(user_id, day) is None:
+            return None
+        rolling = self.update_rolling_summary(user_id, day, model, acquire)
+        logger.info(f"Promoting the rolling summary of user {user_id} on {day}")
+        return SummaryEntry(
+            user_id=user_id,
+            day=rolling.day,
+            created_at=datetime.now(),
+            summary=rolling.summary,
+            session_ids=list(rolling.message_counts),
+        )
 
-                if summary_message:
-                    # Store the summary using existing method
-                    summary_id = self.mongo_manager.create_summary(
-                        SummaryEntry(
-                            user_id=user,
-                            day=datetime.combine(yesterday, datetime.min.time()),
-                            created_at=datetime.now(),
-                            summary=summary_message.content,
-                            session_ids=[conv["session_id"] for conv in conversations],
-                            embedding=self.embedding_generator.create(
-                                summary_message.content
-                            ),
-                        )
-                    )
-                    logger.info(
-                        f"Created summary for user {user} on {yesterday}: {summary_id}"
-                    )
-                else:
-                    logger.error(f"Failed to generate summary for user {user}")
+    def _summary_prompt(
+        self, user_id: str, day: date, level: str
+    ) -> Optional[Tuple[str, List[str], List[str]]]:
+        """Prompt, session ids and source summary ids of a summary; None if empty"""
+        if level != "daily":
+            return self._rollup_prompt(user_id, day, level)
+        daily_prompt = self._daily_prompt(user_id, day)
+        if daily_prompt is None:
+            return None
+        prompt, session_ids = daily_prompt
+        return prompt, session_ids, []
+
+    def _rollup_prompt(
+        self, user_id: str, start: date, level: str
+    ) -> Optional[Tuple[str, List[str], List[str]]]:
+        """Prompt rolling up the summaries of a weekly or monthly period"""
+        source_level, first_day, last_day = rollup_sources(level, start)
+        sources = self.mongo_manager.get_summaries_by_date_range(
+            user_id, first_day, last_day, projection="summary-text", level=source_level
+        )
+        if not sources:
+            return None
+        sources.sort(key=lambda s: s["day"])
+        logger.info(
+            f"Rolling up {len(sources)} {source_level} summaries for user {user_id} "
+            f"into the {level} summary of {start}"
+        )
+        summaries_block = "\n\n".join(
+            f"{summary_label(s)}:\n{s['summary']}" for s in sources
+        )
+        prompt = ROLLUP_PROMPT.format(
+            sources=ROLLUP_SOURCE_NAMES[source_level],
+            start=sources[0]["day"].strftime("%Y-%m-%d"),
+            end=(
+                last_day + timedelta(days=6) if source_level == "weekly" else last_day
+            ).strftime("%Y-%m-%d"),
+            summaries_block=summaries_block,
+        )
+        session_ids = [
+            session_id for s in sources for session_id in s.get("session_ids", [])
+        ]
+        return prompt, session_ids, [summary_key(s) for s in sources]
+
+    def _daily_prompt(
+        self, user_id: str, day: date
+    ) -> Optional[Tuple[str, List[str]]]:
+        """Summarization prompt of a user's day and its session ids; None without conversations"""
+        start_date = datetime.combine(day, datetime.min.time())
+        end_date = datetime.combine(day, datetime.max.time())
+        conversations = self.mongo_manager.get_session_messages_by_date_range(
+            user_id, start_date, end_date
+        )
+        if not conversations:
+            return None
+
+        chat_history = []
+        for conv in conversations:
+            chat_history.extend([Message(**msg) for msg in conv.get("messages", [])])
+        logger.info(f"Found {len(chat_history)} messages for user {user_id} on {day}")
+        conv_block = _format_exchanges(chat_history)
+        logger.debug(f"Conversation block:\n{conv_block}")
+        return (
+            SUMMARIZATION_PROMPT.format(conv_block=conv_block),
+            [conv["session_id"] for conv in conversations],
+        )
+
+    def _store_summaries(
+        self, summaries: List[SummaryEntry], day: date
+    ) -> BulkWriteReport:
+        """Embed and insert a batch of summaries in a few round-trips, logging failed items"""
+        embeddings = self.embedding_generator.create_batch(
+            [summary.summary for summary in summaries]
+        )
+        for summary, embedding in zip(summaries, embeddings):
+            summary.embedding = embedding
+            summary.embedding_model = self.embedding_generator.model
+        report = self.mongo_manager.create_many("summaries", summaries)
+        logger.info(
+            f"Created {report.inserted}/{report.requested} summaries for {day}"
+        )
+        for error in report.errors:
+            logger.error(
+                f"Failed to store summary for user "
+                f"{summaries[error.index].user_id} on {day}: {error.message}"
+            )
+        return report
@@ -0,0 +1,107 @@
+from typing import List, NamedTuple, Optional, Sequence
+import numpy as np
+from src.models import Message
+from src.tokens import get_encoding, MESSAGE_TOKEN_OVERHEAD
+from src.CONSTANTS import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, DEFAULT_MODEL
+
+# Chunk collection holding the windows of each chunked collection
+CHUNK_COLLECTIONS = {
+    "conversations": "conversation_chunks",
+    "documents": "document_chunks",
+}
+
+
+class Chunk(NamedTuple):
+    """
+    A window of a conversation or document. start/end (end exclusive) are
+    message indices for conversations and token offsets for documents.
+    """
+
+    start: int
+    end: int
+    text: str
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    model: str = DEFAULT_MODEL,
+) -> List[Chunk]:
+    """Sliding token windows of max_tokens, consecutive windows sharing overlap_tokens"""
+    if not text or not text.strip():
+        return []
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text)
+    step = max(max_tokens - overlap_tokens, 1)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        end = min(start + max_tokens, len(tokens))
+        chunks.append(Chunk(start, end, encoding.decode(tokens[start:end])))
+        if end == len(tokens):
+            break
+    return chunks
+
+
+def mean_embedding(embeddings: Sequence[Optional[List[float]]]) -> Optional[List[float]]:
+    """Normalized mean of the chunk embeddings, the embedding of their parent"""
+    vectors = [embedding for embedding in embeddings if embedding]
+    if not vectors:
+        return None
+    mean = np.mean(np.asarray(vectors, dtype=np.float32), axis=0)
+    return (mean / (np.linalg.norm(mean) or 1.0)).tolist()
+
+
+def _message_text(message: Message) -> str:
+    return f"{message.role}: {message.content}"
+
+
+def chunk_messages(
+    messages: Sequence[Message],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    model: str = DEFAULT_MODEL,
+) -> List[Chunk]:
+    """
+    Windows of whole messages of at most max_tokens, each repeating the last
+    messages of the previous window up to overlap_tokens. System messages are
+    skipped; a message longer than max_tokens gets a window of its own (the
+    embedding model truncates it).
+
+    Windows only depend on the messages before their end, so appending
+    messages leaves every window but the last ones unchanged.
+    """
+    indices = [i for i, message in enumerate(messages) if message.role != "system"]
+    costs = {
+        i: messages[i].token_count(model) + MESSAGE_TOKEN_OVERHEAD for i in indices
+    }
+    chunks = []
+    first = 0  # position in indices of the window's first message
+    previous_last = -1
+    while first < len(indices):
+        last, total = first, costs[indices[first]]
+        while last + 1 < len(indices) and total + costs[indices[last + 1]] <= max_tokens:
+            last += 1
+            total += costs[indices[last]]
+        if last <= previous_last:
+            # The overlap left no room for a new message, start without it
+            first = previous_last + 1
+            continue
+        previous_last = last
+        window = indices[first : last + 1]
+        chunks.append(
+            Chunk(
+                window[0],
+                window[-1] + 1,
+                "\n".join(_message_text(messages[i]) for i in window),
+            )
+        )
+        if last + 1 == len(indices):
+            break
+        # Step back over up to overlap_tokens of trailing messages, always advancing
+        next_first, overlap = last + 1, 0
+        while next_first - 1 > first and overlap + costs[indices[next_first - 1]] <= overlap_tokens:
+            next_first -= 1
+            overlap += costs[indices[next_first]]
+        first = next_first
+    return chunks
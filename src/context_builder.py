@@ -0,0 +1,233 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from datetime import datetime
+import logging
+import numpy as np
+from src.models import ContextReport, DroppedContextItem, RollingSummary
+from src.mongo import MongoManager
+from src.embedding import EmbeddingGenerator
+from src.metrics import get_metrics
+from src.tokens import count_tokens
+from src.rollups import summary_label
+from src.CONSTANTS import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_RECENCY_HALF_LIFE_HOURS,
+    CONTEXT_RELEVANCE_WEIGHT,
+    CONTEXT_MAX_DOCUMENTS,
+    CONTEXT_QUERY_MESSAGES,
+    DEFAULT_MODEL,
+)
+
+
+class ContextItem(NamedTuple):
+    """A candidate piece of the system prompt, already formatted"""
+
+    kind: str  # "summary", "turn" or "document"
+    key: str
+    text: str
+    timestamp: datetime
+    tokens: int
+
+
+class BuiltContext(NamedTuple):
+    """Selected items of each kind in chronological order, and the report"""
+
+    summaries: List[ContextItem]
+    turns: List[ContextItem]
+    documents: List[ContextItem]
+    report: ContextReport
+
+
+class ContextBuilder:
+    """
+    Assembles the context of a new session within a token budget.
+
+    Previous summaries are packed first, newest first, so that they do not
+    depend on the session. Today's turns and the document passages found by
+    hybrid_search then share the rest of the budget, scored by recency and
+    by embedding similarity to the latest turns.
+    """
+
+    def __init__(
+        self,
+        mongo_manager: MongoManager,
+        embedding_generator: Optional[EmbeddingGenerator] = None,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        half_life_hours: float = CONTEXT_RECENCY_HALF_LIFE_HOURS,
+        relevance_weight: float = CONTEXT_RELEVANCE_WEIGHT,
+        max_documents: int = CONTEXT_MAX_DOCUMENTS,
+        model: str = DEFAULT_MODEL,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.mongo_manager = mongo_manager
+        self.embedding_generator = embedding_generator
+        self.budget = budget
+        self.half_life_hours = half_life_hours
+        self.relevance_weight = relevance_weight
+        self.max_documents = max_documents
+        self.model = model
+        self.metrics = get_metrics()
+
+    def _item(self, kind: str, key: str, text: str, timestamp) -> ContextItem:
+        timestamp = timestamp if isinstance(timestamp, datetime) else datetime.now()
+        return ContextItem(kind, key, text, timestamp, count_tokens(text, self.model))
+
+    def build(
+        self,
+        user_id: str,
+        summaries: List[dict],
+        conversations: List[dict],
+        rolling: Optional[RollingSummary] = None,
+    ) -> BuiltContext:
+        """
+        Select among summaries (as returned with the "summary-text" projection),
+        the rolling summary of today and the messages of today's conversations
+        not folded into it
+        """
+        summary_items = [
+            self._item(
+                "summary",
+                str(s.get("summary_id") or s["_id"]),
+                f"{summary_label(s)}:\n{s['summary']}",
+                s["day"],
+            )
+            for s in summaries
+        ]
+        turns = [
+            self._item(
+                "turn",
+                f"{conv.get('session_id')}:{i}",
+                f"[{msg['timestamp']}] {msg['role']}: {msg['content']}",
+                msg.get("timestamp"),
+            )
+            for conv in conversations
+            for i, msg in enumerate(conv["messages"])
+        ]
+        if rolling:
+            turns.insert(
+                0,
+                self._item(
+                    "turn",
+                    "rolling",
+                    f"[{rolling.covered_until}] summary of the earlier sessions: "
+                    f"{rolling.summary}",
+                    rolling.covered_until,
+                ),
+            )
+
+        now = datetime.now()
+        report = ContextReport(budget=self.budget)
+        # Summaries fill the DAILY prompt segment: chosen by recency alone, they
+        # stay the same for every session of the day and keep the prompt cacheable
+        selected = self._select(
+            [(self._score(item, 0.0, now), item) for item in summary_items], report
+        )
+
+        # The latest turns, or the latest summary, stand for what the session is about
+        query = "\n".join(item.text for item in turns[-CONTEXT_QUERY_MESSAGES:])
+        if not query and summaries:
+            query = max(summaries, key=lambda s: s["day"])["summary"]
+        similarities: Dict[str, float] = {}
+        documents: List[ContextItem] = []
+        if query and self.embedding_generator:
+            try:
+                similarities, documents = self._search(
+                    user_id, query, turns, self.budget - report.used_tokens
+                )
+            except Exception as e:
+                self.logger.warning(
+                    f"Context relevance search failed, using recency only: {e}"
+                )
+        selected += self._select(
+            [
+                (self._score(item, similarities.get(item.key, 0.0), now), item)
+                for item in turns + documents
+            ],
+            report,
+        )
+
+        self.metrics.gauge("context.used_tokens", report.used_tokens)
+        self.metrics.increment("context.dropped_items", len(report.dropped))
+        selected.sort(key=lambda item: item.timestamp)
+        self.logger.info(
+            f"Context uses {report.used_tokens}/{self.budget} tokens: {report.included}, "
+            f"dropped {len(report.dropped)} items "
+            f"({sum(d.tokens for d in report.dropped)} tokens)"
+        )
+        return BuiltContext(
+            [item for item in selected if item.kind == "summary"],
+            [item for item in selected if item.kind == "turn"],
+            [item for item in selected if item.kind == "document"],
+            report,
+        )
+
+    def _search(self, user_id: str, query: str, turns: List[ContextItem], budget: int):
+        """
+        The best document passages for the query, and the similarity to the
+        query of the passages and of the turns competing for the budget left
+        """
+        embedding = self.embedding_generator.create(query)
+        if not embedding:
+            return {}, []
+        similarities = {}
+        documents = []
+        if self.max_documents:
+            for document in self.mongo_manager.hybrid_search(
+                "documents",
+                embedding_query=embedding,
+                filters={"user_id": user_id},
+                limit=self.max_documents,
+                projection={"document_id": 1, "created_at": 1},
+                chunks=True,
+            ):
+                # The id lets the model read the whole document with get_document
+                item = self._item(
+                    "document",
+                    document["best_chunk"]["chunk_id"],
+                    f"[{document['document_id']}] {document['best_chunk']['text']}",
+                    document.get("created_at"),
+                )
+                documents.append(item)
+                similarities[item.key] = document["similarity"]
+
+        # When every turn and passage fits, similarities cannot change the
+        # selection: the turns are only embedded when they compete for the budget
+        if sum(item.tokens for item in turns + documents) > budget:
+            candidates = [item for item in turns if item.tokens <= budget]
+            # Dot product, like the indexes: the embeddings are unit length
+            vectors = self.embedding_generator.create_batch(
+                [item.text for item in candidates]
+            )
+            query_vector = np.asarray(embedding, dtype=np.float32)
+            for item, vector in zip(candidates, vectors):
+                if vector:
+                    similarities[item.key] = float(
+                        np.dot(np.asarray(vector, dtype=np.float32), query_vector)
+                    )
+        return similarities, documents
+
+    def _score(self, item: ContextItem, similarity: float, now: datetime) -> float:
+        age_hours = max((now - item.timestamp).total_seconds() / 3600, 0.0)
+        recency = 0.5 ** (age_hours / self.half_life_hours)
+        return (1 - self.relevance_weight) * recency + self.relevance_weight * similarity
+
+    def _select(
+        self, scored: List[Tuple[float, ContextItem]], report: ContextReport
+    ) -> List[ContextItem]:
+        """Greedily keep the best scoring items that still fit in the budget"""
+        selected = []
+        for score, item in sorted(scored, key=lambda pair: pair[0], reverse=True):
+            if report.used_tokens + item.tokens <= self.budget:
+                selected.append(item)
+                report.used_tokens += item.tokens
+                report.included[item.kind] = report.included.get(item.kind, 0) + 1
+            else:
+                report.dropped.append(
+                    DroppedContextItem(
+                        kind=item.kind,
+                        key=item.key,
+                        timestamp=item.timestamp,
+                        tokens=item.tokens,
+                        score=score,
+                    )
+                )
+        return selected
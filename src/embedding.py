@@ -1,8 +1,18 @@
-from typing import List, Optional
-import os
-from openai import OpenAI
+from typing import Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
 import logging
-import tiktoken
+from src.metrics import get_metrics
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.embedding_backends import EmbeddingBackend, get_embedding_backend
+from src.CONSTANTS import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_MAX_ITEMS,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_BATCH_RETRIES,
+    EMBEDDING_BATCH_CONCURRENCY,
+)
 
 
 class EmbeddingGenerator:
@@ -11,25 +21,29 @@ class EmbeddingGenerator:
     """
 
     def __init__(
-        self, api_key: Optional[str] = None, model: str = "text-embedding-3-small"
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        cache: Optional[EmbeddingCache] = None,
+        use_cache: bool = True,
+        backend: Optional[EmbeddingBackend] = None,
     ):
         """
         Initialize the embedding generator
 
         :param api_key: OpenAI API key (optional)
-        :param model: Embedding model to use
+        :param model: Embedding model to use (optional, defaults to EMBEDDING_MODEL)
+        :param cache: Embedding cache (optional, defaults to the process-wide one)
+        :param use_cache: Whether to reuse and store embeddings in the cache
+        :param backend: Embedding backend (optional, defaults to EMBEDDING_BACKEND)
         """
         self.logger = logging.getLogger(__name__)
-
-        # Use API key from parameter or environment variable
-        openai_key = api_key or os.getenv("OPENAI_API_KEY")
-
-        if not openai_key:
-            self.logger.critical("No OpenAI API key available")
-            raise ValueError("Cannot initialize EmbeddingGenerator: Missing API key")
-
-        self.client = OpenAI(api_key=openai_key)
-        self.model = model
+        self.backend = backend or get_embedding_backend(
+            EMBEDDING_BACKEND, model=model, api_key=api_key
+        )
+        self.model = self.backend.model
+        self.metrics = get_metrics()
+        self.cache = (cache or get_embedding_cache()) if use_cache else None
 
     def create(self, text: str) -> Optional[List[float]]:
         """
@@ -42,25 +56,16 @@ class EmbeddingGenerator:
             self.logger.warning("Attempt to generate embedding for empty text")
             return None
 
-        # Initialize the tokenizer
-        tokenizer = tiktoken.get_encoding("cl100k_base")
-        max_tokens = 8191  # Replace with the actual max token length for your model
-
-        # Tokenize and truncate the input text
-        tokens = tokenizer.encode(text)
-        if len(tokens) > max_tokens:
-            self.logger.warning(
-                f"Input text exceeds max token length of {max_tokens}. Truncating."
-            )
-            tokens = tokens[:max_tokens]
+        if self.cache and (embedding := self.cache.get(self.model, text)):
+            return embedding
 
-        truncated_text = tokenizer.decode(tokens)
+        truncated_text, _ = self.backend.truncate(text)
 
         try:
-            response = self.client.embeddings.create(
-                input=truncated_text, model=self.model
-            )
-            embedding = response.data[0].embedding
+            self.metrics.increment("embedding.requests")
+            embedding = self.backend.embed([truncated_text])[0]
+            if self.cache:
+                self.cache.put(self.model, text, embedding)
 
             self.logger.info(
                 f"Embedding generated successfully. Size: {len(embedding)}"
@@ -69,3 +74,92 @@ class EmbeddingGenerator:
         except Exception as e:
             self.logger.error(f"Error generating embedding: {e}")
             return None
+
+    def create_batch(
+        self,
+        texts: Sequence[str],
+        max_items: int = EMBEDDING_BATCH_MAX_ITEMS,
+        max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+        max_retries: int = EMBEDDING_BATCH_RETRIES,
+        concurrency: int = EMBEDDING_BATCH_CONCURRENCY,
+    ) -> List[Optional[List[float]]]:
+        """
+        Generate embeddings for many texts with as few API calls as possible
+
+        :param texts: Texts to convert, in order
+        :param max_items: Maximum number of inputs per API call
+        :param max_tokens: Maximum total tokens per API call
+        :param max_retries: Retries of a failed API call before giving up on its inputs
+        :param concurrency: Number of API calls in flight at once
+        :return: One embedding per text, in input order; None for empty texts
+            and for the inputs of calls that kept failing
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        # Positions of each distinct non-empty text, so repeats are embedded once
+        positions: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            if text and text.strip():
+                positions.setdefault(text, []).append(i)
+        unique = list(positions)
+        cached = (
+            self.cache.get_many(self.model, unique) if self.cache else [None] * len(unique)
+        )
+        results: List[Optional[List[float]]] = list(cached)
+
+        batches: List[List[Tuple[int, str]]] = []
+        batch, batch_tokens = [], 0
+        for i, text in enumerate(unique):
+            if cached[i] is not None:
+                continue
+            text, n_tokens = self.backend.truncate(text)
+            if batch and (
+                len(batch) >= max_items or batch_tokens + n_tokens > max_tokens
+            ):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append((i, text))
+            batch_tokens += n_tokens
+        if batch:
+            batches.append(batch)
+
+        def embed(batch: List[Tuple[int, str]]) -> int:
+            for attempt in range(max_retries + 1):
+                try:
+                    self.metrics.increment("embedding.requests")
+                    vectors = self.backend.embed([text for _, text in batch])
+                    for (i, _), vector in zip(batch, vectors):
+                        results[i] = vector
+                    return len(batch)
+                except Exception as e:
+                    self.metrics.increment("embedding.failures")
+                    if attempt == max_retries:
+                        self.logger.error(
+                            f"Error generating {len(batch)} embeddings, giving up: {e}"
+                        )
+                        return 0
+                    delay = 2**attempt + random.random()
+                    self.logger.warning(
+                        f"Error generating {len(batch)} embeddings, retrying in {delay:.1f}s: {e}"
+                    )
+                    time.sleep(delay)
+
+        if concurrency > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                generated = sum(executor.map(embed, batches))
+        else:
+            generated = sum(embed(batch) for batch in batches)
+
+        if self.cache:
+            self.cache.put_many(
+                self.model,
+                [text for i, text in enumerate(unique) if cached[i] is None],
+                [result for i, result in enumerate(results) if cached[i] is None],
+            )
+        for text, result in zip(unique, results):
+            for i in positions[text]:
+                embeddings[i] = result
+
+        self.logger.info(
+            f"Generated {generated}/{len(unique)} distinct embeddings in {len(batches)} requests ({len(unique) - sum(1 for c in cached if c is None)} cached)"
+        )
+        return embeddings
@@ -0,0 +1,131 @@
+from typing import List, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+import logging
+import os
+import threading
+from src.openai_clients import get_openai_client
+from src.tokens import get_encoding
+from src.CONSTANTS import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    EMBEDDING_MAX_TOKENS,
+    LOCAL_EMBEDDING_DEVICE,
+    LOCAL_EMBEDDING_THREADS,
+    LOCAL_EMBEDDING_BATCH_SIZE,
+)
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface of the models behind EmbeddingGenerator.
+
+    embed() receives texts already cut by truncate() and returns one vector
+    per text, in order; it raises on failure, retries are up to the caller.
+    """
+
+    model: str
+    max_tokens: int
+
+    @abstractmethod
+    def truncate(self, text: str) -> Tuple[str, int]:
+        """Cut text to the model's input limit; returns the text and its token count"""
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """One vector per text, in order"""
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """OpenAI embeddings API"""
+
+    def __init__(self, api_key: Optional[str] = None, model: str = EMBEDDING_MODEL):
+        self.logger = logging.getLogger(__name__)
+        openai_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not openai_key:
+            self.logger.critical("No OpenAI API key available")
+            raise ValueError("Cannot initialize EmbeddingGenerator: Missing API key")
+        self.client = get_openai_client(openai_key)
+        self.model = model
+        self.max_tokens = EMBEDDING_MAX_TOKENS
+        self.tokenizer = get_encoding("cl100k_base")
+
+    def truncate(self, text: str) -> Tuple[str, int]:
+        tokens = self.tokenizer.encode(text)
+        if len(tokens) <= self.max_tokens:
+            return text, len(tokens)
+        self.logger.warning(
+            f"Input text exceeds max token length of {self.max_tokens}. Truncating."
+        )
+        return self.tokenizer.decode(tokens[: self.max_tokens]), self.max_tokens
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(input=list(texts), model=self.model)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Local CPU model through sentence-transformers (optional dependency).
+
+    Inference is batched by the library and serialized by a lock; torch's
+    intra-op thread pool, sized by `threads`, parallelizes each batch.
+    Vectors are L2-normalized like OpenAI's, so dot products stay cosines.
+    """
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        device: str = LOCAL_EMBEDDING_DEVICE,
+        threads: int = LOCAL_EMBEDDING_THREADS,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+    ):
+        self.logger = logging.getLogger(__name__)
+        try:
+            # Imported lazily: torch is slow to import and only needed here
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "The sentence-transformers embedding backend requires the "
+                "sentence-transformers package"
+            ) from e
+        if threads:
+            torch.set_num_threads(threads)
+        self._model = SentenceTransformer(model, device=device)
+        self._lock = threading.Lock()
+        self.model = model
+        self.max_tokens = self._model.max_seq_length
+        self.batch_size = batch_size
+        self.logger.info(
+            f"Loaded local embedding model {model} on {device} "
+            f"(dimension {self._model.get_sentence_embedding_dimension()})"
+        )
+
+    def truncate(self, text: str) -> Tuple[str, int]:
+        # The model truncates its own input, only the count is needed for packing
+        tokens = self._model.tokenizer.encode(text, add_special_tokens=False)
+        return text, min(len(tokens), self.max_tokens)
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        with self._lock:
+            vectors = self._model.encode(
+                list(texts),
+                batch_size=self.batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return vectors.tolist()
+
+
+def get_embedding_backend(
+    name: str = EMBEDDING_BACKEND,
+    model: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> EmbeddingBackend:
+    """Build the configured embedding backend ("openai" or "sentence-transformers")"""
+    if name == "openai":
+        return OpenAIEmbeddingBackend(api_key, model or EMBEDDING_MODEL)
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend(model or EMBEDDING_MODEL)
+    raise ValueError(f"Unknown embedding backend: {name}")
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+from src.metrics import get_metrics
+from src.CONSTANTS import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace, so trivially different inputs share a key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: a bounded in-memory LRU in front of a
+    SQLite table of float32 blobs.
+
+    Keys are sha256(model, normalized text), so the same text embedded by
+    another model is a miss. The memory tier holds at most max_entries
+    vectors; the SQLite tier is unbounded and shared by every process using
+    the same path. Hits, misses and evictions are counted in stats() and in
+    the process metrics under "embedding_cache.*".
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics()
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _count(self, name: str, value: int = 1) -> None:
+        self._counters[name] += value
+        self.metrics.increment(f"embedding_cache.{name}", value)
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._count("evictions")
+
+    def get_many(self, model: str, texts: Iterable[str]) -> List[Optional[List[float]]]:
+        """Cached embedding of each text, None for misses"""
+        keys = [cache_key(model, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            missing = list({key for key in keys if key not in found})
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start : start + 500]
+                    rows = self._db.execute(
+                        "SELECT key, vector FROM embeddings WHERE key IN "
+                        f"({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, found[key])
+            for key in keys:
+                if key not in found:
+                    self._count("misses")
+                elif key in missing:
+                    self._count("disk_hits")
+                else:
+                    self._count("memory_hits")
+        return [found[key].tolist() if key in found else None for key in keys]
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(
+        self, model: str, texts: Iterable[str], embeddings: Iterable[Optional[List[float]]]
+    ) -> None:
+        """Store embeddings; None entries (failed or empty inputs) are skipped"""
+        rows = []
+        now = time.time()
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                if embedding is None:
+                    continue
+                key = cache_key(model, text)
+                vector = np.asarray(embedding, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes(), now))
+            if rows and self._db is not None:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector, created_at) "
+                        "VALUES (?, ?, ?)",
+                        rows,
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    # The memory tier still serves this process
+                    self.logger.error(f"Failed to persist {len(rows)} embeddings: {e}")
+
+    def put(self, model: str, text: str, embedding: Optional[List[float]]) -> None:
+        self.put_many(model, [text], [embedding])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = sum(
+                self._counters[name] for name in ("memory_hits", "disk_hits", "misses")
+            )
+            hits = lookups - self._counters["misses"]
+            return {
+                **self._counters,
+                "memory_entries": len(self._memory),
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache shared by every EmbeddingGenerator"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
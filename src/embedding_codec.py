@@ -0,0 +1,72 @@
+from typing import Optional, Sequence, Union
+import struct
+import numpy as np
+from bson import Binary
+from src.CONSTANTS import EMBEDDING_STORAGE_DTYPE
+
+# BSON binary subtype of encoded embeddings (user-defined range)
+EMBEDDING_BINARY_SUBTYPE = 0x80
+
+# Matches documents holding an embedding, list-encoded (legacy) or binary
+STORED_EMBEDDING_QUERY = {"embedding": {"$exists": True, "$nin": [None, []]}}
+
+# Header: dtype code and padding to 4 bytes, then a float32 scale for int8,
+# so the payload stays aligned for np.frombuffer
+_HEADER = struct.Struct("<B3x")
+_SCALE = struct.Struct("<f")
+_CODES = {"float32": 1, "float16": 2, "int8": 3}
+_DTYPES = {code: dtype for dtype, code in _CODES.items()}
+
+StoredEmbedding = Union[Binary, bytes, Sequence[float]]
+
+
+def encode_embedding(
+    embedding: Optional[Sequence[float]], dtype: str = EMBEDDING_STORAGE_DTYPE
+) -> Optional[StoredEmbedding]:
+    """
+    Pack an embedding for storage as BSON binary in float32, float16 or
+    int8 (scalar-quantized with a per-vector scale); dtype "list" keeps the
+    legacy array of doubles
+    """
+    if embedding is None or len(embedding) == 0:
+        return None
+    if dtype == "list":
+        return [float(x) for x in embedding]
+    if dtype not in _CODES:
+        raise ValueError(f"Unknown embedding storage dtype: {dtype}")
+
+    vector = np.asarray(embedding, dtype=np.float32)
+    header = _HEADER.pack(_CODES[dtype])
+    if dtype == "int8":
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        payload = np.round(vector / scale).astype(np.int8)
+        header += _SCALE.pack(scale)
+    else:
+        payload = vector.astype(dtype)
+    return Binary(header + payload.tobytes(), EMBEDDING_BINARY_SUBTYPE)
+
+
+def decode_embedding(value: Optional[StoredEmbedding]) -> Optional[np.ndarray]:
+    """
+    float32 vector of a stored embedding, binary or legacy list. float32
+    payloads are returned as a read-only view of the BSON bytes.
+    """
+    if value is None or len(value) == 0:
+        return None
+    if not isinstance(value, bytes):
+        return np.asarray(value, dtype=np.float32)
+
+    dtype = _DTYPES[value[0]]
+    if dtype == "int8":
+        (scale,) = _SCALE.unpack_from(value, _HEADER.size)
+        payload = np.frombuffer(value, np.int8, offset=_HEADER.size + _SCALE.size)
+        return payload.astype(np.float32) * np.float32(scale)
+    vector = np.frombuffer(value, dtype, offset=_HEADER.size)
+    return vector if dtype == "float32" else vector.astype(np.float32)
+
+
+def stored_dtype(value: Optional[StoredEmbedding]) -> Optional[str]:
+    """Storage dtype of a stored embedding ("list" for legacy arrays)"""
+    if value is None or len(value) == 0:
+        return None
+    return _DTYPES[value[0]] if isinstance(value, bytes) else "list"
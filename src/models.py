@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from datetime import datetime, date
 import uuid
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
+from src.CONSTANTS import DEFAULT_MODEL
+from src.tokens import count_tokens
 
 
 class Message(BaseModel):
@@ -11,7 +13,17 @@ class Message(BaseModel):
     content: str
     name: Optional[str] = None
     function_call: Optional[dict] = None
+    tool_calls: Optional[List[dict]] = None  # Tool calls requested by an assistant message
+    tool_call_id: Optional[str] = None  # Tool call answered by a tool message
     timestamp: datetime = Field(default_factory=datetime.now)
+    # Memoized token counts of content, per tokenizer model
+    _token_counts: Dict[str, int] = PrivateAttr(default_factory=dict)
+
+    def token_count(self, model: str = DEFAULT_MODEL) -> int:
+        """Tokens of content, counted once per model"""
+        if model not in self._token_counts:
+            self._token_counts[model] = count_tokens(self.content, model)
+        return self._token_counts[model]
 
 
 class ConversationEntry(BaseModel):
@@ -26,25 +38,43 @@ class ConversationEntry(BaseModel):
     model_params: dict = {}
     text_content: Optional[str] = None
     embedding: Optional[List[float]] = None
+    embedding_model: Optional[str] = None
     keywords: List[str] = []
 
 
 class SummaryEntry(BaseModel):
-    """Schema for daily summaries"""
+    """Schema for daily summaries and their weekly and monthly rollups"""
 
     summary_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    day: datetime = Field(default_factory=datetime.today)
+    level: Literal["daily", "weekly", "monthly"] = "daily"
+    day: datetime = Field(default_factory=datetime.today)  # First day of the period
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
     summary: str
     session_ids: List[str] = []
+    source_ids: List[str] = []  # summary_id of the summaries rolled up
     document_ids: List[str] = []
     model_params: dict = {}
     embedding: Optional[List[float]] = None
+    embedding_model: Optional[str] = None
     keywords: List[str] = []
 
 
+class RollingSummary(BaseModel):
+    """Summary of a user's day so far, updated as sessions end"""
+
+    user_id: str
+    day: datetime  # Midnight of the day
+    summary: str
+    # Messages of each session already folded into the summary
+    message_counts: Dict[str, int] = {}
+    covered_until: Optional[datetime] = None  # Timestamp of the last folded message
+    version: int = 1  # Incremented by every update, for optimistic concurrency
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
 class DocumentEntry(BaseModel):
     """Schema for user uploaded documents"""
 
@@ -56,6 +86,23 @@ class DocumentEntry(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
     embedding: Optional[List[float]] = None
+    embedding_model: Optional[str] = None
+    keywords: List[str] = []
+
+
+class ChunkEntry(BaseModel):
+    """Schema for one embedded window of a conversation or document"""
+
+    chunk_id: str
+    parent_id: str  # session_id or document_id
+    user_id: str
+    chunk_index: int
+    start: int  # First message index (conversations) or token offset (documents)
+    end: int  # Exclusive
+    text: str
+    created_at: datetime = Field(default_factory=datetime.now)
+    embedding: Optional[List[float]] = None
+    embedding_model: Optional[str] = None
     keywords: List[str] = []
 
 
@@ -68,3 +115,57 @@ class User(BaseModel):
     password: str
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class BulkItemError(BaseModel):
+    """Schema for a single failed item of a bulk write"""
+
+    index: int
+    key: Optional[str] = None
+    code: Optional[int] = None
+    message: str
+
+
+class DroppedContextItem(BaseModel):
+    """Schema for a candidate context item left out of the prompt"""
+
+    kind: str
+    key: str
+    timestamp: datetime
+    tokens: int
+    score: float
+
+
+class ContextReport(BaseModel):
+    """Schema for the outcome of a context assembly"""
+
+    budget: int
+    used_tokens: int = 0
+    included: Dict[str, int] = {}
+    dropped: List[DroppedContextItem] = []
+
+
+class SummaryRunReport(BaseModel):
+    """Schema for the outcome of a summary job run"""
+
+    job: str
+    day: date
+    users: int = 0
+    skipped: int = 0
+    summarized: int = 0
+    empty: int = 0
+    failed: int = 0
+    prompt_tokens: int = 0
+    elapsed_seconds: float = 0.0
+    users_per_second: float = 0.0
+
+
+class BulkWriteReport(BaseModel):
+    """Schema for the outcome of a bulk write"""
+
+    requested: int = 0
+    inserted: int = 0
+    upserted: int = 0
+    matched: int = 0
+    modified: int = 0
+    errors: List[BulkItemError] = []
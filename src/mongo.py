@@ -1,51 +1,591 @@
-from typing import List, Optional
-import os
-from pymongo import MongoClient
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import logging
-from src.models import ConversationEntry, SummaryEntry, DocumentEntry, User
+from src.models import (
+    ConversationEntry,
+    SummaryEntry,
+    DocumentEntry,
+    User,
+    Message,
+    ChunkEntry,
+    BulkItemError,
+    BulkWriteReport,
+    RollingSummary,
+)
+from src.vector_index import VectorIndex, get_vector_index
+from src.segment_store import EmbeddingSegmentStore, get_segment_store
+from src.chunking import CHUNK_COLLECTIONS, chunk_text, mean_embedding
+from src.embedding_codec import (
+    STORED_EMBEDDING_QUERY,
+    decode_embedding,
+    encode_embedding,
+    stored_dtype,
+)
+from src.text_index import (
+    TEXT_FIELDS,
+    TextIndex,
+    extract_keywords,
+    get_text_index,
+    reciprocal_rank_fusion,
+)
+from src.mongo_indexes import (
+    INDEX_REGISTRY,
+    ensure_indexes,
+    find_duplicates,
+    verify_query_plans,
+)
+from src.mongo_pool import get_mongo_client, get_pool_stats
+from src.CONSTANTS import (
+    EMBEDDING_MODEL,
+    EMBEDDING_STORAGE_DTYPE,
+    LEGACY_EMBEDDING_MODEL,
+    KEYWORDS_PER_DOCUMENT,
+    VECTOR_INDEX_OVERSAMPLE,
+    MONGO_BULK_BATCH_SIZE,
+    MONGO_ENSURE_INDEXES,
+    MONGO_VERIFY_QUERY_PLANS,
+)
 from datetime import date, datetime
+import threading
 
+if TYPE_CHECKING:
+    from src.embedding import EmbeddingGenerator
 
-class MongoManager:
+# Business key of each collection, used by bulk upserts
+COLLECTION_KEYS = {
+    "conversations": "session_id",
+    "summaries": "summary_id",
+    "documents": "document_id",
+    "users": "user_id",
+    "conversation_chunks": "chunk_id",
+    "document_chunks": "chunk_id",
+}
+
+# Fields of a chunk returned as "best_chunk" by chunked hybrid searches
+CHUNK_LOCATION_PROJECTION = {
+    "_id": 1,
+    "chunk_id": 1,
+    "parent_id": 1,
+    "chunk_index": 1,
+    "start": 1,
+    "end": 1,
+    "text": 1,
+}
+
+# Named projection profiles accepted by every read method
+PROJECTIONS = {
+    "full": None,
+    "no-embedding": {"embedding": 0},
+    "ids-only": {
+        "_id": 1,
+        "user_id": 1,
+        "session_id": 1,
+        "summary_id": 1,
+        "document_id": 1,
+    },
+    "messages-only": {
+        "_id": 1,
+        "session_id": 1,
+        "user_id": 1,
+        "created_at": 1,
+        "updated_at": 1,
+        "messages": 1,
+    },
+    "summary-text": {
+        "_id": 1,
+        "summary_id": 1,
+        "user_id": 1,
+        "level": 1,
+        "day": 1,
+        "summary": 1,
+        "session_ids": 1,
+        "source_ids": 1,
+    },
+}
+
+Projection = Union[str, dict, None]
+
+
+def _resolve_projection(projection: Projection) -> Optional[dict]:
+    if isinstance(projection, str):
+        if projection not in PROJECTIONS:
+            raise ValueError(f"Unknown projection profile: {projection}")
+        return PROJECTIONS[projection]
+    return projection
+
+
+def _day_range(start_date: date, end_date: date) -> dict:
+    return {
+        "$gte": datetime.combine(start_date, datetime.min.time()),
+        "$lte": datetime.combine(end_date, datetime.max.time()),
+    }
+
+
+def _summary_filter(query: dict, level: Optional[str]) -> dict:
+    """Restrict a summaries query to a level; summaries without level are daily"""
+    if level == "daily":
+        query["level"] = {"$in": [None, "daily"]}
+    elif level:
+        query["level"] = level
+    return query
+
+
+def _append_messages_update(
+    user_id: str,
+    messages: List[Message],
+    embedding: Optional[List[float]],
+    embedding_model: str,
+) -> Tuple[dict, str]:
+    """
+    Pipeline-style $set appending messages to a conversation, and the
+    appended text. Keywords of the new text fill the stored ones up to
+    KEYWORDS_PER_DOCUMENT; they are recomputed over the whole text when the
+    embedding is refreshed.
+    """
+    now = datetime.now()
+    new_text = "\n".join(msg.role + ": " + msg.content for msg in messages)
+    new_keywords = extract_keywords(new_text)
+    stored_keywords = {"$ifNull": ["$keywords", []]}
+    # $literal keeps user text starting with "$" from being read as a field path
+    updates = {
+        "user_id": user_id,
+        "created_at": {"$ifNull": ["$created_at", now]},
+        "updated_at": now,
+        "messages": {
+            "$concatArrays": [
+                {"$ifNull": ["$messages", []]},
+                {"$literal": [msg.model_dump() for msg in messages]},
+            ]
+        },
+        "text_content": {
+            "$cond": [
+                {"$eq": [{"$ifNull": ["$text_content", ""]}, ""]},
+                {"$literal": new_text},
+                {"$concat": ["$text_content", "\n", {"$literal": new_text}]},
+            ]
+        },
+        "keywords": {
+            "$slice": [
+                {
+                    "$concatArrays": [
+                        stored_keywords,
+                        {
+                            "$filter": {
+                                "input": {"$literal": new_keywords},
+                                "as": "keyword",
+                                "cond": {
+                                    "$eq": [{"$in": ["$$keyword", stored_keywords]}, False]
+                                },
+                            }
+                        },
+                    ]
+                },
+                KEYWORDS_PER_DOCUMENT,
+            ]
+        },
+        "document_ids": {"$ifNull": ["$document_ids", []]},
+        "model_params": {"$ifNull": ["$model_params", {}]},
+    }
+    if embedding is not None:
+        updates["embedding"] = {"$literal": encode_embedding(embedding)}
+        updates["embedding_model"] = {"$literal": embedding_model}
+    return updates, new_text
+
+
+def _session_messages_pipeline(
+    user_id: str, start_date: date, end_date: date, exclude_roles: Sequence[str]
+) -> List[dict]:
+    return [
+        {
+            "$match": {
+                "user_id": user_id,
+                "created_at": _day_range(start_date, end_date),
+            }
+        },
+        {
+            "$project": {
+                "_id": 1,
+                "session_id": 1,
+                "created_at": 1,
+                "messages": {
+                    "$filter": {
+                        "input": {"$ifNull": ["$messages", []]},
+                        "as": "message",
+                        "cond": {
+                            "$and": [
+                                {
+                                    "$ne": [
+                                        {"$ifNull": ["$$message.timestamp", None]},
+                                        None,
+                                    ]
+                                },
+                                *[
+                                    {"$ne": ["$$message.role", role]}
+                                    for role in exclude_roles
+                                ],
+                            ]
+                        },
+                    }
+                },
+            }
+        },
+    ]
+
+
+def _embedding_model_filter(model: str) -> dict:
+    """Match the vectors of one embedding model; untagged vectors are the legacy model's"""
+    if model == LEGACY_EMBEDDING_MODEL:
+        return {"embedding_model": {"$in": [model, None]}}
+    return {"embedding_model": model}
+
+
+def _upsert_operation(document: dict, key_field: str) -> UpdateOne:
+    """Upsert by business key; created_at is only written on insert"""
+    updates = {k: v for k, v in document.items() if k not in ("_id", "created_at")}
+    update = {"$set": updates}
+    if "created_at" in document:
+        update["$setOnInsert"] = {"created_at": document["created_at"]}
+    return UpdateOne({key_field: document[key_field]}, update, upsert=True)
+
+
+def _search_partition(filters: dict) -> Tuple[Optional[str], bool]:
+    """
+    Index partition selected by hybrid search filters, and whether the
+    filters are fully answered by that partition
+    """
+    user_id = filters.get("user_id")
+    if not isinstance(user_id, str):
+        user_id = None
+    return user_id, set(filters) <= ({"user_id"} if user_id else set())
+
+
+def _combine_rankings(
+    rankings: List[Callable[[int], List[Tuple[str, float]]]], text_query: Optional[str]
+) -> Tuple[Callable[[int], List[Tuple[str, float]]], str]:
+    """Single ranking as is, or both fused by RRF; returns it with its score field"""
+    if len(rankings) == 1:
+        return rankings[0], "bm25" if text_query else "similarity"
+
+    def fused(k: int) -> List[Tuple[str, float]]:
+        return reciprocal_rank_fusion(rank(k) for rank in rankings)[:k]
+
+    return fused, "score"
+
+
+def _best_chunks(chunks: Iterable[dict], scores: Dict[str, float]) -> Dict[str, dict]:
+    """Highest scoring chunk of each parent document"""
+    best = {}
+    for chunk in chunks:
+        chunk["score"] = scores[str(chunk.pop("_id"))]
+        parent_id = chunk["parent_id"]
+        if parent_id not in best or chunk["score"] > best[parent_id]["score"]:
+            best[parent_id] = chunk
+    return best
+
+
+def _with_fields(
+    projection: Optional[dict], fields: Sequence[str]
+) -> Tuple[Optional[dict], List[str]]:
+    """
+    Projection that also returns fields needed internally (e.g. _id or the
+    business key), and those of them the caller's projection excluded, to
+    be removed from the results with _strip_fields
+    """
+    if not projection:
+        return projection, []
+    projection = dict(projection)
+    inclusion = any(value for field, value in projection.items() if field != "_id")
+    hidden = []
+    for field in fields:
+        if field == "_id" or not inclusion:
+            # _id and, in exclusion projections, any field not excluded are returned
+            if field in projection and not projection[field]:
+                del projection[field]
+                hidden.append(field)
+        elif not projection.get(field):
+            projection[field] = 1
+            hidden.append(field)
+    return projection or None, hidden
+
+
+def _strip_fields(documents: List[dict], fields: Sequence[str]) -> List[dict]:
+    for document in documents:
+        for field in fields:
+            document.pop(field, None)
+    return documents
+
+
+# Databases whose index registry was already applied by this process
+_indexed_databases = set()
+_indexed_databases_lock = threading.Lock()
+
+
+class _SearchIndexSync:
+    """
+    Keeps the in-process search indexes in step with documents written to
+    Mongo; shared by MongoManager and AsyncMongoManager
+    """
+
+    vector_index: VectorIndex
+    segment_store: EmbeddingSegmentStore
+    text_index: TextIndex
+    embedding_model: str
+    embedding_generator: Optional["EmbeddingGenerator"]
+
+    def _prepare_document(self, collection_name: str, entry) -> dict:
+        document = entry.dict() if isinstance(entry, BaseModel) else dict(entry)
+        if collection_name in TEXT_FIELDS and not document.get("keywords"):
+            document["keywords"] = extract_keywords(
+                document.get(TEXT_FIELDS[collection_name])
+            )
+        if document.get("embedding"):
+            document["embedding"] = encode_embedding(document["embedding"])
+            if not document.get("embedding_model"):
+                document["embedding_model"] = self.embedding_model
+        return document
+
+    @staticmethod
+    def _bulk_errors(
+        error: BulkWriteError, offset: int, documents: List[dict], key_field: str
+    ) -> List[BulkItemError]:
+        return [
+            BulkItemError(
+                index=offset + item["index"],
+                key=documents[item["index"]].get(key_field),
+                code=item.get("code"),
+                message=item.get("errmsg", ""),
+            )
+            for item in error.details.get("writeErrors", [])
+        ]
+
+    def _index_document(self, collection_name: str, doc_id, document: dict) -> None:
+        """Push the written text and embedding of a document into the search indexes"""
+        self._index_documents(collection_name, [(doc_id, document)])
+
+    def _index_documents(
+        self, collection_name: str, documents: List[Tuple[object, dict]]
+    ) -> None:
+        if collection_name not in TEXT_FIELDS:
+            return
+        text_field = TEXT_FIELDS[collection_name]
+        segment_rows, removed = [], []
+        for doc_id, document in documents:
+            doc_id = str(doc_id)
+            user_id = document.get("user_id")
+            if text_field in document:
+                self.text_index.upsert(
+                    collection_name, user_id, doc_id, document[text_field]
+                )
+            if "embedding" not in document:
+                continue
+            model = document.get("embedding_model") or self.embedding_model
+            vector = decode_embedding(document["embedding"])
+            if vector is not None and model == self.embedding_model:
+                self.vector_index.upsert(collection_name, user_id, doc_id, vector)
+                segment_rows.append((doc_id, user_id, vector))
+            else:
+                # No vector, or one of another model (and dimension) than the searched one
+                self.vector_index.remove(collection_name, doc_id)
+                removed.append(doc_id)
+        if not self._segments_usable(collection_name):
+            # Segments of another model: the rows of rewritten documents are stale
+            removed += [doc_id for doc_id, _, _ in segment_rows]
+            segment_rows = []
+        self.segment_store.append(collection_name, segment_rows)
+        if removed:
+            self.segment_store.delete(collection_name, removed)
+
+    def _segments_usable(self, collection_name: str) -> bool:
+        """Whether the collection's segments were synced with the searched model"""
+        if not self.segment_store.has_collection(collection_name):
+            return False
+        model = self.segment_store.model(collection_name) or LEGACY_EMBEDDING_MODEL
+        return model == self.embedding_model
+
+    def _unindex_documents(self, collection_name: str, doc_ids: List[str]) -> None:
+        """Drop deleted documents from the search indexes"""
+        for doc_id in doc_ids:
+            self.text_index.remove(collection_name, doc_id)
+            self.vector_index.remove(collection_name, doc_id)
+        self.segment_store.delete(collection_name, doc_ids)
+
+    def _chunk_document(
+        self,
+        document_id: str,
+        user_id: str,
+        text: Optional[str],
+        generator: Optional["EmbeddingGenerator"] = None,
+    ) -> Tuple[List[ChunkEntry], Optional[List[float]]]:
+        """
+        Token windows of a document's text as chunk entries, embedded by
+        generator (by default the manager's, if any), and the mean of their
+        embeddings for the document itself
+        """
+        generator = generator or self.embedding_generator
+        chunks = chunk_text(text or "")
+        embeddings = [None] * len(chunks)
+        if generator is not None and chunks:
+            embeddings = generator.create_batch([chunk.text for chunk in chunks])
+        entries = [
+            ChunkEntry(
+                chunk_id=f"{document_id}:{i}",
+                parent_id=document_id,
+                user_id=user_id,
+                chunk_index=i,
+                start=chunk.start,
+                end=chunk.end,
+                text=chunk.text,
+                embedding=embedding,
+                embedding_model=generator.model if embedding else None,
+            )
+            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+        ]
+        return entries, mean_embedding(embeddings)
+
+    def _prepare_updates(self, collection_name: str, updates: dict) -> dict:
+        """Fill keywords and the embedding model of a $set that changes them"""
+        text_field = TEXT_FIELDS[collection_name]
+        if text_field in updates and not updates.get("keywords"):
+            updates = {**updates, "keywords": extract_keywords(updates[text_field])}
+        if updates.get("embedding"):
+            updates = {**updates, "embedding": encode_embedding(updates["embedding"])}
+            if not updates.get("embedding_model"):
+                updates["embedding_model"] = self.embedding_model
+        return updates
+
+
+class MongoManager(_SearchIndexSync):
     """Manager for MongoDB operations with hybrid search capabilities"""
 
-    def __init__(self, db_name: str = "medassistant"):
+    def __init__(
+        self,
+        db_name: str = "medassistant",
+        vector_index: Optional[VectorIndex] = None,
+        segment_store: Optional[EmbeddingSegmentStore] = None,
+        text_index: Optional[TextIndex] = None,
+        embedding_model: str = EMBEDDING_MODEL,
+        ensure_indexes: bool = MONGO_ENSURE_INDEXES,
+        embedding_generator: Optional["EmbeddingGenerator"] = None,
+    ):
         self.logger = logging.getLogger()
+        self.vector_index = vector_index or get_vector_index()
+        self.segment_store = segment_store or get_segment_store()
+        self.text_index = text_index or get_text_index()
+        # Model of the vectors searched and of untagged vectors written
+        self.embedding_model = embedding_model
+        # Embeds the chunks of documents; without it they are only indexed by text
+        self.embedding_generator = embedding_generator
         try:
-            self.client = MongoClient(os.getenv("MONGO_CONNECTION_STRING"))
+            self.client = get_mongo_client()
             self.db = self.client[db_name]
             self.conversations = self.db.conversations
             self.summaries = self.db.summaries
             self.documents = self.db.documents
             self.users = self.db.users
+            self.conversation_chunks = self.db.conversation_chunks
+            self.document_chunks = self.db.document_chunks
+            self.summary_checkpoints = self.db.summary_checkpoints
+            self.rolling_summaries = self.db.rolling_summaries
             self.logger.info(f"Successfully connected to MongoDB database: {db_name}")
         except Exception as e:
             self.logger.error(f"Failed to connect to MongoDB: {str(e)}")
             raise
 
+        if ensure_indexes:
+            with _indexed_databases_lock:
+                if db_name not in _indexed_databases:
+                    self.ensure_indexes(verify=MONGO_VERIFY_QUERY_PLANS)
+                    _indexed_databases.add(db_name)
+
+    def pool_stats(self) -> dict:
+        """Counters of the process-wide connection pool this manager borrows from"""
+        return get_pool_stats()
+
+    def ensure_indexes(self, verify: bool = False) -> None:
+        """
+        Apply the index registry and optionally check that no hot query
+        shape is planned as a collection scan (raises QueryPlanError)
+        """
+        try:
+            created = ensure_indexes(self.db)
+            self.logger.info(f"Ensured MongoDB indexes: {created}")
+            if verify:
+                verify_query_plans(self.db)
+                self.logger.info("All registered query shapes use an index")
+        except Exception as e:
+            self.logger.error(f"Failed to provision MongoDB indexes: {str(e)}")
+            raise
+
+    def remove_duplicates(
+        self, collection_names: Optional[Sequence[str]] = None, dry_run: bool = False
+    ) -> Dict[str, int]:
+        """
+        Delete the documents that keep the registry's unique indexes from
+        being created, keeping the most recently updated document of each
+        key; returns the number of duplicates per collection
+        """
+        counts = {}
+        for collection_name in collection_names or list(INDEX_REGISTRY):
+            try:
+                duplicates = find_duplicates(self.db, collection_name)
+                counts[collection_name] = len(duplicates)
+                if dry_run or not duplicates:
+                    continue
+                self.db[collection_name].delete_many({"_id": {"$in": duplicates}})
+                if collection_name in TEXT_FIELDS:
+                    self._unindex_documents(
+                        collection_name, [str(doc_id) for doc_id in duplicates]
+                    )
+                self.logger.info(
+                    f"Removed {len(duplicates)} duplicate documents from {collection_name}"
+                )
+            except Exception as e:
+                self.logger.error(
+                    f"Failed to remove duplicates from {collection_name}: {str(e)}"
+                )
+                raise
+        return counts
+
     def create_conversation(self, conversation: ConversationEntry) -> str:
         try:
-            result = self.conversations.insert_one(conversation.dict())
-            self.logger.info(f"Created new conversation with ID: {result.inserted_id}")
-            return str(result.inserted_id)
+            inserted_id = self._insert_indexed("conversations", conversation)
+            self.logger.info(f"Created new conversation with ID: {inserted_id}")
+            return str(inserted_id)
         except Exception as e:
             self.logger.error(f"Failed to create conversation: {str(e)}")
             raise
 
     def create_summary(self, summary: SummaryEntry) -> str:
         try:
-            result = self.summaries.insert_one(summary.dict())
-            self.logger.info(f"Created new summary with ID: {result.inserted_id}")
-            return str(result.inserted_id)
+            inserted_id = self._insert_indexed("summaries", summary)
+            self.logger.info(f"Created new summary with ID: {inserted_id}")
+            return str(inserted_id)
         except Exception as e:
             self.logger.error(f"Failed to create summary: {str(e)}")
             raise
 
     def create_document(self, document: DocumentEntry) -> str:
+        """Store a document and its chunk windows"""
         try:
-            result = self.documents.insert_one(document.dict())
-            self.logger.info(f"Created new document with ID: {result.inserted_id}")
-            return str(result.inserted_id)
+            chunks, embedding = self._chunk_document(
+                document.document_id, document.user_id, document.text
+            )
+            if document.embedding is None and embedding:
+                document = document.copy(
+                    update={
+                        "embedding": embedding,
+                        "embedding_model": self.embedding_generator.model,
+                    }
+                )
+            inserted_id = self._insert_indexed("documents", document)
+            self.upsert_chunks(
+                "documents", document.document_id, chunks, total_chunks=len(chunks)
+            )
+            self.logger.info(f"Created new document with ID: {inserted_id}")
+            return str(inserted_id)
         except Exception as e:
             self.logger.error(f"Failed to create document: {str(e)}")
             raise
@@ -61,23 +601,89 @@ class MongoManager:
 
     def update_conversation(self, session_id: str, updates: dict):
         try:
-            self.conversations.update_one({"session_id": session_id}, {"$set": updates})
+            self._update_one("conversations", {"session_id": session_id}, updates)
             self.logger.info(f"Updated conversation: {session_id}")
         except Exception as e:
             self.logger.error(f"Failed to update conversation {session_id}: {str(e)}")
             raise
 
+    def append_conversation_messages(
+        self,
+        session_id: str,
+        user_id: str,
+        messages: List[Message],
+        embedding: Optional[List[float]] = None,
+        embedding_model: Optional[str] = None,
+    ) -> None:
+        """
+        Append messages to a conversation in a single upsert, without resending
+        what is already stored. messages, text_content and keywords are grown
+        server-side; the embedding is only replaced when one is given, and
+        the keywords are then recomputed over the whole text.
+        """
+        try:
+            updates, new_text = _append_messages_update(
+                user_id, messages, embedding, embedding_model or self.embedding_model
+            )
+            projection = {"_id": 1}
+            if embedding is not None:
+                projection["text_content"] = 1
+            document = self.conversations.find_one_and_update(
+                {"session_id": session_id},
+                [{"$set": updates}],
+                projection=projection,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            doc_id = str(document["_id"])
+            if embedding is not None:
+                self.conversations.update_one(
+                    {"_id": document["_id"]},
+                    {"$set": {"keywords": extract_keywords(document.get("text_content"))}},
+                )
+            self.text_index.append("conversations", user_id, doc_id, new_text)
+            if embedding is not None:
+                self._index_document(
+                    "conversations", doc_id, {"user_id": user_id, "embedding": embedding}
+                )
+            self.logger.info(
+                f"Appended {len(messages)} messages to conversation: {session_id}"
+            )
+        except Exception as e:
+            self.logger.error(
+                f"Failed to append messages to conversation {session_id}: {str(e)}"
+            )
+            raise
+
     def update_summary(self, summary_id: str, updates: dict):
         try:
-            self.summaries.update_one({"summary_id": summary_id}, {"$set": updates})
+            self._update_one("summaries", {"summary_id": summary_id}, updates)
             self.logger.info(f"Updated summary: {summary_id}")
         except Exception as e:
             self.logger.error(f"Failed to update summary {summary_id}: {str(e)}")
             raise
 
     def update_document(self, document_id: str, updates: dict):
+        """Update a document; a new text replaces its chunk windows"""
         try:
-            self.documents.update_one({"document_id": document_id}, {"$set": updates})
+            chunks = None
+            if "text" in updates:
+                stored = self.documents.find_one({"document_id": document_id}, {"user_id": 1})
+                if stored:
+                    chunks, embedding = self._chunk_document(
+                        document_id, stored["user_id"], updates["text"]
+                    )
+                    if embedding and "embedding" not in updates:
+                        updates = {
+                            **updates,
+                            "embedding": embedding,
+                            "embedding_model": self.embedding_generator.model,
+                        }
+            self._update_one("documents", {"document_id": document_id}, updates)
+            if chunks is not None:
+                self.upsert_chunks(
+                    "documents", document_id, chunks, total_chunks=len(chunks)
+                )
             self.logger.info(f"Updated document: {document_id}")
         except Exception as e:
             self.logger.error(f"Failed to update document {document_id}: {str(e)}")
@@ -91,6 +697,441 @@ class MongoManager:
             self.logger.error(f"Failed to update user {user_id}: {str(e)}")
             raise
 
+    def create_many(
+        self,
+        collection_name: str,
+        entries: Sequence,
+        ordered: bool = False,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> BulkWriteReport:
+        """
+        Insert many entries with insert_many, batch_size documents per round-trip.
+
+        Unordered batches insert every valid document and report the others;
+        ordered batches stop at the first failure, skipping later batches too.
+        Failed items are listed in the report instead of raising.
+        """
+        key_field = COLLECTION_KEYS[collection_name]
+        collection = getattr(self, collection_name)
+        report = BulkWriteReport(requested=len(entries))
+        try:
+            for offset in range(0, len(entries), batch_size):
+                documents = [
+                    self._prepare_document(collection_name, entry)
+                    for entry in entries[offset : offset + batch_size]
+                ]
+                errors = []
+                try:
+                    collection.insert_many(documents, ordered=ordered)
+                except BulkWriteError as e:
+                    errors = self._bulk_errors(e, offset, documents, key_field)
+                    report.errors.extend(errors)
+
+                failed = {error.index - offset for error in errors}
+                stop = min(failed) if ordered and failed else len(documents)
+                written = [
+                    (document["_id"], document)
+                    for i, document in enumerate(documents[:stop])
+                    if i not in failed
+                ]
+                report.inserted += len(written)
+                self._index_documents(collection_name, written)
+                if ordered and failed:
+                    break
+
+            self.logger.info(
+                f"Inserted {report.inserted}/{report.requested} documents into {collection_name} ({len(report.errors)} errors)"
+            )
+            return report
+        except Exception as e:
+            self.logger.error(f"Failed bulk insert into {collection_name}: {str(e)}")
+            raise
+
+    def bulk_upsert(
+        self,
+        collection_name: str,
+        entries: Sequence,
+        ordered: bool = False,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> BulkWriteReport:
+        """
+        Insert or update many entries by their key field (session_id, summary_id,
+        document_id or user_id) with bulk_write; created_at is only set on insert.
+        """
+        key_field = COLLECTION_KEYS[collection_name]
+        collection = getattr(self, collection_name)
+        report = BulkWriteReport(requested=len(entries))
+        try:
+            for offset in range(0, len(entries), batch_size):
+                documents = [
+                    self._prepare_document(collection_name, entry)
+                    for entry in entries[offset : offset + batch_size]
+                ]
+                operations = [
+                    _upsert_operation(document, key_field) for document in documents
+                ]
+
+                errors = []
+                try:
+                    result = collection.bulk_write(operations, ordered=ordered)
+                    details = result.bulk_api_result
+                except BulkWriteError as e:
+                    details = e.details
+                    errors = self._bulk_errors(e, offset, documents, key_field)
+                    report.errors.extend(errors)
+                report.upserted += details.get("nUpserted", 0)
+                report.matched += details.get("nMatched", 0)
+                report.modified += details.get("nModified", 0)
+
+                failed = {error.index - offset for error in errors}
+                stop = min(failed) if ordered and failed else len(documents)
+                written = {
+                    document[key_field]: document
+                    for i, document in enumerate(documents[:stop])
+                    if i not in failed
+                }
+                if collection_name in TEXT_FIELDS and written:
+                    # Updated documents do not report their _id, so read them back
+                    stored = collection.find(
+                        {key_field: {"$in": list(written)}}, {"_id": 1, key_field: 1}
+                    )
+                    self._index_documents(
+                        collection_name,
+                        [(doc["_id"], written[doc[key_field]]) for doc in stored],
+                    )
+                if ordered and failed:
+                    break
+
+            self.logger.info(
+                f"Upserted {report.upserted} and updated {report.matched} of {report.requested} documents in {collection_name} ({len(report.errors)} errors)"
+            )
+            return report
+        except Exception as e:
+            self.logger.error(f"Failed bulk upsert into {collection_name}: {str(e)}")
+            raise
+
+    def set_embeddings(
+        self,
+        collection_name: str,
+        embeddings: Sequence[Tuple[str, Optional[str], List[float]]],
+        embedding_model: str,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> int:
+        """
+        Replace the embeddings of documents given as (_id, user_id, embedding)
+        and tag them with embedding_model; returns the number modified
+        """
+        collection = getattr(self, collection_name)
+        modified = 0
+        try:
+            for offset in range(0, len(embeddings), batch_size):
+                batch = embeddings[offset : offset + batch_size]
+                result = collection.bulk_write(
+                    [
+                        UpdateOne(
+                            {"_id": ObjectId(doc_id)},
+                            {
+                                "$set": {
+                                    "embedding": encode_embedding(embedding),
+                                    "embedding_model": embedding_model,
+                                }
+                            },
+                        )
+                        for doc_id, _, embedding in batch
+                    ],
+                    ordered=False,
+                )
+                modified += result.modified_count
+                self._index_documents(
+                    collection_name,
+                    [
+                        (
+                            doc_id,
+                            {
+                                "user_id": user_id,
+                                "embedding": embedding,
+                                "embedding_model": embedding_model,
+                            },
+                        )
+                        for doc_id, user_id, embedding in batch
+                    ],
+                )
+            self.logger.info(
+                f"Set {modified} {embedding_model} embeddings in {collection_name}"
+            )
+            return modified
+        except Exception as e:
+            self.logger.error(
+                f"Failed to set embeddings in {collection_name}: {str(e)}"
+            )
+            raise
+
+    def migrate_embedding_storage(
+        self,
+        collection_name: str,
+        dtype: str = EMBEDDING_STORAGE_DTYPE,
+        batch_size: int = MONGO_BULK_BATCH_SIZE,
+    ) -> int:
+        """
+        Re-encode the stored embeddings of a collection, legacy arrays
+        included, to dtype; returns the number of documents rewritten
+        """
+        collection = getattr(self, collection_name)
+        migrated = 0
+        try:
+            cursor = collection.find(
+                STORED_EMBEDDING_QUERY, {"_id": 1, "embedding": 1}
+            ).batch_size(batch_size)
+            operations = []
+            for document in cursor:
+                if stored_dtype(document["embedding"]) == dtype:
+                    continue
+                vector = decode_embedding(document["embedding"])
+                operations.append(
+                    UpdateOne(
+                        {"_id": document["_id"]},
+                        {"$set": {"embedding": encode_embedding(vector, dtype)}},
+                    )
+                )
+                if len(operations) >= batch_size:
+                    migrated += collection.bulk_write(operations, ordered=False).modified_count
+                    operations = []
+            if operations:
+                migrated += collection.bulk_write(operations, ordered=False).modified_count
+            self.logger.info(
+                f"Re-encoded {migrated} embeddings of {collection_name} as {dtype}"
+            )
+            return migrated
+        except Exception as e:
+            self.logger.error(
+                f"Failed to migrate embeddings of {collection_name}: {str(e)}"
+            )
+            raise
+
+    def _insert_indexed(self, collection_name: str, entry) -> ObjectId:
+        """Insert an entry, filling its keywords and updating the search indexes"""
+        document = self._prepare_document(collection_name, entry)
+        result = getattr(self, collection_name).insert_one(document)
+        self._index_document(collection_name, result.inserted_id, document)
+        return result.inserted_id
+
+    def _update_one(self, collection_name: str, query: dict, updates: dict):
+        """$set updates, keeping keywords and search indexes in sync with the content"""
+        collection = getattr(self, collection_name)
+        text_field = TEXT_FIELDS[collection_name]
+        updates = self._prepare_updates(collection_name, updates)
+        if text_field not in updates and "embedding" not in updates:
+            return collection.update_one(query, {"$set": updates})
+
+        document = collection.find_one_and_update(
+            query,
+            {"$set": updates},
+            projection={"_id": 1, "user_id": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document:
+            self._index_document(
+                collection_name,
+                document["_id"],
+                {**updates, "user_id": document.get("user_id")},
+            )
+        return document
+
+    def _ensure_vector_partition(
+        self, collection_name: str, user_id: Optional[str]
+    ) -> None:
+        """
+        Load the embeddings of a partition into the vector index if needed,
+        from the mmap segment store when it has been synced, else from Mongo
+        """
+        if self.vector_index.is_loaded(collection_name, user_id):
+            return
+        if self._segments_usable(collection_name):
+            ids, vectors, owners = self.segment_store.load(collection_name, user_id)
+            self.vector_index.load(collection_name, user_id, ids, vectors, owners)
+            self.logger.info(
+                f"Loaded {len(ids)} vectors for {collection_name} partition {user_id} from segments"
+            )
+            return
+
+        query = {
+            **STORED_EMBEDDING_QUERY,
+            **_embedding_model_filter(self.embedding_model),
+        }
+        if user_id is not None:
+            query["user_id"] = user_id
+
+        ids, vectors, owners = [], [], []
+        cursor = getattr(self, collection_name).find(
+            query, {"_id": 1, "user_id": 1, "embedding": 1}
+        )
+        for document in cursor:
+            vector = decode_embedding(document["embedding"])
+            if vectors and len(vector) != len(vectors[0]):
+                continue
+            ids.append(str(document["_id"]))
+            vectors.append(vector)
+            owners.append(document.get("user_id"))
+        self.vector_index.load(collection_name, user_id, ids, vectors, owners)
+        self.logger.info(
+            f"Loaded {len(ids)} vectors for {collection_name} partition {user_id}"
+        )
+
+    def _ensure_text_partition(
+        self, collection_name: str, user_id: Optional[str]
+    ) -> None:
+        """Load the text of a partition into the BM25 index if needed"""
+        if self.text_index.is_loaded(collection_name, user_id):
+            return
+        text_field = TEXT_FIELDS[collection_name]
+        query = {text_field: {"$type": "string"}}
+        if user_id is not None:
+            query["user_id"] = user_id
+
+        ids, texts, owners = [], [], []
+        cursor = getattr(self, collection_name).find(
+            query, {"_id": 1, "user_id": 1, text_field: 1}
+        )
+        for document in cursor:
+            ids.append(str(document["_id"]))
+            texts.append(document[text_field])
+            owners.append(document.get("user_id"))
+        self.text_index.load(collection_name, user_id, ids, texts, owners)
+        self.logger.info(
+            f"Loaded {len(ids)} texts for {collection_name} partition {user_id}"
+        )
+
+    def _ranked_fetch(
+        self,
+        collection_name: str,
+        rank: Callable[[int], List[Tuple[str, float]]],
+        filters: dict,
+        partition_only: bool,
+        limit: int,
+        score_field: str,
+        projection: Optional[dict] = None,
+    ) -> List[dict]:
+        """
+        Take the top ids from an in-process ranking, then fetch only those
+        documents, widening the ranking when Mongo-side filters drop candidates
+        """
+        collection = getattr(self, collection_name)
+        projection, hidden = _with_fields(projection, ["_id"])
+        k = limit if partition_only else limit * VECTOR_INDEX_OVERSAMPLE
+        while True:
+            hits = rank(k)
+            scores = dict(hits)
+            query = {"_id": {"$in": [ObjectId(doc_id) for doc_id in scores]}}
+            if filters:
+                query = {"$and": [filters, query]}
+            results = list(collection.find(query, projection))
+            if len(results) >= limit or len(hits) < k:
+                break
+            k *= VECTOR_INDEX_OVERSAMPLE
+
+        for document in results:
+            document[score_field] = scores[str(document["_id"])]
+        results.sort(key=lambda document: document[score_field], reverse=True)
+        return _strip_fields(results[:limit], hidden)
+
+    def _chunk_fetch(
+        self,
+        collection_name: str,
+        rank: Callable[[int], List[Tuple[str, float]]],
+        filters: dict,
+        limit: int,
+        score_field: str,
+        projection: Optional[dict] = None,
+    ) -> List[dict]:
+        """
+        Take the top chunks from an in-process ranking, keep the best chunk of
+        each document, then fetch those documents, widening the ranking until
+        limit documents pass the filters
+        """
+        collection = getattr(self, collection_name)
+        chunk_collection = getattr(self, CHUNK_COLLECTIONS[collection_name])
+        key_field = COLLECTION_KEYS[collection_name]
+        projection, hidden = _with_fields(projection, [key_field])
+        k = limit * VECTOR_INDEX_OVERSAMPLE
+        while True:
+            hits = rank(k)
+            best = _best_chunks(
+                chunk_collection.find(
+                    {"_id": {"$in": [ObjectId(doc_id) for doc_id, _ in hits]}},
+                    CHUNK_LOCATION_PROJECTION,
+                ),
+                dict(hits),
+            )
+            query = {key_field: {"$in": list(best)}}
+            if filters:
+                query = {"$and": [filters, query]}
+            results = list(collection.find(query, projection))
+            if len(results) >= limit or len(hits) < k:
+                break
+            k *= VECTOR_INDEX_OVERSAMPLE
+
+        for document in results:
+            document["best_chunk"] = best[document[key_field]]
+            document[score_field] = document["best_chunk"]["score"]
+        results.sort(key=lambda document: document[score_field], reverse=True)
+        return _strip_fields(results[:limit], hidden)
+
+    def upsert_chunks(
+        self,
+        collection_name: str,
+        parent_id: str,
+        chunks: Sequence[ChunkEntry],
+        total_chunks: Optional[int] = None,
+    ) -> BulkWriteReport:
+        """
+        Store chunk windows of a conversation or document by chunk_id. Only
+        changed chunks need to be passed; with total_chunks, chunks of the
+        parent from that index on are deleted.
+        """
+        chunk_collection_name = CHUNK_COLLECTIONS[collection_name]
+        chunk_collection = getattr(self, chunk_collection_name)
+        try:
+            report = self.bulk_upsert(chunk_collection_name, chunks)
+            if total_chunks is not None:
+                stale = [
+                    str(chunk["_id"])
+                    for chunk in chunk_collection.find(
+                        {"parent_id": parent_id, "chunk_index": {"$gte": total_chunks}},
+                        {"_id": 1},
+                    )
+                ]
+                if stale:
+                    chunk_collection.delete_many(
+                        {"_id": {"$in": [ObjectId(doc_id) for doc_id in stale]}}
+                    )
+                    self._unindex_documents(chunk_collection_name, stale)
+            self.logger.info(
+                f"Stored {len(chunks)} chunks of {collection_name} {parent_id}"
+            )
+            return report
+        except Exception as e:
+            self.logger.error(
+                f"Failed to store chunks of {collection_name} {parent_id}: {str(e)}"
+            )
+            raise
+
+    def resync_embedding_segments(self, collection_name: str) -> int:
+        """Rebuild the on-disk embedding segments of a collection from Mongo"""
+        try:
+            rows = self.segment_store.resync(
+                collection_name,
+                getattr(self, collection_name),
+                query=_embedding_model_filter(self.embedding_model),
+                model=self.embedding_model,
+            )
+            self.vector_index.invalidate(collection_name)
+            return rows
+        except Exception as e:
+            self.logger.error(
+                f"Failed to resync embedding segments for {collection_name}: {str(e)}"
+            )
+            raise
+
     def hybrid_search(
         self,
         collection_name: str,
@@ -98,80 +1139,66 @@ class MongoManager:
         embedding_query: List[float] = None,
         filters: dict = None,
         limit: int = 10,
+        projection: Projection = None,
+        chunks: bool = False,
     ) -> List[dict]:
         """
-        Perform hybrid search using text and vector similarity
+        Perform hybrid search using BM25 keyword and vector similarity rankings.
+
+        With only one query the documents are ordered by that ranking
+        ("bm25" or "similarity" field); with both, the two rankings are
+        combined by reciprocal-rank fusion ("score" field). `filters` are
+        applied in Mongo when fetching the winning documents; a string
+        `user_id` filter also selects the in-process index partition.
+
+        With chunks=True (conversations and documents) the chunk windows are
+        ranked instead; each document is scored by its best chunk, returned
+        under "best_chunk" with its location and text.
         """
         try:
-            collection = getattr(self, collection_name)
-            pipeline = []
-
-            # Apply filters if provided
-            if filters:
-                pipeline.append({"$match": filters})
+            filters = filters or {}
+            projection = _resolve_projection(projection)
+            user_id, partition_only = _search_partition(filters)
 
-            # Text search
+            search_collection = (
+                CHUNK_COLLECTIONS[collection_name] if chunks else collection_name
+            )
+            rankings = []
             if text_query:
-                pipeline.append(
-                    {
-                        "$match": {
-                            "$or": [
-                                {"keywords": {"$in": text_query.split()}},
-                                {
-                                    "text_content": {
-                                        "$regex": text_query,
-                                        "$options": "i",
-                                    }
-                                },
-                            ]
-                        }
-                    }
+                self._ensure_text_partition(search_collection, user_id)
+                rankings.append(
+                    lambda k: self.text_index.search(
+                        search_collection, user_id, text_query, k
+                    )
                 )
-
-            # Vector similarity search
             if embedding_query:
-                pipeline.extend(
-                    [
-                        {
-                            "$set": {
-                                "similarity": {
-                                    "$reduce": {
-                                        "input": {
-                                            "$range": [0, {"$size": "$embedding"}]
-                                        },
-                                        "initialValue": 0,
-                                        "in": {
-                                            "$add": [
-                                                "$$value",
-                                                {
-                                                    "$multiply": [
-                                                        {
-                                                            "$arrayElemAt": [
-                                                                "$embedding",
-                                                                "$$this",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$arrayElemAt": [
-                                                                embedding_query,
-                                                                "$$this",
-                                                            ]
-                                                        },
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                    }
-                                }
-                            }
-                        },
-                        {"$sort": {"similarity": -1}},
-                    ]
+                self._ensure_vector_partition(search_collection, user_id)
+                rankings.append(
+                    lambda k: self.vector_index.search(
+                        search_collection, user_id, embedding_query, k
+                    )
                 )
 
-            pipeline.append({"$limit": limit})
-
-            results = list(collection.aggregate(pipeline))
+            if not rankings:
+                results = list(
+                    getattr(self, collection_name).find(filters, projection).limit(limit)
+                )
+            else:
+                rank, score_field = _combine_rankings(rankings, text_query)
+                if chunks:
+                    results = self._chunk_fetch(
+                        collection_name, rank, filters, limit, score_field, projection
+                    )
+                else:
+                    results = self._ranked_fetch(
+                        collection_name,
+                        rank,
+                        filters,
+                        partition_only,
+                        limit,
+                        score_field,
+                        projection,
+                    )
             self.logger.info(
                 f"Hybrid search completed in {collection_name}, found {len(results)} results"
             )
@@ -180,9 +1207,103 @@ class MongoManager:
             self.logger.error(f"Failed to perform hybrid search: {str(e)}")
             raise
 
-    def get_users(self) -> List[dict]:
+    def get_summary_checkpoints(
+        self, job: str, day: date, statuses: Optional[Sequence[str]] = None
+    ) -> Dict[str, dict]:
+        """Checkpoint records of a summary job run, by user_id"""
         try:
-            results = list(self.users.find())
+            query = {"job": job, "day": datetime.combine(day, datetime.min.time())}
+            if statuses:
+                query["status"] = {"$in": list(statuses)}
+            return {
+                checkpoint["user_id"]: checkpoint
+                for checkpoint in self.summary_checkpoints.find(query, {"_id": 0})
+            }
+        except Exception as e:
+            self.logger.error(f"Failed to get {job} summary checkpoints for {day}: {str(e)}")
+            raise
+
+    def set_summary_checkpoints(
+        self, job: str, day: date, outcomes: Dict[str, dict]
+    ) -> None:
+        """Record the outcome (status and details) of a summary job run per user_id"""
+        if not outcomes:
+            return
+        day_start = datetime.combine(day, datetime.min.time())
+        now = datetime.now()
+        try:
+            self.summary_checkpoints.bulk_write(
+                [
+                    UpdateOne(
+                        {"job": job, "day": day_start, "user_id": user_id},
+                        {"$set": {**outcome, "updated_at": now}, "$inc": {"attempts": 1}},
+                        upsert=True,
+                    )
+                    for user_id, outcome in outcomes.items()
+                ],
+                ordered=False,
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to set {job} summary checkpoints for {day}: {str(e)}")
+            raise
+
+    def get_rolling_summary(self, user_id: str, day: date) -> Optional[RollingSummary]:
+        """Summary so far of a user's day, if any session was folded into it"""
+        try:
+            result = self.rolling_summaries.find_one(
+                {"user_id": user_id, "day": datetime.combine(day, datetime.min.time())},
+                {"_id": 0},
+            )
+            return RollingSummary(**result) if result else None
+        except Exception as e:
+            self.logger.error(
+                f"Failed to get rolling summary of user {user_id} on {day}: {str(e)}"
+            )
+            raise
+
+    def replace_rolling_summary(
+        self, rolling: RollingSummary, expected_version: int
+    ) -> bool:
+        """
+        Store a rolling summary if the stored one is still at expected_version
+        (0: none stored yet); False if another writer updated it first
+        """
+        try:
+            if expected_version == 0:
+                try:
+                    self.rolling_summaries.insert_one(rolling.model_dump())
+                except DuplicateKeyError:
+                    return False
+                return True
+            result = self.rolling_summaries.replace_one(
+                {
+                    "user_id": rolling.user_id,
+                    "day": rolling.day,
+                    "version": expected_version,
+                },
+                rolling.model_dump(),
+            )
+            return result.matched_count == 1
+        except Exception as e:
+            self.logger.error(
+                f"Failed to store rolling summary of user {rolling.user_id}: {str(e)}"
+            )
+            raise
+
+    def get_summarized_users(
+        self, start_date: date, end_date: date, level: str = "daily"
+    ) -> set:
+        """user_id of the users with a summary of a level in a date range"""
+        try:
+            query = _summary_filter({"day": _day_range(start_date, end_date)}, level)
+            return set(self.summaries.distinct("user_id", query))
+        except Exception as e:
+            self.logger.error(f"Failed to get summarized users: {str(e)}")
+            raise
+
+    def get_users(self, projection: Projection = None) -> List[dict]:
+        try:
+            results = list(self.users.find({}, _resolve_projection(projection)))
             self.logger.info(f"Retrieved {len(results)} users")
             return results
         except Exception as e:
@@ -191,7 +1312,9 @@ class MongoManager:
 
     def check_user(self, user_id: str, password: str) -> bool:
         try:
-            result = self.users.find_one({"user_id": user_id, "password": password})
+            result = self.users.find_one(
+                {"user_id": user_id, "password": password}, {"name": 1}
+            )
             if result:
                 self.logger.info(f"User {user_id} authenticated")
                 return result["name"]
@@ -202,9 +1325,15 @@ class MongoManager:
             self.logger.error(f"Failed to authenticate user {user_id}: {str(e)}")
             raise
 
-    def get_conversations_by_user(self, user_id: str) -> List[dict]:
+    def get_conversations_by_user(
+        self, user_id: str, projection: Projection = None
+    ) -> List[dict]:
         try:
-            results = list(self.conversations.find({"user_id": user_id}))
+            results = list(
+                self.conversations.find(
+                    {"user_id": user_id}, _resolve_projection(projection)
+                )
+            )
             self.logger.info(
                 f"Retrieved {len(results)} conversations for user: {user_id}"
             )
@@ -215,9 +1344,13 @@ class MongoManager:
             )
             raise
 
-    def get_conversation_by_session_id(self, session_id: str) -> Optional[dict]:
+    def get_conversation_by_session_id(
+        self, session_id: str, projection: Projection = None
+    ) -> Optional[dict]:
         try:
-            result = self.conversations.find_one({"session_id": session_id})
+            result = self.conversations.find_one(
+                {"session_id": session_id}, _resolve_projection(projection)
+            )
             if result:
                 self.logger.info(f"Retrieved conversation: {session_id}")
                 return result
@@ -229,53 +1362,84 @@ class MongoManager:
             raise
 
     def get_conversations_by_date_range(
-        self, user_id: str, start_date: date, end_date: date
+        self,
+        user_id: str,
+        start_date: date,
+        end_date: date,
+        projection: Projection = None,
     ) -> List[dict]:
         try:
-            start_datetime = datetime.combine(start_date, datetime.min.time())
-            end_datetime = datetime.combine(end_date, datetime.max.time())
+            created_at = _day_range(start_date, end_date)
             results = list(
                 self.conversations.find(
-                    {
-                        "user_id": user_id,
-                        "created_at": {"$gte": start_datetime, "$lte": end_datetime},
-                    }
+                    {"user_id": user_id, "created_at": created_at},
+                    _resolve_projection(projection),
                 )
             )
             self.logger.info(
-                f"Retrieved {len(results)} conversations for user {user_id} between {start_datetime} and {end_datetime}"
+                f"Retrieved {len(results)} conversations for user {user_id} between {created_at['$gte']} and {created_at['$lte']}"
             )
             return results
         except Exception as e:
             self.logger.error(f"Failed to get conversations for date range: {str(e)}")
             raise
 
+    def get_session_messages_by_date_range(
+        self,
+        user_id: str,
+        start_date: date,
+        end_date: date,
+        exclude_roles: Sequence[str] = ("system",),
+    ) -> List[dict]:
+        """
+        Messages-only view of a user's conversations in a date range, with
+        messages of the excluded roles and messages without a timestamp
+        filtered out server-side
+        """
+        try:
+            pipeline = _session_messages_pipeline(
+                user_id, start_date, end_date, exclude_roles
+            )
+            results = list(self.conversations.aggregate(pipeline))
+            self.logger.info(
+                f"Retrieved messages of {len(results)} conversations for user {user_id}"
+            )
+            return results
+        except Exception as e:
+            self.logger.error(f"Failed to get session messages for date range: {str(e)}")
+            raise
+
     def get_summaries_by_date_range(
-        self, user_id: str, start_date: date, end_date: date
+        self,
+        user_id: str,
+        start_date: date,
+        end_date: date,
+        projection: Projection = None,
+        level: Optional[str] = None,
     ) -> List[dict]:
+        """Summaries with day in a date range, of one level or (level=None) all"""
         try:
-            start_datetime = datetime.combine(start_date, datetime.min.time())
-            end_datetime = datetime.combine(end_date, datetime.max.time())
+            day = _day_range(start_date, end_date)
             results = list(
                 self.summaries.find(
-                    {
-                        "user_id": user_id,
-                        "day": {"$gte": start_datetime, "$lte": end_datetime},
-                    }
+                    _summary_filter({"user_id": user_id, "day": day}, level),
+                    _resolve_projection(projection),
                 )
             )
             self.logger.info(
-                f"Retrieved {len(results)} summaries for user {user_id} between {start_datetime} and {end_datetime}"
+                f"Retrieved {len(results)} summaries for user {user_id} between {day['$gte']} and {day['$lte']}"
             )
             return results
         except Exception as e:
             self.logger.error(f"Failed to get summaries for date range: {str(e)}")
             raise
 
-    def get_last_summaries_by_user(self, user_id: str, last_n: int = 5) -> List[dict]:
+    def get_last_summaries_by_user(
+        self, user_id: str, last_n: int = 5, projection: Projection = None
+    ) -> List[dict]:
         try:
             results = list(
-                self.summaries.find({"user_id": user_id})
+                self.summaries.find({"user_id": user_id}, _resolve_projection(projection))
                 .sort("created_at", -1)
                 .limit(last_n)
             )
@@ -289,10 +1453,13 @@ class MongoManager:
             )
             raise
 
-    def get_document_by_id(self, user_id: str, document_id: str) -> Optional[dict]:
+    def get_document_by_id(
+        self, user_id: str, document_id: str, projection: Projection = None
+    ) -> Optional[dict]:
         try:
             result = self.documents.find_one(
-                {"user_id": user_id, "document_id": document_id}
+                {"user_id": user_id, "document_id": document_id},
+                _resolve_projection(projection),
             )
             self.logger.info(f"Retrieved document {document_id} for user {user_id}")
             return result
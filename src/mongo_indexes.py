@@ -0,0 +1,295 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from src.CONSTANTS import ROLLING_SUMMARY_TTL_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Declarative index registry, applied idempotently by ensure_indexes
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {
+    "conversations": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", ASCENDING)],
+            name="user_id_created_at",
+        ),
+    ],
+    "summaries": [
+        IndexModel([("summary_id", ASCENDING)], name="summary_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], name="user_id_day"),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING)],
+            name="user_id_created_at_desc",
+        ),
+        IndexModel([("day", ASCENDING)], name="day"),
+    ],
+    "documents": [
+        IndexModel(
+            [("document_id", ASCENDING)], name="document_id_unique", unique=True
+        ),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "conversation_chunks": [
+        IndexModel([("chunk_id", ASCENDING)], name="chunk_id_unique", unique=True),
+        IndexModel(
+            [("parent_id", ASCENDING), ("chunk_index", ASCENDING)],
+            name="parent_id_chunk_index",
+        ),
+    ],
+    "document_chunks": [
+        IndexModel([("chunk_id", ASCENDING)], name="chunk_id_unique", unique=True),
+        IndexModel(
+            [("parent_id", ASCENDING), ("chunk_index", ASCENDING)],
+            name="parent_id_chunk_index",
+        ),
+    ],
+    "summary_checkpoints": [
+        IndexModel(
+            [("job", ASCENDING), ("day", ASCENDING), ("user_id", ASCENDING)],
+            name="job_day_user_id_unique",
+            unique=True,
+        ),
+    ],
+    "rolling_summaries": [
+        IndexModel(
+            [("user_id", ASCENDING), ("day", ASCENDING)],
+            name="user_id_day_unique",
+            unique=True,
+        ),
+        IndexModel(
+            [("updated_at", ASCENDING)],
+            name="updated_at_ttl",
+            expireAfterSeconds=ROLLING_SUMMARY_TTL_DAYS * 86400,
+        ),
+    ],
+}
+
+_SAMPLE_DAY = datetime(2024, 1, 1)
+
+# (collection, description, filter, sort) of every hot MongoManager query
+QUERY_SHAPES: List[Tuple[str, str, dict, Optional[list]]] = [
+    ("conversations", "by session_id", {"session_id": "x"}, None),
+    ("conversations", "by user_id", {"user_id": "x"}, None),
+    (
+        "conversations",
+        "by user_id and created_at range",
+        {"user_id": "x", "created_at": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY}},
+        None,
+    ),
+    ("summaries", "by summary_id", {"summary_id": "x"}, None),
+    (
+        "summaries",
+        "by user_id and day range",
+        {"user_id": "x", "day": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY}},
+        None,
+    ),
+    (
+        "summaries",
+        "by user_id, level and day range",
+        {
+            "user_id": "x",
+            "level": {"$in": [None, "daily"]},
+            "day": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY},
+        },
+        None,
+    ),
+    ("summaries", "last by user_id", {"user_id": "x"}, [("created_at", DESCENDING)]),
+    (
+        "summaries",
+        "by day range",
+        {"day": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY}},
+        None,
+    ),
+    ("documents", "by user_id and document_id", {"user_id": "x", "document_id": "x"}, None),
+    ("documents", "by user_id", {"user_id": "x"}, None),
+    ("users", "by user_id and password", {"user_id": "x", "password": "x"}, None),
+    (
+        "conversation_chunks",
+        "by parent_id and chunk_index",
+        {"parent_id": "x", "chunk_index": {"$gte": 0}},
+        None,
+    ),
+    (
+        "document_chunks",
+        "by parent_id and chunk_index",
+        {"parent_id": "x", "chunk_index": {"$gte": 0}},
+        None,
+    ),
+    (
+        "summary_checkpoints",
+        "by job and day",
+        {"job": "x", "day": _SAMPLE_DAY, "status": {"$in": ["x"]}},
+        None,
+    ),
+    (
+        "rolling_summaries",
+        "by user_id and day",
+        {"user_id": "x", "day": _SAMPLE_DAY},
+        None,
+    ),
+]
+
+
+class QueryPlanError(RuntimeError):
+    """Raised when a registered query shape is planned as a collection scan"""
+
+
+# Newest document first: the one kept when removing duplicate keys
+_KEEP_ORDER = {"updated_at": -1, "created_at": -1, "_id": -1}
+
+
+def _log_index_failure(collection_name: str, model: IndexModel, error: Exception) -> None:
+    name = model.document["name"]
+    if model.document.get("unique"):
+        logger.error(
+            f"Unique index {name} on {collection_name} not created, the collection "
+            f"holds duplicate keys (run `python manage.py dedupe`): {error}"
+        )
+    else:
+        logger.error(f"Index {name} on {collection_name} not created: {error}")
+
+
+def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Create every registered index; existing identical indexes are left
+    untouched. An index the data rejects (e.g. a unique index over duplicate
+    keys) is logged and skipped, the other indexes are still created.
+    """
+    created = {}
+    for collection_name, models in INDEX_REGISTRY.items():
+        created[collection_name] = []
+        for model in models:
+            try:
+                created[collection_name] += db[collection_name].create_indexes([model])
+            except OperationFailure as e:
+                _log_index_failure(collection_name, model, e)
+        logger.debug(f"Ensured indexes on {collection_name}: {created[collection_name]}")
+    return created
+
+
+def _unique_keys(collection_name: str) -> List[Tuple[str, List[str]]]:
+    """(name, key fields) of the registered unique indexes of a collection"""
+    return [
+        (model.document["name"], list(model.document["key"]))
+        for model in INDEX_REGISTRY.get(collection_name, [])
+        if model.document.get("unique")
+    ]
+
+
+def _duplicates_pipeline(fields: List[str]) -> List[dict]:
+    return [
+        {"$sort": _KEEP_ORDER},
+        {
+            "$group": {
+                "_id": {field: f"${field}" for field in fields},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1},
+            }
+        },
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+
+def find_duplicates(db, collection_name: str) -> List:
+    """
+    _id of the documents breaking a unique index of the registry: all but
+    the most recently updated document of each key
+    """
+    duplicates = {}
+    for name, fields in _unique_keys(collection_name):
+        for group in db[collection_name].aggregate(
+            _duplicates_pipeline(fields), allowDiskUse=True
+        ):
+            duplicates.update(dict.fromkeys(group["ids"][1:]))
+            logger.debug(f"{collection_name} {name}: {group['count']} documents for {group['_id']}")
+    return list(duplicates)
+
+
+def _plan_stages(plan) -> List[str]:
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _plan_stages(item)]
+    return []
+
+
+def verify_query_plans(db) -> Dict[str, List[str]]:
+    """
+    Run explain() on every registered query shape.
+
+    Returns the winning plan stages per shape and raises QueryPlanError
+    listing the shapes that would scan a whole collection.
+    """
+    plans = {}
+    collection_scans = []
+    for collection_name, description, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(winning_plan)
+        key = f"{collection_name} {description}"
+        plans[key] = stages
+        if "COLLSCAN" in stages:
+            collection_scans.append(key)
+
+    if collection_scans:
+        raise QueryPlanError(
+            "Collection scan planned for: " + ", ".join(collection_scans)
+        )
+    return plans
+
+
+async def ensure_indexes_async(db) -> Dict[str, List[str]]:
+    """ensure_indexes for a Motor database"""
+    created = {}
+    for collection_name, models in INDEX_REGISTRY.items():
+        created[collection_name] = []
+        for model in models:
+            try:
+                created[collection_name] += await db[collection_name].create_indexes([model])
+            except OperationFailure as e:
+                _log_index_failure(collection_name, model, e)
+        logger.debug(f"Ensured indexes on {collection_name}: {created[collection_name]}")
+    return created
+
+
+async def find_duplicates_async(db, collection_name: str) -> List:
+    """find_duplicates for a Motor database"""
+    duplicates = {}
+    for name, fields in _unique_keys(collection_name):
+        cursor = db[collection_name].aggregate(_duplicates_pipeline(fields), allowDiskUse=True)
+        async for group in cursor:
+            duplicates.update(dict.fromkeys(group["ids"][1:]))
+            logger.debug(f"{collection_name} {name}: {group['count']} documents for {group['_id']}")
+    return list(duplicates)
+
+
+async def verify_query_plans_async(db) -> Dict[str, List[str]]:
+    """verify_query_plans for a Motor database"""
+    plans = {}
+    collection_scans = []
+    for collection_name, description, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(winning_plan)
+        key = f"{collection_name} {description}"
+        plans[key] = stages
+        if "COLLSCAN" in stages:
+            collection_scans.append(key)
+
+    if collection_scans:
+        raise QueryPlanError(
+            "Collection scan planned for: " + ", ".join(collection_scans)
+        )
+    return plans
@@ -0,0 +1,182 @@
+from typing import Dict, Optional
+import atexit
+import logging
+import os
+import threading
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, monitoring
+from src.CONSTANTS import (
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Thread-safe connection pool counters fed by PyMongo's CMAP events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.pool_clears = 0
+
+    def _record_wait(self, duration: Optional[float]) -> None:
+        if duration is not None:
+            self.total_wait_seconds += duration
+            self.max_wait_seconds = max(self.max_wait_seconds, duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self._record_wait(event.duration)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.failed_checkouts += 1
+            self._record_wait(event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "failed_checkouts": self.failed_checkouts,
+                "avg_wait_ms": 1000 * self.total_wait_seconds / max(self.checkouts, 1),
+                "max_wait_ms": 1000 * self.max_wait_seconds,
+                "pool_clears": self.pool_clears,
+            }
+
+
+_clients: Dict[str, MongoClient] = {}
+_async_clients: Dict[str, AsyncIOMotorClient] = {}
+_listeners: Dict[str, PoolStatsListener] = {}
+_lock = threading.Lock()
+
+
+def _pool_settings(options: dict) -> dict:
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        **options,
+    }
+
+
+def get_mongo_client(connection_string: Optional[str] = None, **options) -> MongoClient:
+    """
+    Return the process-wide MongoClient for a connection string.
+
+    MongoClient is thread-safe, so every Streamlit script thread and every
+    MongoManager borrows connections from the same pool instead of opening
+    its own. `options` only apply when the client is first created.
+    """
+    connection_string = connection_string or os.getenv("MONGO_CONNECTION_STRING")
+    key = connection_string or ""
+    with _lock:
+        if key not in _clients:
+            listener = PoolStatsListener()
+            settings = _pool_settings(options)
+            _clients[key] = MongoClient(
+                connection_string, event_listeners=[listener], **settings
+            )
+            _listeners[key] = listener
+            logger.info(
+                f"Created shared MongoClient (maxPoolSize={settings['maxPoolSize']})"
+            )
+        return _clients[key]
+
+
+def get_async_mongo_client(
+    connection_string: Optional[str] = None, **options
+) -> AsyncIOMotorClient:
+    """
+    Return the process-wide Motor client for a connection string.
+
+    The client is not bound to an event loop, so it can be shared by every
+    loop of the process. Its pool is separate from the synchronous client's
+    and reports to get_pool_stats(..., asynchronous=True).
+    """
+    connection_string = connection_string or os.getenv("MONGO_CONNECTION_STRING")
+    key = connection_string or ""
+    with _lock:
+        if key not in _async_clients:
+            listener = PoolStatsListener()
+            settings = _pool_settings(options)
+            _async_clients[key] = AsyncIOMotorClient(
+                connection_string, event_listeners=[listener], **settings
+            )
+            _listeners["async:" + key] = listener
+            logger.info(
+                f"Created shared AsyncIOMotorClient (maxPoolSize={settings['maxPoolSize']})"
+            )
+        return _async_clients[key]
+
+
+def get_pool_stats(
+    connection_string: Optional[str] = None, asynchronous: bool = False
+) -> dict:
+    """Connection pool counters of the shared client for a connection string"""
+    key = connection_string or os.getenv("MONGO_CONNECTION_STRING") or ""
+    if asynchronous:
+        key = "async:" + key
+    listener = _listeners.get(key)
+    return listener.snapshot() if listener else {}
+
+
+@atexit.register
+def close_mongo_clients() -> None:
+    with _lock:
+        for client in [*_clients.values(), *_async_clients.values()]:
+            client.close()
+        _clients.clear()
+        _async_clients.clear()
+        _listeners.clear()
@@ -1,31 +1,88 @@
-from openai import OpenAI
 from datetime import datetime
-from typing import List
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
 import os
 import json
+import time
 import logging
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
 from src.models import Message, ConversationEntry
+from src.metrics import get_metrics
+from src.openai_clients import get_openai_client
+from src.CONSTANTS import PROMPT_CACHE_VERIFY, AGENT_MAX_TOOL_ROUNDS
+
+if TYPE_CHECKING:
+    from src.tool_manager import ToolManager
 
 
 class DailyAgent:
-    def __init__(self, openai_api_key: str = None, tools: list[dict] = None):
-        """Initialize DailyAgent with OpenAI client.
+    def __init__(
+        self,
+        openai_api_key: str = None,
+        tools: list[dict] = None,
+        tool_manager: Optional["ToolManager"] = None,
+        max_tool_rounds: int = AGENT_MAX_TOOL_ROUNDS,
+    ):
+        """Initialize DailyAgent with the shared OpenAI client.
 
         Args:
             openai_api_key (str, optional): OpenAI API key for authentication.
                                           If None, gets from environment
-            tools (list[dict], optional): List of tool configurations
+            tools (list[dict], optional): List of tool configurations. If None,
+                                          the definitions of tool_manager's tools
+            tool_manager (ToolManager, optional): Runs the tool calls of the model
+            max_tool_rounds (int, optional): Model turns with tool calls before
+                                          a text answer is required
         """
         self.logger = logging.getLogger()
-        self.client = OpenAI(api_key=openai_api_key or os.getenv("OPENAI_API_KEY"))
+        self.client = get_openai_client(openai_api_key)
+        self.tool_manager = tool_manager
+        if tools is None and tool_manager is not None:
+            tools = tool_manager.definitions()
         self.tools = tools or []
+        self.max_tool_rounds = max_tool_rounds
+        self.metrics = get_metrics()
         self.logger.debug("DailyAgent initialized with OpenAI client")
 
+    def _record_usage(self, usage) -> None:
+        """Count prompt tokens and the part served from the provider's prompt cache"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (details.cached_tokens or 0) if details else 0
+        self.metrics.increment("agent.prompt_tokens", usage.prompt_tokens)
+        self.metrics.increment("agent.cached_prompt_tokens", cached)
+        if PROMPT_CACHE_VERIFY:
+            self.logger.info(
+                f"Prompt cache: {cached} cached, {usage.prompt_tokens - cached} uncached "
+                f"of {usage.prompt_tokens} prompt tokens"
+            )
+
+    @staticmethod
+    def _filter_history(chat_history: List[Message]) -> List[dict]:
+        """Keep only the message types accepted by the chat completions API"""
+        messages = []
+        for msg in chat_history:
+            if msg.role not in ["system", "assistant", "developer", "tool", "user"]:
+                continue
+            message = {"role": msg.role, "content": msg.content}
+            if msg.tool_calls:
+                message["tool_calls"] = msg.tool_calls
+                message["content"] = msg.content or None
+            if msg.tool_call_id:
+                message["tool_call_id"] = msg.tool_call_id
+            messages.append(message)
+        return messages
+
     def create(
         self, chat_history: List[Message], model: str = None, **kwargs
     ) -> Message:
         """Process chat history and generate response using OpenAI.
 
+        When the model calls tools, they are run by the tool manager (the
+        calls of a turn concurrently) and their results sent back, for at
+        most max_tool_rounds turns; the last turn may not call tools.
+
         Args:
             chat_history (List[Message]): List of Message objects
             model (str, optional): OpenAI model to use. If None, uses DEFAULT_CHAT_MODEL
@@ -33,48 +90,153 @@ class DailyAgent:
             **kwargs: Additional parameters for OpenAI API call
 
         Returns:
-            List[Message]: Updated chat history including the assistant's response
+            Message: The assistant's final text response
         """
         model = model or os.getenv("DEFAULT_CHAT_MODEL", "gpt-4o")
         self.logger.info(f"Using model: {model}")
 
         # Filter chat history to include only valid message types
-        filtered_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in chat_history
-            if msg.role in ["system", "assistant", "developer", "tool", "user"]
-        ]
+        filtered_history = self._filter_history(chat_history)
         self.logger.debug(f"Filtered chat history length: {len(filtered_history)}")
 
-        # Generate response using OpenAI
-        self.logger.info("Generating response from OpenAI")
-        if self.tools:
-            response = self.client.chat.completions.create(
-                model=model, messages=filtered_history, tools=self.tools, **kwargs
+        for tool_round in range(self.max_tool_rounds + 1):
+            # Generate response using OpenAI
+            self.logger.info("Generating response from OpenAI")
+            if self.tools:
+                # Once the rounds are used up the model has to answer in text
+                if tool_round == self.max_tool_rounds:
+                    self.metrics.increment("agent.tool_round_limit_reached")
+                    kwargs["tool_choice"] = "none"
+                response = self.client.chat.completions.create(
+                    model=model, messages=filtered_history, tools=self.tools, **kwargs
+                )
+            else:
+                response = self.client.chat.completions.create(
+                    model=model, messages=filtered_history, **kwargs
+                )
+            self._record_usage(response.usage)
+            response_message = response.choices[0].message
+
+            if not response_message.tool_calls:
+                self.logger.debug("Response received from OpenAI - text content")
+                self.metrics.increment("agent.tool_rounds", tool_round)
+                return Message(
+                    role="assistant",
+                    content=response_message.content or "",
+                    timestamp=datetime.now(),
+                )
+
+            self.logger.debug(
+                f"Response received from OpenAI - {len(response_message.tool_calls)} tool calls"
             )
-        else:
-            response = self.client.chat.completions.create(
-                model=model, messages=filtered_history, **kwargs
+            if self.tool_manager is None:
+                raise RuntimeError("The model called tools but DailyAgent has no tool manager")
+            self.metrics.increment("agent.tool_calls", len(response_message.tool_calls))
+            assistant_message = Message(
+                role="assistant",
+                content=response_message.content or "",
+                tool_calls=[
+                    tool_call.model_dump(exclude_none=True)
+                    for tool_call in response_message.tool_calls
+                ],
             )
+            tool_messages = self.tool_manager.apply_tools(response_message.tool_calls)
+            filtered_history += self._filter_history([assistant_message, *tool_messages])
 
-        if response_content := response.choices[0].message.content:
-            self.logger.debug("Response received from OpenAI - text content")
+        raise RuntimeError(f"No text response after {self.max_tool_rounds} tool rounds")
 
-            # Create new Message object for the assistant's response
-            assistant_message = Message(
-                role="assistant", content=response_content, timestamp=datetime.now()
+    @staticmethod
+    def _merge_tool_call_delta(tool_calls: Dict[int, dict], fragment) -> None:
+        """Add a streamed tool call fragment to the calls accumulated by index"""
+        call = tool_calls.setdefault(fragment.index, {"id": None, "name": "", "arguments": ""})
+        if fragment.id:
+            call["id"] = fragment.id
+        if fragment.function:
+            call["name"] += fragment.function.name or ""
+            call["arguments"] += fragment.function.arguments or ""
+
+    def stream(
+        self, chat_history: List[Message], model: str = None, **kwargs
+    ) -> Iterator[str]:
+        """Generate a response like create(), yielding its text deltas as they arrive.
+
+        Tool calls arrive in fragments; once a turn ends with tool calls they
+        are run by the tool manager and the next turn is streamed, for at most
+        max_tool_rounds turns like create().
+
+        Args:
+            chat_history (List[Message]): List of Message objects
+            model (str, optional): OpenAI model to use. If None, uses DEFAULT_CHAT_MODEL
+                     from environment
+            **kwargs: Additional parameters for OpenAI API call
+
+        Yields:
+            str: Content deltas of the assistant's response
+        """
+        model = model or os.getenv("DEFAULT_CHAT_MODEL", "gpt-4o")
+        self.logger.info(f"Streaming response from OpenAI with model: {model}")
+        if self.tools:
+            kwargs["tools"] = self.tools
+        if PROMPT_CACHE_VERIFY:
+            # The usage then arrives in a last chunk without choices
+            kwargs.setdefault("stream_options", {"include_usage": True})
+
+        filtered_history = self._filter_history(chat_history)
+        started = time.perf_counter()
+        first_token = True
+        self.metrics.increment("agent.stream_requests")
+        for tool_round in range(self.max_tool_rounds + 1):
+            if self.tools and tool_round == self.max_tool_rounds:
+                # Once the rounds are used up the model has to answer in text
+                self.metrics.increment("agent.tool_round_limit_reached")
+                kwargs["tool_choice"] = "none"
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=filtered_history,
+                stream=True,
+                **kwargs,
             )
-        elif response.choices[0].message.tools_calls:
-            response_list = []
-            self.logger.debug("Response received from OpenAI - tool call")
+            content = []
+            tool_calls: Dict[int, dict] = {}
+            for chunk in response:
+                self._record_usage(getattr(chunk, "usage", None))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    if first_token:
+                        self.metrics.observe(
+                            "agent.time_to_first_token", time.perf_counter() - started
+                        )
+                        first_token = False
+                    content.append(delta.content)
+                    yield delta.content
+                for fragment in delta.tool_calls or []:
+                    self._merge_tool_call_delta(tool_calls, fragment)
+
+            if not tool_calls:
+                self.metrics.increment("agent.tool_rounds", tool_round)
+                self.metrics.observe("agent.stream_duration", time.perf_counter() - started)
+                return
+
+            self.logger.debug(f"Streamed response with {len(tool_calls)} tool calls")
+            if self.tool_manager is None:
+                raise RuntimeError("The model called tools but DailyAgent has no tool manager")
+            self.metrics.increment("agent.tool_calls", len(tool_calls))
+            calls = [
+                ChatCompletionMessageToolCall(
+                    id=call["id"],
+                    type="function",
+                    function=Function(name=call["name"], arguments=call["arguments"]),
+                )
+                for _, call in sorted(tool_calls.items())
+            ]
             assistant_message = Message(
                 role="assistant",
-                content=json.dumps(response.choices[0].message.tools_calls),
-                timestamp=datetime.now(),
+                content="".join(content),
+                tool_calls=[call.model_dump(exclude_none=True) for call in calls],
             )
-            response_list.append(assistant_message)
-            for tool_call in response.choices[0].message.tools_calls:
-                # Call the relevant tool and return the result as a Message object
-                pass
+            tool_messages = self.tool_manager.apply_tools(calls)
+            filtered_history += self._filter_history([assistant_message, *tool_messages])
 
-        return assistant_message
+        raise RuntimeError(f"No text response after {self.max_tool_rounds} tool rounds")
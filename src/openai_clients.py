@@ -0,0 +1,70 @@
+from typing import Dict, Optional
+import atexit
+import importlib.util
+import logging
+import os
+import threading
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+from src.CONSTANTS import (
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_TIMEOUT,
+    OPENAI_CONNECT_TIMEOUT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_HTTP2,
+)
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[str, OpenAI] = {}
+_lock = threading.Lock()
+
+
+def _http_client() -> httpx.Client:
+    http2 = OPENAI_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        # httpx needs the optional h2 package (httpx[http2]) to speak HTTP/2
+        logger.warning("OPENAI_HTTP2 is set but h2 is not installed, using HTTP/1.1")
+        http2 = False
+    return DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        http2=http2,
+    )
+
+
+def get_openai_client(api_key: Optional[str] = None) -> OpenAI:
+    """
+    Return the process-wide OpenAI client for an API key.
+
+    The client is thread-safe and keeps its HTTP connections alive, so chat
+    turns, summaries and embeddings reuse open TLS connections instead of
+    each building a client and pool of their own.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    key = api_key or ""
+    with _lock:
+        if key not in _clients:
+            _clients[key] = OpenAI(
+                api_key=api_key,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=_http_client(),
+            )
+            logger.info(
+                f"Created shared OpenAI client (max_connections={OPENAI_MAX_CONNECTIONS})"
+            )
+        return _clients[key]
+
+
+@atexit.register
+def close_openai_clients() -> None:
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,21 @@
+from typing import NamedTuple, Sequence
+
+# Stability of a prompt segment: how often its text changes
+STATIC = 0  # Instructions, fixed per user
+DAILY = 1  # Summaries of the previous days
+SESSION = 2  # Current time and today's sessions
+
+
+class PromptSegment(NamedTuple):
+    template: str
+    stability: int
+
+
+def assemble_prompt(segments: Sequence[PromptSegment], **values) -> str:
+    """
+    Format the segments most stable first. Provider prompt caching matches
+    on prefixes, so consecutive sessions then share everything up to the
+    first segment that changed.
+    """
+    ordered = sorted(segments, key=lambda segment: segment.stability)
+    return "\n\n".join(segment.template.format(**values) for segment in ordered)
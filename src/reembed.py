@@ -0,0 +1,145 @@
+from typing import List
+import logging
+from src.mongo import MongoManager, _embedding_model_filter
+from src.embedding import EmbeddingGenerator
+from src.embedding_codec import STORED_EMBEDDING_QUERY
+from src.chunking import CHUNK_COLLECTIONS, chunk_messages, mean_embedding
+from src.models import ChunkEntry, Message
+from src.text_index import TEXT_FIELDS
+from src.CONSTANTS import MONGO_BULK_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _stale_ids(mongo_manager: MongoManager, collection_name: str, model: str) -> List:
+    """_id of the documents with an embedding of another model than `model`"""
+    collection = getattr(mongo_manager, collection_name)
+    query = {**STORED_EMBEDDING_QUERY, "$nor": [_embedding_model_filter(model)]}
+    return [doc["_id"] for doc in collection.find(query, {"_id": 1})]
+
+
+def reembed_collection(
+    mongo_manager: MongoManager,
+    generator: EmbeddingGenerator,
+    collection_name: str,
+    batch_size: int = MONGO_BULK_BATCH_SIZE,
+) -> int:
+    """
+    Re-embed with generator.model the documents of a collection embedded by
+    another model. Conversations and documents are re-chunked and keep the
+    mean of their chunk embeddings. Returns the number of documents re-embedded.
+    """
+    if collection_name == "conversations":
+        return _reembed_conversations(mongo_manager, generator, batch_size)
+    if collection_name == "documents":
+        return _reembed_documents(mongo_manager, generator, batch_size)
+
+    collection = getattr(mongo_manager, collection_name)
+    text_field = TEXT_FIELDS[collection_name]
+    # Ids are read upfront: updated documents leave the query while it is iterated
+    stale = _stale_ids(mongo_manager, collection_name, generator.model)
+    done = 0
+    for offset in range(0, len(stale), batch_size):
+        documents = list(
+            collection.find(
+                {"_id": {"$in": stale[offset : offset + batch_size]}},
+                {"_id": 1, "user_id": 1, text_field: 1},
+            )
+        )
+        embeddings = generator.create_batch(
+            [document.get(text_field) or "" for document in documents]
+        )
+        done += mongo_manager.set_embeddings(
+            collection_name,
+            [
+                (str(document["_id"]), document.get("user_id"), embedding)
+                for document, embedding in zip(documents, embeddings)
+                if embedding
+            ],
+            generator.model,
+        )
+        logger.info(f"{collection_name}: re-embedded {done} of {len(stale)}")
+    return done
+
+
+def _reembed_conversations(
+    mongo_manager: MongoManager, generator: EmbeddingGenerator, batch_size: int
+) -> int:
+    stale = _stale_ids(mongo_manager, "conversations", generator.model)
+    done = 0
+    for offset in range(0, len(stale), batch_size):
+        conversations = mongo_manager.conversations.find(
+            {"_id": {"$in": stale[offset : offset + batch_size]}},
+            {"_id": 1, "session_id": 1, "user_id": 1, "messages": 1},
+        )
+        embeddings = []
+        for conversation in conversations:
+            messages = [Message(**message) for message in conversation.get("messages", [])]
+            chunks = chunk_messages(messages)
+            chunk_embeddings = generator.create_batch([chunk.text for chunk in chunks])
+            mongo_manager.upsert_chunks(
+                "conversations",
+                conversation["session_id"],
+                [
+                    ChunkEntry(
+                        chunk_id=f"{conversation['session_id']}:{i}",
+                        parent_id=conversation["session_id"],
+                        user_id=conversation["user_id"],
+                        chunk_index=i,
+                        start=chunk.start,
+                        end=chunk.end,
+                        text=chunk.text,
+                        embedding=embedding,
+                        embedding_model=generator.model,
+                    )
+                    for i, (chunk, embedding) in enumerate(zip(chunks, chunk_embeddings))
+                ],
+                total_chunks=len(chunks),
+            )
+            embedding = mean_embedding(chunk_embeddings)
+            if embedding:
+                embeddings.append(
+                    (str(conversation["_id"]), conversation["user_id"], embedding)
+                )
+        done += mongo_manager.set_embeddings("conversations", embeddings, generator.model)
+        logger.info(f"conversations: re-embedded {done} of {len(stale)}")
+    return done
+
+
+def _reembed_documents(
+    mongo_manager: MongoManager, generator: EmbeddingGenerator, batch_size: int
+) -> int:
+    stale = _stale_ids(mongo_manager, "documents", generator.model)
+    done = 0
+    for offset in range(0, len(stale), batch_size):
+        documents = mongo_manager.documents.find(
+            {"_id": {"$in": stale[offset : offset + batch_size]}},
+            {"_id": 1, "document_id": 1, "user_id": 1, "text": 1},
+        )
+        embeddings = []
+        for document in documents:
+            chunks, embedding = mongo_manager._chunk_document(
+                document["document_id"], document["user_id"], document.get("text"), generator
+            )
+            mongo_manager.upsert_chunks(
+                "documents", document["document_id"], chunks, total_chunks=len(chunks)
+            )
+            if embedding:
+                embeddings.append((str(document["_id"]), document["user_id"], embedding))
+        done += mongo_manager.set_embeddings("documents", embeddings, generator.model)
+        logger.info(f"documents: re-embedded {done} of {len(stale)}")
+    return done
+
+
+def reembed_collections(
+    mongo_manager: MongoManager,
+    generator: EmbeddingGenerator,
+    collection_names: List[str],
+    batch_size: int = MONGO_BULK_BATCH_SIZE,
+) -> dict:
+    """Re-embed several collections, parents first: they rewrite their chunks"""
+    ordered = sorted(collection_names, key=lambda name: name not in CHUNK_COLLECTIONS)
+    return {
+        name: reembed_collection(mongo_manager, generator, name, batch_size)
+        for name in ordered
+    }
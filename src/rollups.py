@@ -0,0 +1,119 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import date, timedelta
+from src.tokens import count_tokens
+from src.CONSTANTS import DEFAULT_MODEL
+
+# Summary levels, finest first. A rollup summarizes the summaries of the
+# previous level: a week its days, a month the weeks ending in it.
+LEVELS = ("daily", "weekly", "monthly")
+
+
+def summary_level(summary: dict) -> str:
+    """Level of a stored summary; summaries stored before rollups are daily"""
+    return summary.get("level") or "daily"
+
+
+def summary_key(summary: dict) -> str:
+    return str(summary.get("summary_id") or summary["_id"])
+
+
+def months_before(day: date, months: int) -> date:
+    """First day of the month months before the month of day"""
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    return date(year, month + 1, 1)
+
+
+def period_start(level: str, day: date) -> date:
+    """First day of the daily, weekly (Monday) or monthly period containing day"""
+    if level == "daily":
+        return day
+    if level == "weekly":
+        return day - timedelta(days=day.weekday())
+    if level == "monthly":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown summary level: {level}")
+
+
+def rollup_sources(level: str, start: date) -> Tuple[str, date, date]:
+    """(level, first day, last day) of the summaries rolled up into a period"""
+    if level == "weekly":
+        return "daily", start, start + timedelta(days=6)
+    if level == "monthly":
+        # Weeks are assigned to the month of their Sunday
+        month_end = months_before(start, -1) - timedelta(days=1)
+        return "weekly", start - timedelta(days=6), month_end - timedelta(days=6)
+    raise ValueError(f"Not a rollup level: {level}")
+
+
+def rollups_due(day: date) -> List[Tuple[str, date]]:
+    """(level, period start) of the rollups whose last source period ends on day"""
+    due = []
+    if day.weekday() == 6:
+        due.append(("weekly", period_start("weekly", day)))
+        if (day + timedelta(days=7)).month != day.month:
+            due.append(("monthly", period_start("monthly", day)))
+    return due
+
+
+def summary_label(summary: dict) -> str:
+    """Heading of a summary in prompts, e.g. "Week 2024-01-08 - 2024-01-14" """
+    day = summary["day"]
+    level = summary_level(summary)
+    if level == "weekly":
+        end = day + timedelta(days=6)
+        return f"Week {day.strftime('%Y-%m-%d')} - {end.strftime('%Y-%m-%d')}"
+    if level == "monthly":
+        return f"Month {day.strftime('%Y-%m')}"
+    return f"Day {day.strftime('%Y-%m-%d')}"
+
+
+def select_summary_levels(
+    summaries: List[dict], budget: int, model: str = DEFAULT_MODEL
+) -> List[dict]:
+    """
+    Cover the history with the finest summaries that fit in budget tokens.
+
+    Starts from the coarsest cover (every summary not rolled up into another
+    one of the list) and, newest first, replaces a rollup with its sources
+    while the result still fits. The oldest summaries are dropped if even
+    the coarsest cover does not fit. Returns the selection by day.
+    """
+    by_key = {summary_key(s): s for s in summaries}
+    tokens = {key: count_tokens(s["summary"], model) for key, s in by_key.items()}
+    rolled_up = {
+        source for s in summaries for source in s.get("source_ids") or [] if source in by_key
+    }
+    selected = [key for key in by_key if key not in rolled_up]
+    total = sum(tokens[key] for key in selected)
+
+    def sources(key: str) -> Optional[List[str]]:
+        # Only rollups whose sources were all loaded can be refined
+        source_ids = by_key[key].get("source_ids") or []
+        if source_ids and all(source in by_key for source in source_ids):
+            return source_ids
+        return None
+
+    while True:
+        refinable = [key for key in selected if sources(key)]
+        if not refinable:
+            break
+        newest = max(refinable, key=lambda key: by_key[key]["day"])
+        extra = sum(tokens[source] for source in sources(newest)) - tokens[newest]
+        if total + extra > budget:
+            break
+        selected.remove(newest)
+        selected += sources(newest)
+        total += extra
+
+    selected.sort(key=lambda key: by_key[key]["day"])
+    while selected and total > budget:
+        total -= tokens[selected.pop(0)]
+    return [by_key[key] for key in selected]
+
+
+def rollup_counts(summaries: List[dict]) -> Dict[str, int]:
+    """Number of summaries of each level"""
+    counts: Dict[str, int] = {}
+    for s in summaries:
+        counts[summary_level(s)] = counts.get(summary_level(s), 0) + 1
+    return counts
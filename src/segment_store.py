@@ -0,0 +1,359 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+import itertools
+import json
+import logging
+import os
+import threading
+import numpy as np
+from src.embedding_codec import STORED_EMBEDDING_QUERY, decode_embedding
+from src.CONSTANTS import EMBEDDING_SEGMENTS_DIR, EMBEDDING_SEGMENT_MAX_ROWS
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+
+class EmbeddingSegmentStore:
+    """
+    Append-only on-disk store of float32 embeddings, one directory per collection.
+
+    Layout of a collection directory:
+        manifest.json       dimension (null until the first row), embedding model,
+                            segment list and next row sequence number
+        seg-NNNNNN.f32      raw row-major float32 vectors, opened with mmap
+        seg-NNNNNN.ids      one JSON line [doc_id, user_id] per vector row
+        tombstones.jsonl    one JSON line [doc_id, seq] per delete or rewrite
+
+    Every row gets a global sequence number. A tombstone [doc_id, seq] kills the
+    rows of doc_id written before seq, so a rewrite is a tombstone followed by an
+    append. Collections only accept appends once a manifest exists, i.e. after
+    a resync, so a partially written store is never mistaken for a complete one.
+    """
+
+    def __init__(
+        self,
+        root: str = EMBEDDING_SEGMENTS_DIR,
+        max_segment_rows: int = EMBEDDING_SEGMENT_MAX_ROWS,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.root = root
+        self.max_segment_rows = max_segment_rows
+        self._lock = threading.RLock()
+
+    # ---------------------------------------------------------------- files
+    def _path(self, collection: str, *parts: str) -> str:
+        return os.path.join(self.root, collection, *parts)
+
+    def has_collection(self, collection: str) -> bool:
+        return os.path.exists(self._path(collection, "manifest.json"))
+
+    def model(self, collection: str) -> Optional[str]:
+        """Embedding model the segments were synced with (None if unknown)"""
+        manifest = self._read_manifest(collection)
+        return manifest.get("model") if manifest else None
+
+    def _read_manifest(self, collection: str) -> Optional[dict]:
+        try:
+            with open(self._path(collection, "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, directory: str, manifest: dict) -> None:
+        tmp_path = os.path.join(directory, "manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(directory, "manifest.json"))
+
+    def _read_tombstones(self, collection: str) -> Dict[str, int]:
+        tombstones: Dict[str, int] = {}
+        try:
+            with open(self._path(collection, "tombstones.jsonl")) as f:
+                for line in f:
+                    if line.strip():
+                        doc_id, seq = json.loads(line)
+                        tombstones[doc_id] = max(seq, tombstones.get(doc_id, 0))
+        except FileNotFoundError:
+            pass
+        return tombstones
+
+    @contextmanager
+    def _write_lock(self, collection: str):
+        """Serialize writers across threads and Streamlit worker processes"""
+        with self._lock:
+            os.makedirs(self._path(collection), exist_ok=True)
+            with open(self._path(collection, ".lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _segment_name(number: int) -> str:
+        return f"seg-{number:06d}"
+
+    def _write_rows(
+        self,
+        directory: str,
+        manifest: dict,
+        rows: Sequence[Tuple[str, Optional[str], Sequence[float]]],
+    ) -> None:
+        """Append rows to the open tail segment, sealing it when full"""
+        offset = 0
+        while offset < len(rows):
+            segments = manifest["segments"]
+            if not segments or segments[-1]["rows"] >= self.max_segment_rows:
+                segments.append(
+                    {
+                        "name": self._segment_name(manifest["next_segment"]),
+                        "rows": 0,
+                        "ids_bytes": 0,
+                        "base_seq": manifest["next_seq"],
+                    }
+                )
+                manifest["next_segment"] += 1
+            tail = segments[-1]
+            batch = rows[offset : offset + self.max_segment_rows - tail["rows"]]
+            matrix = np.asarray([vector for _, _, vector in batch], dtype=np.float32)
+            if not manifest["dim"]:
+                # A collection synced while empty takes the dimension of its first row
+                manifest["dim"] = matrix.shape[1]
+            dim = manifest["dim"]
+            if matrix.shape[1] != dim:
+                raise ValueError(
+                    f"Embedding dimension {matrix.shape[1]} does not match store dimension {dim}"
+                )
+            sidecar = "".join(
+                json.dumps([doc_id, user_id]) + "\n" for doc_id, user_id, _ in batch
+            ).encode()
+
+            # Truncating first drops bytes left by a writer that crashed before
+            # updating the manifest
+            for suffix, data, size in (
+                (".f32", matrix.tobytes(), tail["rows"] * dim * 4),
+                (".ids", sidecar, tail["ids_bytes"]),
+            ):
+                with open(os.path.join(directory, tail["name"] + suffix), "ab") as f:
+                    f.truncate(size)
+                    f.write(data)
+
+            tail["rows"] += len(batch)
+            tail["ids_bytes"] += len(sidecar)
+            manifest["next_seq"] += len(batch)
+            offset += len(batch)
+
+    # ---------------------------------------------------------------- writes
+    def append(
+        self,
+        collection: str,
+        rows: Sequence[Tuple[str, Optional[str], Sequence[float]]],
+    ) -> None:
+        """Write (doc_id, user_id, embedding) rows, superseding older rows of the same ids"""
+        if not rows or not self.has_collection(collection):
+            return
+        with self._write_lock(collection):
+            manifest = self._read_manifest(collection)
+            self._write_tombstones(collection, [r[0] for r in rows], manifest["next_seq"])
+            self._write_rows(self._path(collection), manifest, rows)
+            self._write_manifest(self._path(collection), manifest)
+
+    def delete(self, collection: str, doc_ids: Iterable[str]) -> None:
+        if not self.has_collection(collection):
+            return
+        with self._write_lock(collection):
+            manifest = self._read_manifest(collection)
+            self._write_tombstones(collection, list(doc_ids), manifest["next_seq"])
+
+    def _write_tombstones(self, collection: str, doc_ids: List[str], seq: int) -> None:
+        with open(self._path(collection, "tombstones.jsonl"), "a") as f:
+            f.writelines(json.dumps([doc_id, seq]) + "\n" for doc_id in doc_ids)
+
+    # ---------------------------------------------------------------- reads
+    def load(
+        self, collection: str, user_id: Optional[str] = None
+    ) -> Tuple[List[str], np.ndarray, List[Optional[str]]]:
+        """
+        Return the live (ids, vectors, user_ids) of a collection, optionally one user.
+
+        Vectors come from memory-mapped segment files, so the pages are shared
+        with every other process reading the same store. When a single segment
+        is fully live the returned matrix is the mmap itself.
+        """
+        manifest = self._read_manifest(collection)
+        if manifest is None:
+            return [], np.empty((0, 0), dtype=np.float32), []
+        tombstones = self._read_tombstones(collection)
+        dim = manifest["dim"] or 0
+
+        ids: List[str] = []
+        owners: List[Optional[str]] = []
+        blocks: List[np.ndarray] = []
+        for segment in manifest["segments"]:
+            if not segment["rows"]:
+                continue
+            vectors = np.memmap(
+                self._path(collection, segment["name"] + ".f32"),
+                dtype=np.float32,
+                mode="r",
+                shape=(segment["rows"], dim),
+            )
+            with open(self._path(collection, segment["name"] + ".ids"), "rb") as f:
+                sidecar = f.read(segment["ids_bytes"])
+            entries = [json.loads(line) for line in sidecar.splitlines()]
+
+            live = [
+                row
+                for row, (doc_id, owner) in enumerate(entries)
+                if segment["base_seq"] + row >= tombstones.get(doc_id, 0)
+                and (user_id is None or owner == user_id)
+            ]
+            if len(live) == segment["rows"]:
+                blocks.append(vectors)
+            elif live:
+                blocks.append(vectors[live])
+            ids.extend(entries[row][0] for row in live)
+            owners.extend(entries[row][1] for row in live)
+
+        if not blocks:
+            return [], np.empty((0, dim), dtype=np.float32), []
+        matrix = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+        return ids, matrix, owners
+
+    def stats(self, collection: str) -> dict:
+        manifest = self._read_manifest(collection)
+        if manifest is None:
+            return {"collection": collection, "synced": False}
+        total = sum(segment["rows"] for segment in manifest["segments"])
+        live = len(self.load(collection)[0])
+        return {
+            "collection": collection,
+            "synced": True,
+            "model": manifest.get("model"),
+            "dim": manifest["dim"],
+            "segments": len(manifest["segments"]),
+            "rows": total,
+            "live_rows": live,
+            "dead_rows": total - live,
+        }
+
+    # ---------------------------------------------------------------- maintenance
+    def _rebuild(
+        self,
+        collection: str,
+        dim: Optional[int],
+        batches: Iterable[Sequence[Tuple[str, Optional[str], Sequence[float]]]],
+        model: Optional[str] = None,
+    ) -> int:
+        """
+        Write batches into new segments and swap the manifest over to them.
+
+        Segment numbers and sequence numbers continue from the old manifest, so
+        readers that still map the old files, and old tombstones, stay valid
+        until the old segments are unlinked.
+        """
+        directory = self._path(collection)
+        previous = self._read_manifest(collection) or {
+            "segments": [],
+            "next_seq": 0,
+            "next_segment": 1,
+        }
+        manifest = {
+            "dim": dim,
+            "model": model or previous.get("model"),
+            "segments": [],
+            "next_seq": previous["next_seq"],
+            "next_segment": previous["next_segment"],
+        }
+        first_seq = manifest["next_seq"]
+        for batch in batches:
+            self._write_rows(directory, manifest, batch)
+        self._write_manifest(directory, manifest)
+
+        open(self._path(collection, "tombstones.jsonl"), "w").close()
+        for segment in previous["segments"]:
+            for suffix in (".f32", ".ids"):
+                try:
+                    os.remove(self._path(collection, segment["name"] + suffix))
+                except FileNotFoundError:
+                    pass
+        return manifest["next_seq"] - first_seq
+
+    def compact(self, collection: str) -> int:
+        """Rewrite the live rows into full segments and drop the tombstones"""
+        if not self.has_collection(collection):
+            return 0
+        with self._write_lock(collection):
+            ids, matrix, owners = self.load(collection)
+            dim = self._read_manifest(collection)["dim"]
+            step = self.max_segment_rows
+            batches = (
+                list(zip(ids[i : i + step], owners[i : i + step], matrix[i : i + step]))
+                for i in range(0, len(ids), step)
+            )
+            rows = self._rebuild(collection, dim, batches)
+        self.logger.info(f"Compacted embedding segments for {collection}: {rows} rows")
+        return rows
+
+    def resync(
+        self,
+        collection: str,
+        mongo_collection,
+        batch_size: int = 10000,
+        query: Optional[dict] = None,
+        model: Optional[str] = None,
+    ) -> int:
+        """
+        Rebuild a collection's segments from the embeddings stored in Mongo,
+        optionally restricted by query (e.g. to the vectors of one model)
+        """
+        cursor = mongo_collection.find(
+            {**STORED_EMBEDDING_QUERY, **(query or {})},
+            {"_id": 1, "user_id": 1, "embedding": 1},
+        ).batch_size(batch_size)
+        rows = (
+            (str(d["_id"]), d.get("user_id"), decode_embedding(d["embedding"]))
+            for d in cursor
+        )
+
+        first = next(rows, None)
+        dim = len(first[2]) if first else None
+        documents = (
+            row
+            for row in itertools.chain([first] if first else [], rows)
+            if len(row[2]) == dim
+        )
+
+        def batches():
+            batch = []
+            for row in documents:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        with self._write_lock(collection):
+            rows = self._rebuild(collection, dim, batches(), model)
+        self.logger.info(f"Resynced embedding segments for {collection}: {rows} rows")
+        return rows
+
+
+_shared_store: Optional[EmbeddingSegmentStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_segment_store() -> EmbeddingSegmentStore:
+    """Process-wide segment store shared by every MongoManager instance"""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = EmbeddingSegmentStore()
+        return _shared_store
@@ -0,0 +1,67 @@
+from typing import Iterator, NamedTuple, Optional, TextIO, Tuple
+from datetime import date
+import json
+
+# Endpoint of the summary requests in OpenAI batch input files
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def summary_custom_id(job: str, user_id: str, day: date) -> str:
+    """Deterministic id of the summary request of a user's day, e.g. summary|daily|u1|2024-01-15"""
+    return f"summary|{job}|{user_id}|{day.isoformat()}"
+
+
+def parse_custom_id(custom_id: str) -> Tuple[str, str, date]:
+    """(job, user_id, day) of a summary_custom_id"""
+    prefix, job, *user_parts, day = custom_id.split("|")
+    if prefix != "summary" or not user_parts:
+        raise ValueError(f"Not a summary request id: {custom_id}")
+    return job, "|".join(user_parts), date.fromisoformat(day)
+
+
+def write_request(
+    file: TextIO, job: str, user_id: str, day: date, model: str, prompt: str
+) -> str:
+    """Append one batch input line for a summary prompt; returns its custom_id"""
+    custom_id = summary_custom_id(job, user_id, day)
+    line = {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {"model": model, "messages": [{"role": "user", "content": prompt}]},
+    }
+    file.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return custom_id
+
+
+class BatchResult(NamedTuple):
+    """A line of a batch output file"""
+
+    job: str
+    user_id: str
+    day: date
+    content: Optional[str]  # None when the request failed
+    error: Optional[str]
+    prompt_tokens: int
+
+
+def read_results(file: TextIO) -> Iterator[BatchResult]:
+    """Parse the summary results of a batch output (or error) file"""
+    for line in file:
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        job, user_id, day = parse_custom_id(result["custom_id"])
+        response = result.get("response") or {}
+        body = response.get("body") or {}
+        content, error = None, None
+        if result.get("error"):
+            error = result["error"].get("message") or str(result["error"])
+        elif response.get("status_code") != 200:
+            error = (body.get("error") or {}).get("message") or (
+                f"HTTP {response.get('status_code')}"
+            )
+        else:
+            content = body["choices"][0]["message"]["content"]
+        prompt_tokens = (body.get("usage") or {}).get("prompt_tokens", 0)
+        yield BatchResult(job, user_id, day, content, error, prompt_tokens)
@@ -0,0 +1,222 @@
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+import logging
+import random
+import threading
+import time
+from src.models import SummaryEntry, SummaryRunReport
+from src.metrics import get_metrics
+from src.tokens import count_tokens
+from src.CONSTANTS import (
+    SUMMARY_WORKERS,
+    SUMMARY_REQUESTS_PER_MINUTE,
+    SUMMARY_TOKENS_PER_MINUTE,
+    SUMMARY_OUTPUT_TOKENS_ESTIMATE,
+    SUMMARY_RETRIES,
+    SUMMARY_CHECKPOINT_BATCH,
+    SUMMARY_PROGRESS_INTERVAL,
+)
+
+if TYPE_CHECKING:
+    from src.chat_manager import SummaryManager
+    from src.mongo import MongoManager
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until amount is available and take it; returns the seconds waited"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def pending_users(
+    mongo_manager: "MongoManager",
+    job: str,
+    day: date,
+    finished_statuses: Sequence[str] = ("done", "empty"),
+) -> Tuple[List[str], int]:
+    """
+    Users still to process for a job and period start day, and the total
+    number of users. The job is the level of the summaries it produces.
+    """
+    users = [user["user_id"] for user in mongo_manager.get_users(projection="ids-only")]
+    finished = set(mongo_manager.get_summary_checkpoints(job, day, finished_statuses))
+    # Summaries stored by a run that crashed before checkpointing them
+    finished |= mongo_manager.get_summarized_users(day, day, level=job)
+    return [user for user in users if user not in finished], len(users)
+
+
+def store_and_checkpoint(
+    summary_manager: "SummaryManager",
+    job: str,
+    day: date,
+    pending: List[SummaryEntry],
+    outcomes: Dict[str, dict],
+    report: SummaryRunReport,
+) -> None:
+    """Store finished summaries, then record them and the other outcomes as checkpoints"""
+    if pending:
+        bulk_report = summary_manager._store_summaries(pending, day)
+        failed = {error.index: error.message for error in bulk_report.errors}
+        for i, summary in enumerate(pending):
+            if i in failed:
+                report.failed += 1
+                outcomes[summary.user_id] = {"status": "failed", "error": failed[i]}
+            else:
+                report.summarized += 1
+                outcomes[summary.user_id] = {
+                    "status": "done",
+                    "summary_id": summary.summary_id,
+                }
+    summary_manager.mongo_manager.set_summary_checkpoints(job, day, outcomes)
+
+
+class SummaryEngine:
+    """
+    Runs a summary job over every user with a pool of workers. The job is
+    the summary level: "daily" summarizes the conversations of a day,
+    "weekly" and "monthly" roll up the summaries of the previous level.
+
+    Model calls share a requests-per-minute and a tokens-per-minute bucket
+    and are retried with jittered backoff. The outcome of each user is
+    checkpointed in Mongo with its summary, so a rerun of the same job and
+    day only processes the users that did not finish.
+    """
+
+    def __init__(
+        self,
+        summary_manager: "SummaryManager",
+        workers: int = SUMMARY_WORKERS,
+        requests_per_minute: float = SUMMARY_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = SUMMARY_TOKENS_PER_MINUTE,
+        max_retries: int = SUMMARY_RETRIES,
+        checkpoint_batch: int = SUMMARY_CHECKPOINT_BATCH,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.summary_manager = summary_manager
+        self.mongo_manager = summary_manager.mongo_manager
+        self.workers = workers
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.checkpoint_batch = checkpoint_batch
+        self.metrics = get_metrics()
+        self._report_lock = threading.Lock()
+
+    def _acquire(self, prompt: str, report: SummaryRunReport) -> None:
+        """Wait for the rate limits before a model call"""
+        prompt_tokens = count_tokens(prompt)
+        waited = self.requests.acquire(1)
+        waited += self.tokens.acquire(prompt_tokens + SUMMARY_OUTPUT_TOKENS_ESTIMATE)
+        self.metrics.observe("summary.rate_limit_wait", waited)
+        with self._report_lock:
+            report.prompt_tokens += prompt_tokens
+
+    def _summarize(
+        self, user_id: str, day: date, model: str, report: SummaryRunReport
+    ) -> Optional[SummaryEntry]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.summary_manager.summarize_user(
+                    user_id,
+                    day,
+                    model,
+                    acquire=lambda prompt: self._acquire(prompt, report),
+                    level=report.job,
+                )
+            except Exception as e:
+                self.metrics.increment("summary.failures")
+                if attempt == self.max_retries:
+                    raise
+                delay = 2**attempt + random.random()
+                self.logger.warning(
+                    f"Summary of user {user_id} on {day} failed, retrying in {delay:.1f}s: {e}"
+                )
+                time.sleep(delay)
+
+    def _log_progress(self, report: SummaryRunReport, total: int, started: float) -> None:
+        done = report.summarized + report.empty + report.failed
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0.0
+        eta = (total - done) / rate if rate else 0.0
+        self.metrics.gauge(f"summary.{report.job}.progress", done / total if total else 1.0)
+        self.logger.info(
+            f"{report.job} summaries for {report.day}: {done}/{total} users "
+            f"({report.summarized} summarized, {report.empty} empty, {report.failed} failed), "
+            f"{rate:.2f} users/s, ETA {eta:.0f}s"
+        )
+
+    def run(self, job: str, day: date, model: str) -> SummaryRunReport:
+        """Summarize the period starting on day of every user not yet checkpointed for it"""
+        started = time.monotonic()
+        todo, total = pending_users(self.mongo_manager, job, day)
+        report = SummaryRunReport(job=job, day=day, users=total, skipped=total - len(todo))
+        self.logger.info(
+            f"Starting {job} summaries for {day}: {len(todo)} users, "
+            f"{report.skipped} already done, {self.workers} workers"
+        )
+
+        pending: List[SummaryEntry] = []
+        outcomes: Dict[str, dict] = {}
+        last_progress = started
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self._summarize, user, day, model, report): user
+                for user in todo
+            }
+            for future in as_completed(futures):
+                user = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    self.logger.error(f"Failed to generate summary for user {user}: {e}")
+                    report.failed += 1
+                    outcomes[user] = {"status": "failed", "error": str(e)}
+                else:
+                    if summary is None:
+                        report.empty += 1
+                        outcomes[user] = {"status": "empty"}
+                    else:
+                        pending.append(summary)
+
+                if len(pending) + len(outcomes) >= self.checkpoint_batch:
+                    store_and_checkpoint(
+                        self.summary_manager, job, day, pending, outcomes, report
+                    )
+                    pending, outcomes = [], {}
+                if time.monotonic() - last_progress >= SUMMARY_PROGRESS_INTERVAL:
+                    self._log_progress(report, len(todo), started)
+                    last_progress = time.monotonic()
+        store_and_checkpoint(self.summary_manager, job, day, pending, outcomes, report)
+
+        report.elapsed_seconds = time.monotonic() - started
+        processed = report.summarized + report.empty + report.failed
+        report.users_per_second = (
+            processed / report.elapsed_seconds if report.elapsed_seconds else 0.0
+        )
+        self._log_progress(report, len(todo), started)
+        self.logger.info(f"Finished {job} summaries: {report}")
+        return report
@@ -0,0 +1,272 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from src.CONSTANTS import (
+    BM25_K1,
+    BM25_B,
+    KEYWORDS_PER_DOCUMENT,
+    RRF_K,
+    VECTOR_INDEX_TTL_SECONDS,
+)
+
+# Field holding the searchable text of each collection
+TEXT_FIELDS = {
+    "conversations": "text_content",
+    "summaries": "summary",
+    "documents": "text",
+    "conversation_chunks": "text",
+    "document_chunks": "text",
+}
+
+ITALIAN_STOPWORDS = frozenset(
+    """
+    a ad agli ai al alla alle allo anche avere abbia abbiamo avete aveva avevo ben
+    c che chi ci cio come con contro cosa cui da dagli dai dal dalla dalle dallo
+    degli dei del dell della delle dello di dov dove e ed era erano essere fa fare
+    fino fra gli ha hai hanno ho i il in io l la le lei li lo loro lui ma me mi mia
+    mie miei mio molto ne negli nei nel nell nella nelle nello no noi non nostra
+    nostre nostri nostro o per perche piu po poi qual quale quali quando quanto
+    quella quelle quelli quello questa queste questi questo se sei si sia siamo
+    siete sono sta stata stato su sua sue sugli sui sul sull sulla sulle sullo suo
+    suoi ti tra tu tua tue tuo tuoi tutti tutto un una uno vi voi vostra vostro
+    user assistant system
+    """.split()
+)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(
+        char
+        for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    )
+
+
+def stem(token: str) -> str:
+    """Light Italian stemmer (Savoy): strips gender/number inflection only"""
+    if len(token) < 6:
+        return token
+    last, previous = token[-1], token[-2]
+    if last in "ei" and previous in "ih":
+        return token[:-2]
+    if last in "ao" and previous == "i":
+        return token[:-2]
+    if last in "eiao":
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase, accent-fold and stem text, dropping Italian stopwords.
+    Elisions such as "dell'ospedale" split on the apostrophe.
+    """
+    if not text:
+        return []
+    tokens = _TOKEN_PATTERN.findall(_strip_accents(text.lower()))
+    return [stem(token) for token in tokens if token not in ITALIAN_STOPWORDS]
+
+
+def extract_keywords(text: Optional[str], n: int = KEYWORDS_PER_DOCUMENT) -> List[str]:
+    """Most frequent stemmed terms of a text, used to fill the `keywords` field"""
+    counts = Counter(token for token in tokenize(text or "") if len(token) > 2)
+    return [term for term, _ in counts.most_common(n)]
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[Sequence[Tuple[str, float]]], k: int = RRF_K
+) -> List[Tuple[str, float]]:
+    """Fuse several ranked (doc_id, score) lists by summing 1 / (k + rank)"""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Partition:
+    """Inverted index with BM25 statistics for one (collection, user_id) partition"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.terms: Dict[str, Counter] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.loaded_at = time.monotonic()
+        self.lock = threading.RLock()
+
+    def add(self, doc_id: str, tokens: List[str]) -> None:
+        with self.lock:
+            self.remove(doc_id)
+            counts = Counter(tokens)
+            self.terms[doc_id] = counts
+            self.lengths[doc_id] = len(tokens)
+            self.total_length += len(tokens)
+            for term, frequency in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = frequency
+
+    def extend(self, doc_id: str, tokens: List[str]) -> None:
+        """Add tokens to a document's existing counts, e.g. new chat messages"""
+        with self.lock:
+            counts = self.terms.setdefault(doc_id, Counter())
+            new_counts = Counter(tokens)
+            counts.update(new_counts)
+            self.lengths[doc_id] = self.lengths.get(doc_id, 0) + len(tokens)
+            self.total_length += len(tokens)
+            for term in new_counts:
+                self.postings.setdefault(term, {})[doc_id] = counts[term]
+
+    def remove(self, doc_id: str) -> None:
+        with self.lock:
+            counts = self.terms.pop(doc_id, None)
+            if counts is None:
+                return
+            self.total_length -= self.lengths.pop(doc_id)
+            for term in counts:
+                postings = self.postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self.postings[term]
+
+    def search(
+        self, query_tokens: List[str], k: int, k1: float, b: float
+    ) -> List[Tuple[str, float]]:
+        """Score only the documents sharing at least one term with the query"""
+        with self.lock:
+            n_docs = len(self.terms)
+            if not n_docs:
+                return []
+            average_length = self.total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(query_tokens):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self.lengths[doc_id]
+                    norm = frequency + k1 * (1 - b + b * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (k1 + 1) / norm
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class TextIndex:
+    """
+    In-process BM25 keyword index over the text fields of the Mongo collections,
+    partitioned like the VectorIndex by collection and user_id.
+    """
+
+    def __init__(
+        self,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        ttl_seconds: float = VECTOR_INDEX_TTL_SECONDS,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.k1 = k1
+        self.b = b
+        self.ttl_seconds = ttl_seconds
+        self._partitions: Dict[Tuple[str, Optional[str]], BM25Partition] = {}
+        self._owners: Dict[Tuple[str, str], Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def is_loaded(self, collection: str, user_id: Optional[str] = None) -> bool:
+        partition = self._partitions.get((collection, user_id))
+        if partition is None:
+            return False
+        return time.monotonic() - partition.loaded_at < self.ttl_seconds
+
+    def load(
+        self,
+        collection: str,
+        user_id: Optional[str],
+        ids: Sequence[str],
+        texts: Sequence[Optional[str]],
+        user_ids: Optional[Sequence[Optional[str]]] = None,
+    ) -> None:
+        """Replace a partition with the given documents"""
+        partition = BM25Partition()
+        for doc_id, text in zip(ids, texts):
+            partition.add(doc_id, tokenize(text or ""))
+        with self._lock:
+            self._partitions[(collection, user_id)] = partition
+            for i, doc_id in enumerate(ids):
+                owner = user_ids[i] if user_ids is not None else user_id
+                self._owners[(collection, doc_id)] = owner
+        self.logger.debug(
+            f"Loaded text partition {collection}/{user_id}: {len(ids)} documents"
+        )
+
+    def _partitions_for(self, collection: str, user_id: Optional[str]):
+        return [
+            partition
+            for partition in (
+                self._partitions.get((collection, key)) for key in {user_id, None}
+            )
+            if partition is not None
+        ]
+
+    def upsert(
+        self, collection: str, user_id: Optional[str], doc_id: str, text: Optional[str]
+    ) -> None:
+        """Index or re-index one document in every loaded partition it belongs to"""
+        tokens = tokenize(text or "")
+        with self._lock:
+            self._owners[(collection, doc_id)] = user_id
+            partitions = self._partitions_for(collection, user_id)
+        for partition in partitions:
+            partition.add(doc_id, tokens)
+
+    def append(
+        self, collection: str, user_id: Optional[str], doc_id: str, text: Optional[str]
+    ) -> None:
+        """Index text appended to a document without re-tokenizing what it had"""
+        tokens = tokenize(text or "")
+        with self._lock:
+            self._owners[(collection, doc_id)] = user_id
+            partitions = self._partitions_for(collection, user_id)
+        for partition in partitions:
+            partition.extend(doc_id, tokens)
+
+    def remove(self, collection: str, doc_id: str) -> None:
+        with self._lock:
+            user_id = self._owners.pop((collection, doc_id), None)
+            partitions = self._partitions_for(collection, user_id)
+        for partition in partitions:
+            partition.remove(doc_id)
+
+    def invalidate(self, collection: Optional[str] = None) -> None:
+        with self._lock:
+            for key in list(self._partitions):
+                if collection is None or key[0] == collection:
+                    del self._partitions[key]
+
+    def search(
+        self, collection: str, user_id: Optional[str], text_query: str, k: int
+    ) -> List[Tuple[str, float]]:
+        """Return the top-k (doc_id, BM25 score) pairs of a loaded partition"""
+        partition = self._partitions.get((collection, user_id))
+        query_tokens = tokenize(text_query)
+        if partition is None or not query_tokens:
+            return []
+        return partition.search(query_tokens, k, self.k1, self.b)
+
+
+_shared_index: Optional[TextIndex] = None
+_shared_lock = threading.Lock()
+
+
+def get_text_index() -> TextIndex:
+    """Process-wide index shared by every MongoManager instance"""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = TextIndex()
+        return _shared_index
@@ -0,0 +1,87 @@
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, Deque, Iterable, List, Optional, Tuple
+import logging
+import tiktoken
+from src.CONSTANTS import DEFAULT_MODEL, MAX_CONV_TOKENS
+
+if TYPE_CHECKING:
+    from src.models import Message
+
+logger = logging.getLogger(__name__)
+
+# Chat formatting tokens added by the API around every message
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_or_encoding: str = DEFAULT_MODEL) -> tiktoken.Encoding:
+    """
+    Process-wide tokenizer registry: each encoding is loaded once.
+    Accepts a model name ("gpt-4o") or an encoding name ("cl100k_base").
+    """
+    try:
+        return tiktoken.encoding_for_model(model_or_encoding)
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding(model_or_encoding)
+    except ValueError:
+        logger.warning(f"Unknown tokenizer {model_or_encoding}, using o200k_base")
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    return len(get_encoding(model).encode(text)) if text else 0
+
+
+class TokenLedger:
+    """
+    Running token budget of a chat history.
+
+    Keeps the first system message plus the longest suffix of the other
+    messages that fits in max_tokens, with a running total, so extending the
+    history costs O(new messages). Later system messages (e.g. error notes)
+    are not sent to the model, as before.
+    """
+
+    def __init__(self, max_tokens: int = MAX_CONV_TOKENS, model: str = DEFAULT_MODEL):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.system: Optional["Message"] = None
+        self._system_tokens = 0
+        self._messages: Deque[Tuple["Message", int]] = deque()
+        self._total = 0
+
+    @property
+    def total(self) -> int:
+        """Tokens of the current window, system message included"""
+        return self._system_tokens + self._total
+
+    def _cost(self, message: "Message") -> int:
+        return message.token_count(self.model) + MESSAGE_TOKEN_OVERHEAD
+
+    def set_system(self, message: "Message") -> None:
+        self.system = message
+        self._system_tokens = self._cost(message)
+        self._trim()
+
+    def extend(self, messages: Iterable["Message"]) -> None:
+        for message in messages:
+            if message.role == "system":
+                if self.system is None:
+                    self.set_system(message)
+                continue
+            tokens = self._cost(message)
+            self._messages.append((message, tokens))
+            self._total += tokens
+        self._trim()
+
+    def _trim(self) -> None:
+        while self._messages and self.total > self.max_tokens:
+            _, tokens = self._messages.popleft()
+            self._total -= tokens
+
+    def window(self) -> List["Message"]:
+        messages = [message for message, _ in self._messages]
+        return [self.system] + messages if self.system else messages
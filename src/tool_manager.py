@@ -1,22 +1,85 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from openai.types.chat import ChatCompletionMessageToolCall
 from src.models import Message
+from src.metrics import get_metrics
+from src.CONSTANTS import TOOL_WORKERS, TOOL_TIMEOUT, TOOL_MAX_RESULT_CHARS
 from inspect import signature, Parameter
 import docstring_parser
 import json
+import logging
+import threading
+import time
 
 class ToolManager:
-    def __init__(self):
+    """
+    Registry of the tools the model can call.
+
+    The tool calls of a model turn run concurrently on a bounded thread
+    pool. Each call has a timeout, counted from when a worker starts it, and
+    results longer than max_result_chars are truncated. Latency, errors and
+    timeouts are published to the process metrics under "tool.*".
+
+    Python threads cannot be killed, so a call that times out keeps its
+    worker until the tool returns. These abandoned calls are counted
+    (gauge "tool.abandoned"); while they hold every worker, new tool calls
+    are answered with an error instead of being queued.
+    """
+
+    def __init__(
+        self,
+        workers: int = TOOL_WORKERS,
+        timeout: float = TOOL_TIMEOUT,
+        max_result_chars: int = TOOL_MAX_RESULT_CHARS,
+    ):
+        self.logger = logging.getLogger(__name__)
         self.tools: Dict[str, callable] = {}
+        self.timeouts: Dict[str, float] = {}
+        self.workers = workers
+        self.timeout = timeout
+        self.max_result_chars = max_result_chars
+        self.metrics = get_metrics()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # Calls that timed out but still hold a worker
+        self._abandoned = 0
+        self._abandoned_lock = threading.Lock()
 
-    def register_tool(self, name: str, tool_function: callable) -> None:
-        """Register a new tool with the manager"""
+    def register_tool(
+        self, name: str, tool_function: callable, timeout: Optional[float] = None
+    ) -> None:
+        """Register a new tool with the manager, optionally with its own timeout"""
         self.tools[name] = tool_function
+        if timeout is not None:
+            self.timeouts[name] = timeout
+
+    def definitions(self) -> List[dict]:
+        """Tool definitions of the registered tools for the chat completions API"""
+        return [
+            {
+                "type": "function",
+                "function": {**json.loads(self.get_tool_definition(tool)), "name": name},
+            }
+            for name, tool in self.tools.items()
+        ]
+
+    def _format_result(self, result: Any) -> str:
+        """Tool result as message content, capped at max_result_chars"""
+        if isinstance(result, str):
+            content = result
+        else:
+            content = json.dumps(result, default=str, ensure_ascii=False)
+        if len(content) > self.max_result_chars:
+            self.metrics.increment("tool.truncated_results")
+            content = (
+                content[: self.max_result_chars]
+                + f"... [truncated, {len(content)} characters]"
+            )
+        return content
 
     def apply_tool(self, tool_call: ChatCompletionMessageToolCall) -> Message:
         """Apply the appropriate tool based on the tool call and return a Message"""
         tool_name = tool_call.function.name
-        arguments = tool_call.function.arguments
 
         if tool_name not in self.tools:
             return Message(
@@ -25,19 +88,114 @@ class ToolManager:
                 tool_call_id=tool_call.id
             )
 
+        started = time.perf_counter()
         try:
-            result = self.tools[tool_name](**eval(arguments))
+            arguments = json.loads(tool_call.function.arguments or "{}")
+            if not isinstance(arguments, dict):
+                raise ValueError("arguments must be a JSON object")
+            result = self.tools[tool_name](**arguments)
             return Message(
                 role="tool",
-                content=str(result),
+                content=self._format_result(result),
                 tool_call_id=tool_call.id
             )
         except Exception as e:
+            self.metrics.increment("tool.errors")
+            self.logger.warning(f"Tool '{tool_name}' failed: {str(e)}")
             return Message(
                 role="tool",
                 content=f"Error executing tool '{tool_name}': {str(e)}",
                 tool_call_id=tool_call.id
             )
+        finally:
+            self.metrics.observe(f"tool.{tool_name}.latency", time.perf_counter() - started)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="tool"
+                )
+            return self._executor
+
+    def _error(self, tool_call: ChatCompletionMessageToolCall, reason: str) -> Message:
+        return Message(
+            role="tool",
+            content=f"Error executing tool '{tool_call.function.name}': {reason}",
+            tool_call_id=tool_call.id
+        )
+
+    def _release(self, _future) -> None:
+        """Done callback of an abandoned call: its worker is free again"""
+        with self._abandoned_lock:
+            self._abandoned -= 1
+            self.metrics.gauge("tool.abandoned", self._abandoned)
+
+    def apply_tools(self, tool_calls: List[ChatCompletionMessageToolCall]) -> List[Message]:
+        """
+        Run the tool calls of a model turn concurrently and return their
+        messages in the same order.
+
+        The timeout of a call counts from when a worker starts it. A call
+        still running then is answered with an error and abandoned. A call
+        still queued once the calls ahead of it have had their full timeouts
+        (i.e. workers are held by abandoned calls) is cancelled.
+        """
+        with self._abandoned_lock:
+            free_workers = self.workers - self._abandoned
+        if free_workers <= 0:
+            self.metrics.increment("tool.rejected", len(tool_calls))
+            self.logger.error(
+                f"All {self.workers} tool workers are held by timed out calls"
+            )
+            return [
+                self._error(tool_call, "no tool worker available")
+                for tool_call in tool_calls
+            ]
+
+        executor = self._get_executor()
+        started = [threading.Event() for _ in tool_calls]
+        start_times = [0.0] * len(tool_calls)
+
+        def run(i: int) -> Message:
+            start_times[i] = time.monotonic()
+            started[i].set()
+            return self.apply_tool(tool_calls[i])
+
+        timeouts = [
+            self.timeouts.get(tool_call.function.name, self.timeout)
+            for tool_call in tool_calls
+        ]
+        submitted = time.monotonic()
+        futures = [executor.submit(run, i) for i in range(len(tool_calls))]
+        messages = []
+        for i, (tool_call, future) in enumerate(zip(tool_calls, futures)):
+            tool_name = tool_call.function.name
+            timeout = timeouts[i]
+            # Call i starts at the latest after the calls ahead of it, taking
+            # free_workers at a time, have each run for the longest timeout
+            queue_deadline = submitted + (i // free_workers + 1) * max(timeouts)
+            if not started[i].wait(max(0, queue_deadline - time.monotonic())):
+                if future.cancel():
+                    self.metrics.increment("tool.queue_timeouts")
+                    self.logger.warning(f"Tool '{tool_name}' never got a worker")
+                    messages.append(self._error(tool_call, "no tool worker available"))
+                    continue
+                started[i].wait()
+            try:
+                messages.append(
+                    future.result(timeout=max(0, start_times[i] + timeout - time.monotonic()))
+                )
+            except FutureTimeoutError:
+                self.metrics.increment("tool.timeouts")
+                self.logger.warning(f"Tool '{tool_name}' timed out after {timeout}s")
+                with self._abandoned_lock:
+                    self._abandoned += 1
+                    self.metrics.gauge("tool.abandoned", self._abandoned)
+                future.add_done_callback(self._release)
+                messages.append(self._error(tool_call, f"timed out after {timeout}s"))
+        return messages
+
     @staticmethod
     def get_tool_definition(tool: callable) -> str:
         """Get the definition of a tool function schema for OpenAI tool definition as a string"""
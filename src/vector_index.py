@@ -0,0 +1,267 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+import numpy as np
+from src.CONSTANTS import (
+    VECTOR_INDEX_EXACT_THRESHOLD,
+    VECTOR_INDEX_NPROBE,
+    VECTOR_INDEX_TTL_SECONDS,
+)
+
+
+class VectorPartition:
+    """Float32 embedding matrix for one (collection, user_id) partition"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.matrix = np.empty((0, dim), dtype=np.float32)
+        self.size = 0
+        self.loaded_at = time.monotonic()
+        self.lock = threading.RLock()
+
+        # IVF state, only trained once the partition outgrows exact search
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+
+    @classmethod
+    def from_rows(cls, ids: Sequence[str], matrix: np.ndarray) -> "VectorPartition":
+        partition = cls(matrix.shape[1])
+        partition.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        partition.assignments = np.full(len(ids), -1, dtype=np.int32)
+        partition.ids = list(ids)
+        partition.positions = {doc_id: i for i, doc_id in enumerate(partition.ids)}
+        partition.size = len(partition.ids)
+        return partition
+
+    def _reserve(self, rows: int) -> None:
+        capacity = self.matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 64)
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        matrix[: self.size] = self.matrix[: self.size]
+        assignments = np.full(new_capacity, -1, dtype=np.int32)
+        assignments[: self.size] = self.assignments[: self.size]
+        self.matrix, self.assignments = matrix, assignments
+
+    def _make_writeable(self) -> None:
+        # Partitions loaded from a read-only mmap are copied on first write
+        if not self.matrix.flags.writeable:
+            self.matrix = np.array(self.matrix[: self.size], dtype=np.float32)
+
+    def _assign(self, rows: np.ndarray) -> np.ndarray:
+        return np.argmax(rows @ self.centroids.T, axis=1).astype(np.int32)
+
+    def upsert_many(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        with self.lock:
+            self._make_writeable()
+            for doc_id, vector in zip(ids, vectors):
+                position = self.positions.get(doc_id)
+                if position is None:
+                    self._reserve(self.size + 1)
+                    position = self.size
+                    self.ids.append(doc_id)
+                    self.positions[doc_id] = position
+                    self.size += 1
+                self.matrix[position] = vector
+                if self.centroids is not None:
+                    self.assignments[position] = self._assign(vector[None, :])[0]
+
+    def remove(self, doc_id: str) -> None:
+        with self.lock:
+            position = self.positions.pop(doc_id, None)
+            if position is None:
+                return
+            self._make_writeable()
+            last = self.size - 1
+            if position != last:
+                moved_id = self.ids[last]
+                self.matrix[position] = self.matrix[last]
+                self.assignments[position] = self.assignments[last]
+                self.ids[position] = moved_id
+                self.positions[moved_id] = position
+            self.ids.pop()
+            self.size -= 1
+
+    def train(self, iterations: int = 10, seed: int = 0) -> None:
+        """Cluster the partition into sqrt(n) inverted lists with k-means"""
+        with self.lock:
+            vectors = self.matrix[: self.size]
+            n_lists = max(1, int(np.sqrt(self.size)))
+            rng = np.random.default_rng(seed)
+            sample_size = min(self.size, n_lists * 256)
+            sample = vectors[rng.choice(self.size, sample_size, replace=False)]
+            centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for list_id in range(n_lists):
+                    members = sample[labels == list_id]
+                    if len(members):
+                        centroids[list_id] = members.mean(axis=0)
+
+            self.centroids = centroids
+            self.assignments[: self.size] = self._assign(vectors)
+            self.trained_size = self.size
+
+    def search(
+        self, query: np.ndarray, k: int, exact_threshold: int, nprobe: int
+    ) -> List[Tuple[str, float]]:
+        with self.lock:
+            if self.size == 0:
+                return []
+
+            if self.size <= exact_threshold:
+                rows = None
+                scores = self.matrix[: self.size] @ query
+            else:
+                if self.centroids is None or self.size > 2 * self.trained_size:
+                    self.train()
+                list_scores = self.centroids @ query
+                probe = np.argsort(-list_scores)[:nprobe]
+                rows = np.flatnonzero(np.isin(self.assignments[: self.size], probe))
+                scores = self.matrix[rows] @ query
+
+            if k < len(scores):
+                top = np.argpartition(-scores, k)[:k]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(-scores[top])]
+            positions = top if rows is None else rows[top]
+            return [
+                (self.ids[position], float(score))
+                for position, score in zip(positions, scores[top])
+            ]
+
+
+class VectorIndex:
+    """
+    In-process top-k index over the embeddings of the Mongo collections.
+
+    Vectors are kept as float32 matrices partitioned by collection and user_id,
+    plus one collection-wide partition (user_id None) for unfiltered searches.
+    Small partitions are searched exactly, large ones through an IVF index.
+    """
+
+    def __init__(
+        self,
+        exact_threshold: int = VECTOR_INDEX_EXACT_THRESHOLD,
+        nprobe: int = VECTOR_INDEX_NPROBE,
+        ttl_seconds: float = VECTOR_INDEX_TTL_SECONDS,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.exact_threshold = exact_threshold
+        self.nprobe = nprobe
+        self.ttl_seconds = ttl_seconds
+        self._partitions: Dict[Tuple[str, Optional[str]], VectorPartition] = {}
+        self._owners: Dict[Tuple[str, str], Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def is_loaded(self, collection: str, user_id: Optional[str] = None) -> bool:
+        partition = self._partitions.get((collection, user_id))
+        if partition is None:
+            return False
+        return time.monotonic() - partition.loaded_at < self.ttl_seconds
+
+    def load(
+        self,
+        collection: str,
+        user_id: Optional[str],
+        ids: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        user_ids: Optional[Sequence[Optional[str]]] = None,
+    ) -> None:
+        """Replace a partition with the given rows"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or not len(matrix):
+            matrix = np.empty((0, 0), dtype=np.float32)
+        partition = VectorPartition.from_rows(ids, matrix)
+        with self._lock:
+            self._partitions[(collection, user_id)] = partition
+            for i, doc_id in enumerate(ids):
+                owner = user_ids[i] if user_ids is not None else user_id
+                self._owners[(collection, doc_id)] = owner
+        self.logger.debug(
+            f"Loaded vector partition {collection}/{user_id}: {len(ids)} rows"
+        )
+
+    def upsert(
+        self,
+        collection: str,
+        user_id: Optional[str],
+        doc_id: str,
+        embedding: Sequence[float],
+    ) -> None:
+        """Insert or replace one vector in every loaded partition it belongs to"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._owners[(collection, doc_id)] = user_id
+            partitions = [
+                self._partitions.get((collection, key)) for key in {user_id, None}
+            ]
+        for partition in partitions:
+            if partition is None:
+                continue
+            if partition.dim and partition.dim != len(vector):
+                self.logger.warning(
+                    f"Skipping vector for {collection}/{doc_id}: dimension "
+                    f"{len(vector)} does not match partition dimension {partition.dim}"
+                )
+                continue
+            if not partition.dim:
+                partition.dim = len(vector)
+                partition.matrix = np.empty((0, partition.dim), dtype=np.float32)
+            partition.upsert_many([doc_id], vector[None, :])
+
+    def remove(self, collection: str, doc_id: str) -> None:
+        with self._lock:
+            user_id = self._owners.pop((collection, doc_id), None)
+            partitions = [
+                self._partitions.get((collection, key)) for key in {user_id, None}
+            ]
+        for partition in partitions:
+            if partition is not None:
+                partition.remove(doc_id)
+
+    def invalidate(self, collection: Optional[str] = None) -> None:
+        with self._lock:
+            for key in list(self._partitions):
+                if collection is None or key[0] == collection:
+                    del self._partitions[key]
+
+    def search(
+        self,
+        collection: str,
+        user_id: Optional[str],
+        embedding_query: Sequence[float],
+        k: int,
+    ) -> List[Tuple[str, float]]:
+        """Return the top-k (doc_id, dot product) pairs of a loaded partition"""
+        partition = self._partitions.get((collection, user_id))
+        if partition is None or not partition.size:
+            return []
+        query = np.asarray(embedding_query, dtype=np.float32)
+        if len(query) != partition.dim:
+            self.logger.warning(
+                f"Query dimension {len(query)} does not match partition "
+                f"{collection}/{user_id} dimension {partition.dim}"
+            )
+            return []
+        return partition.search(query, k, self.exact_threshold, self.nprobe)
+
+
+_shared_index: Optional[VectorIndex] = None
+_shared_lock = threading.Lock()
+
+
+def get_vector_index() -> VectorIndex:
+    """Process-wide index shared by every MongoManager instance"""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = VectorIndex()
+        return _shared_index
@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Set, Tuple
+import atexit
+import logging
+import threading
+import time
+from src.metrics import get_metrics
+from src.CONSTANTS import (
+    WRITE_BEHIND_WORKERS,
+    WRITE_BEHIND_MAX_PENDING,
+    WRITE_BEHIND_SHUTDOWN_TIMEOUT,
+)
+
+
+class WriteBehindQueue:
+    """
+    Background queue running persistence jobs off the request path.
+
+    Jobs are keyed (e.g. by session_id):
+    - at most one job per key runs at a time, so writes of a key stay ordered;
+    - a job submitted while another of the same key is still waiting replaces
+      it, so jobs must persist "everything not stored yet" rather than a delta;
+    - submit blocks while max_pending keys are waiting (backpressure).
+
+    Queue depth, flush latency (submit to completion), coalesced submissions
+    and failures are published to the process metrics under "write_behind.*".
+    """
+
+    def __init__(
+        self,
+        workers: int = WRITE_BEHIND_WORKERS,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics()
+        self.workers = workers
+        self.max_pending = max_pending
+        self._condition = threading.Condition()
+        self._pending: "OrderedDict[Hashable, Tuple[Callable[[], None], float]]" = (
+            OrderedDict()
+        )
+        self._in_flight: Set[Hashable] = set()
+        self._threads = []
+        self._closed = False
+
+    def _start(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._run, name=f"write-behind-{len(self._threads)}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key: Hashable, job: Callable[[], None]) -> None:
+        with self._condition:
+            waiting = False
+            # Rechecked after every wait: the queue may have been shut down, or
+            # another submit of the same key may have queued a job meanwhile
+            while True:
+                if self._closed:
+                    raise RuntimeError("WriteBehindQueue is shut down")
+                if key in self._pending:
+                    enqueued_at = self._pending[key][1]
+                    self._pending[key] = (job, enqueued_at)
+                    self.metrics.increment("write_behind.coalesced")
+                    return
+                if len(self._pending) < self.max_pending:
+                    break
+                if not waiting:
+                    waiting = True
+                    self.metrics.increment("write_behind.backpressure_waits")
+                    self.logger.warning(
+                        f"Write-behind queue full ({len(self._pending)} pending), waiting"
+                    )
+                self._condition.wait()
+
+            self._start()
+            self._pending[key] = (job, time.monotonic())
+            self.metrics.gauge("write_behind.queue_depth", len(self._pending))
+            self._condition.notify_all()
+
+    def _next_job(self) -> Optional[Tuple[Hashable, Callable[[], None], float]]:
+        """Pop the oldest waiting job whose key is not already running"""
+        with self._condition:
+            while True:
+                for key in self._pending:
+                    if key not in self._in_flight:
+                        job, enqueued_at = self._pending.pop(key)
+                        self._in_flight.add(key)
+                        self.metrics.gauge(
+                            "write_behind.queue_depth", len(self._pending)
+                        )
+                        self._condition.notify_all()
+                        return key, job, enqueued_at
+                if self._closed and not self._pending:
+                    return None
+                self._condition.wait()
+
+    def _run(self) -> None:
+        while (item := self._next_job()) is not None:
+            key, job, enqueued_at = item
+            try:
+                job()
+            except Exception as e:
+                self.metrics.increment("write_behind.failures")
+                self.logger.error(
+                    f"Write-behind job for {key} failed: {str(e)}", exc_info=True
+                )
+            finally:
+                self.metrics.observe(
+                    "write_behind.flush_latency", time.monotonic() - enqueued_at
+                )
+                with self._condition:
+                    self._in_flight.discard(key)
+                    self._condition.notify_all()
+
+    def flush(self, key: Optional[Hashable] = None, timeout: Optional[float] = None) -> bool:
+        """Wait until the jobs of key (or all jobs) are done; False on timeout"""
+
+        def done():
+            if key is None:
+                return not self._pending and not self._in_flight
+            return key not in self._pending and key not in self._in_flight
+
+        with self._condition:
+            return self._condition.wait_for(done, timeout)
+
+    def shutdown(self, timeout: Optional[float] = WRITE_BEHIND_SHUTDOWN_TIMEOUT) -> None:
+        """Stop accepting jobs, drain the queue and stop the workers"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in self._threads):
+            self.logger.error("Write-behind queue did not drain before shutdown")
+
+
+_shared_queue: Optional[WriteBehindQueue] = None
+_shared_lock = threading.Lock()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """Process-wide write-behind queue, drained at interpreter exit"""
+    global _shared_queue
+    with _shared_lock:
+        if _shared_queue is None:
+            _shared_queue = WriteBehindQueue()
+            atexit.register(_shared_queue.shutdown)
+        return _shared_queue
@@ -0,0 +1,101 @@
+import re
+import tiktoken
+import pytest
+
+_WORD = re.compile(r"\s*\S+|\s+")
+
+
+class FakeEncoding:
+    """Offline stand-in for a tiktoken encoding: one token per word"""
+
+    name = "fake"
+
+    def encode(self, text, **kwargs):
+        return _WORD.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+# The real encodings are downloaded on first use, which the tests cannot rely on
+tiktoken.get_encoding = lambda name: FakeEncoding()
+tiktoken.encoding_for_model = lambda model: FakeEncoding()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_encodings():
+    from src.tokens import get_encoding
+
+    get_encoding.cache_clear()
+    yield
+
+
+@pytest.fixture
+def segment_store(tmp_path):
+    from src.segment_store import EmbeddingSegmentStore
+
+    return EmbeddingSegmentStore(root=str(tmp_path), max_segment_rows=4)
+
+
+@pytest.fixture
+def mongo_client(monkeypatch):
+    """A fresh in-memory Mongo shared by the sync and async managers of a test"""
+    import mongomock
+    import src.mongo
+
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(src.mongo, "get_mongo_client", lambda: client)
+    return client
+
+
+@pytest.fixture
+def mongo_manager(mongo_client, segment_store):
+    from src.mongo import MongoManager
+    from src.text_index import TextIndex
+    from src.vector_index import VectorIndex
+
+    return MongoManager(
+        vector_index=VectorIndex(),
+        segment_store=segment_store,
+        text_index=TextIndex(),
+        ensure_indexes=False,
+    )
+
+
+@pytest.fixture
+def embedding_generator():
+    from src.embedding import EmbeddingGenerator
+    from src.embedding_backends import EmbeddingBackend
+
+    class KeywordBackend(EmbeddingBackend):
+        """Deterministic 2-d embeddings: [1, 0] for texts about "testa", else [0, 1]"""
+
+        model = "text-embedding-3-small"
+        max_tokens = 8191
+
+        def truncate(self, text):
+            return text, len(text.split())
+
+        def embed(self, texts):
+            return [[1.0, 0.0] if "testa" in text else [0.0, 1.0] for text in texts]
+
+    return EmbeddingGenerator(backend=KeywordBackend(), use_cache=False)
+
+
+@pytest.fixture
+def chat_manager(monkeypatch, mongo_manager, embedding_generator):
+    from src.chat_manager import ChatManager
+    from src.write_behind import WriteBehindQueue
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return ChatManager(
+        mongo_manager, embedding_generator, "Mario Rossi", "s", "u1", WriteBehindQueue()
+    )
+
+
+@pytest.fixture
+def summary_manager(monkeypatch, mongo_manager, embedding_generator):
+    from src.chat_manager import SummaryManager
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return SummaryManager(mongo_manager, embedding_generator)
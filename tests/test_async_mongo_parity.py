@@ -0,0 +1,345 @@
+"""
+MongoManager and AsyncMongoManager run the same operations against two
+in-memory Mongo stand-ins (mongomock and mongomock-motor) and must return
+the same results.
+"""
+from datetime import date, datetime, timedelta
+import asyncio
+import pytest
+from bson import ObjectId
+from src.async_mongo import AsyncMongoManager
+from src.models import (
+    ChunkEntry,
+    DocumentEntry,
+    Message,
+    RollingSummary,
+    SummaryEntry,
+    User,
+)
+from src.segment_store import EmbeddingSegmentStore
+from src.text_index import TextIndex
+from src.vector_index import VectorIndex
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+DAY = datetime(2024, 5, 13)
+STARTED = datetime.now()
+
+
+@pytest.fixture
+def async_mongo_manager(monkeypatch, tmp_path):
+    import src.async_mongo
+
+    client = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(src.async_mongo, "get_async_mongo_client", lambda: client)
+    return AsyncMongoManager(
+        vector_index=VectorIndex(),
+        segment_store=EmbeddingSegmentStore(root=str(tmp_path / "async")),
+        text_index=TextIndex(),
+    )
+
+
+def _normalize(value):
+    """Make results of the two databases comparable: ObjectIds and write times differ"""
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, ObjectId):
+        return "<ObjectId>"
+    if isinstance(value, datetime) and value >= STARTED:
+        return "<now>"
+    if hasattr(value, "model_dump"):
+        return _normalize(value.model_dump())
+    if isinstance(value, float):
+        return round(value, 5)
+    return value
+
+
+def _run_both(mongo_manager, async_mongo_manager, calls):
+    """Results of each (method, args, kwargs) call through both managers"""
+    sync_results = [
+        getattr(mongo_manager, method)(*args, **kwargs) for method, args, kwargs in calls
+    ]
+
+    async def run():
+        return [
+            await getattr(async_mongo_manager, method)(*args, **kwargs)
+            for method, args, kwargs in calls
+        ]
+
+    async_results = asyncio.run(run())
+    # Inserted ids are ObjectIds of different databases
+    for i, (method, _, _) in enumerate(calls):
+        if method.startswith("create_") and method != "create_many":
+            sync_results[i] = async_results[i] = None
+    return _normalize(sync_results), _normalize(async_results)
+
+
+def _call(method, *args, **kwargs):
+    return method, args, kwargs
+
+
+def _summary(key, day, text, embedding, level="daily"):
+    return SummaryEntry(
+        summary_id=key,
+        user_id="u1" if key != "other" else "u2",
+        level=level,
+        day=DAY + timedelta(days=day),
+        created_at=DAY + timedelta(days=day, hours=20),
+        updated_at=DAY + timedelta(days=day, hours=20),
+        summary=text,
+        embedding=embedding,
+    )
+
+
+def _document(key, text, embedding=None, user_id="u1"):
+    return DocumentEntry(
+        document_id=key,
+        user_id=user_id,
+        text=text,
+        created_at=DAY,
+        updated_at=DAY,
+        embedding=embedding,
+    )
+
+
+def _chunk(parent, index, text, embedding):
+    return ChunkEntry(
+        chunk_id=f"{parent}:{index}",
+        parent_id=parent,
+        user_id="u1",
+        chunk_index=index,
+        start=index * 10,
+        end=index * 10 + 10,
+        text=text,
+        created_at=DAY,
+        embedding=embedding,
+    )
+
+
+X, Y, Z = [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]
+U1 = {"user_id": "u1"}
+
+SEED = [
+    _call("create_summary", _summary("s1", 0, "mal di testa e nausea", X)),
+    _call("create_summary", _summary("s2", 1, "dormito bene, passeggiata", Y)),
+    _call("create_summary", _summary("other", 1, "mal di testa", X)),
+    _call("create_document", _document("d1", "referto radiologico del torace", Z)),
+    _call("create_document", _document("d2", "analisi del sangue", [0.6, 0.8, 0.0])),
+    _call(
+        "create_user",
+        User(
+            user_id="u1",
+            name="Mario",
+            email="m@x.it",
+            password="pw",
+            created_at=DAY,
+            updated_at=DAY,
+        ),
+    ),
+]
+
+
+@pytest.fixture
+def seeded(mongo_manager, async_mongo_manager):
+    _run_both(mongo_manager, async_mongo_manager, SEED)
+    return mongo_manager, async_mongo_manager
+
+
+def _assert_parity(managers, calls):
+    sync_results, async_results = _run_both(*managers, calls)
+    for (method, args, kwargs), expected, actual in zip(calls, sync_results, async_results):
+        assert actual == expected, f"{method}{args}{kwargs}"
+    return sync_results
+
+
+def test_create_update_and_append(seeded):
+    question = Message(role="user", content="ho mal di testa", timestamp=DAY)
+    answer = Message(role="assistant", content="da quando?", timestamp=DAY)
+    today = date.today()
+    results = _assert_parity(
+        seeded,
+        [
+            _call("update_summary", "s2", {"summary": "notte agitata, febbre", "embedding": Z}),
+            _call("update_document", "d2", {"text": "esame emocromo"}),
+            _call("update_user", "u1", {"name": "Mario Rossi"}),
+            _call("append_conversation_messages", "sess", "u1", [question], embedding=X),
+            _call("append_conversation_messages", "sess", "u1", [answer]),
+            _call("get_conversation_by_session_id", "sess", {"_id": 0}),
+            _call("get_session_messages_by_date_range", "u1", today, today),
+            _call(
+                "get_summaries_by_date_range",
+                "u1",
+                date(2024, 5, 13),
+                date(2024, 5, 14),
+                {"_id": 0},
+            ),
+            _call("get_document_by_id", "u1", "d2", {"_id": 0, "text": 1, "keywords": 1}),
+            _call("get_users", {"_id": 0, "name": 1}),
+            _call("check_user", "u1", "pw"),
+            _call("hybrid_search", "summaries", text_query="febbre", filters=U1),
+            _call("hybrid_search", "conversations", text_query="testa", embedding_query=X),
+        ],
+    )
+    contents = ["ho mal di testa", "da quando?"]
+    assert [m["content"] for m in results[5]["messages"]] == contents
+    assert [m["content"] for m in results[6][0]["messages"]] == contents
+    assert results[11][0]["summary_id"] == "s2"
+
+
+def test_bulk_writes(seeded):
+    summaries = [_summary("s3", 2, "tosse secca", Y), _summary("s1", 0, "doppione", None)]
+    documents = [_document("d1", "referto aggiornato del torace"), _document("d3", "ricetta", Y)]
+    results = _assert_parity(
+        seeded,
+        [
+            _call("create_many", "summaries", summaries),
+            _call("bulk_upsert", "documents", documents),
+            _call("hybrid_search", "summaries", embedding_query=Y, filters=U1),
+            _call("hybrid_search", "documents", text_query="aggiornato torace ricetta"),
+        ],
+    )
+    assert results[1]["upserted"] == 1 and results[1]["matched"] == 1
+
+
+@pytest.mark.parametrize(
+    "projection",
+    [None, "ids-only", {"_id": 0}, {"summary": 1}, {"_id": 0, "summary": 1}, {"embedding": 0}],
+)
+def test_hybrid_search_projections(seeded, projection):
+    results = _assert_parity(
+        seeded,
+        [
+            _call(
+                "hybrid_search",
+                "summaries",
+                embedding_query=X,
+                filters=U1,
+                projection=projection,
+            ),
+            _call(
+                "hybrid_search",
+                "summaries",
+                text_query="testa",
+                embedding_query=X,
+                projection=projection,
+                limit=2,
+            ),
+            _call("hybrid_search", "summaries", filters=U1, projection=projection),
+        ],
+    )
+    assert len(results[0]) == 2 and len(results[1]) == 2
+
+
+@pytest.mark.parametrize("projection", [None, {"document_id": 1}, {"_id": 0, "text": 1}])
+def test_hybrid_search_with_chunks(seeded, projection):
+    d1_chunks = [
+        _chunk("d1", 0, "torace nella norma", Z),
+        _chunk("d1", 1, "nodulo polmonare", Y),
+        _chunk("d1", 2, "vecchio", None),
+    ]
+    d2_chunks = [_chunk("d2", 0, "emocromo: ferro basso", X)]
+    results = _assert_parity(
+        seeded,
+        [
+            _call("upsert_chunks", "documents", "d1", d1_chunks),
+            _call("upsert_chunks", "documents", "d2", d2_chunks),
+            _call("upsert_chunks", "documents", "d1", d1_chunks[:1], total_chunks=2),
+            _call(
+                "hybrid_search",
+                "documents",
+                embedding_query=[0.0, 0.2, 1.0],
+                filters=U1,
+                projection=projection,
+                chunks=True,
+            ),
+            _call(
+                "hybrid_search",
+                "documents",
+                text_query="ferro nodulo",
+                filters=U1,
+                projection=projection,
+                chunks=True,
+            ),
+        ],
+    )
+    assert [r["best_chunk"]["chunk_id"] for r in results[3]] == ["d1:0", "d2:0"]
+    assert [r["best_chunk"]["chunk_id"] for r in results[4]] == ["d1:1", "d2:0"]
+
+
+def test_checkpoints_and_rolling_summaries(seeded):
+    day = date(2024, 5, 14)
+    rolling = RollingSummary(
+        user_id="u1", day=DAY, summary="mattina: cefalea", message_counts={"a": 2}
+    )
+    updated = rolling.model_copy(
+        update={
+            "summary": "cefalea, poi febbre",
+            "message_counts": {"a": 2, "b": 4},
+            "version": 2,
+        }
+    )
+    results = _assert_parity(
+        seeded,
+        [
+            _call("ensure_indexes"),
+            _call(
+                "set_summary_checkpoints",
+                "daily",
+                day,
+                {"u1": {"status": "done"}, "u2": {"status": "failed", "error": "timeout"}},
+            ),
+            _call("set_summary_checkpoints", "daily", day, {"u2": {"status": "done"}}),
+            _call("get_summary_checkpoints", "daily", day),
+            _call("get_summary_checkpoints", "daily", day, ["failed"]),
+            _call("get_summarized_users", date(2024, 5, 13), date(2024, 5, 14)),
+            _call("get_rolling_summary", "u1", DAY.date()),
+            _call("replace_rolling_summary", rolling, 0),
+            _call("replace_rolling_summary", rolling, 0),
+            _call("replace_rolling_summary", updated, 1),
+            _call("replace_rolling_summary", updated, 1),
+            _call("get_rolling_summary", "u1", DAY.date()),
+        ],
+    )
+    assert results[3]["u2"]["attempts"] == 2 and results[3]["u2"]["status"] == "done"
+    assert results[4] == {}
+    assert results[5] == {"u1", "u2"}
+    assert results[6] is None
+    assert results[7:11] == [True, False, True, False]
+    assert results[11]["summary"] == "cefalea, poi febbre"
+
+
+def test_set_embeddings_and_migrate_embedding_storage(seeded):
+    mongo_manager, async_mongo_manager = seeded
+    query = {"user_id": "u1"}, {"_id": 1, "user_id": 1}
+
+    async def async_rows():
+        return await async_mongo_manager.summaries.find(*query).to_list(None)
+
+    sync_rows = list(mongo_manager.summaries.find(*query))
+    rows = {"sync": sync_rows, "async": asyncio.run(async_rows())}
+    embeddings = {
+        name: [(str(row["_id"]), row["user_id"], Z) for row in documents]
+        for name, documents in rows.items()
+    }
+    assert mongo_manager.set_embeddings("summaries", embeddings["sync"], "m2") == 2
+    assert (
+        asyncio.run(async_mongo_manager.set_embeddings("summaries", embeddings["async"], "m2"))
+        == 2
+    )
+    results = _assert_parity(
+        seeded,
+        [
+            _call("migrate_embedding_storage", "summaries", "float16"),
+            _call("migrate_embedding_storage", "summaries", "float16"),
+            _call(
+                "hybrid_search",
+                "summaries",
+                filters=U1,
+                projection={"_id": 0, "summary_id": 1, "embedding_model": 1},
+            ),
+        ],
+    )
+    assert results[0] == 3 and results[1] == 0
+    assert {r["embedding_model"] for r in results[2]} == {"m2"}
@@ -0,0 +1,123 @@
+import numpy as np
+from src.chunking import chunk_messages, chunk_text, mean_embedding
+from src.models import Message
+
+
+def _words(n, prefix="w"):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_chunk_text_windows_overlap_and_cover_the_text():
+    text = _words(25)
+    chunks = chunk_text(text, max_tokens=10, overlap_tokens=3)
+    assert [(c.start, c.end) for c in chunks] == [(0, 10), (7, 17), (14, 24), (21, 25)]
+    assert chunks[0].text == _words(10)
+    assert chunks[1].text.split() == text.split()[7:17]
+
+
+def test_chunk_text_of_short_or_blank_text():
+    assert [(c.start, c.end) for c in chunk_text("uno due", max_tokens=10)] == [(0, 2)]
+    assert chunk_text("   ") == []
+    assert chunk_text("") == []
+
+
+def test_chunk_text_always_advances_when_overlap_is_too_large():
+    chunks = chunk_text(_words(5), max_tokens=2, overlap_tokens=5)
+    assert [(c.start, c.end) for c in chunks] == [(0, 2), (1, 3), (2, 4), (3, 5)]
+
+
+def test_mean_embedding_is_normalized_and_skips_missing():
+    mean = mean_embedding([[1.0, 0.0], None, [0.0, 1.0], []])
+    np.testing.assert_allclose(mean, [2**-0.5, 2**-0.5], rtol=1e-6)
+    assert mean_embedding([None]) is None
+
+
+def _messages(*sizes):
+    # Each message costs its word count plus the 4 tokens of chat formatting
+    return [
+        Message(role="user" if i % 2 else "assistant", content=_words(size, f"m{i}_"))
+        for i, size in enumerate(sizes)
+    ]
+
+
+def test_chunk_messages_packs_whole_messages_with_overlap():
+    messages = [Message(role="system", content="prompt")] + _messages(6, 6, 6, 6, 6)
+    chunks = chunk_messages(messages, max_tokens=30, overlap_tokens=10)
+    assert [(c.start, c.end) for c in chunks] == [(1, 4), (3, 6)]
+    assert chunks[0].text.startswith("assistant: m0_0")
+    assert "system" not in chunks[0].text
+
+
+def test_chunk_messages_gives_long_messages_their_own_window():
+    chunks = chunk_messages(_messages(2, 50, 2), max_tokens=20, overlap_tokens=0)
+    assert [(c.start, c.end) for c in chunks] == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_chunk_messages_windows_are_stable_under_appends():
+    messages = _messages(*[5] * 12)
+    before = chunk_messages(messages[:8], max_tokens=30, overlap_tokens=9)
+    after = chunk_messages(messages, max_tokens=30, overlap_tokens=9)
+    assert after[: len(before) - 1] == before[:-1]
+
+
+def _document_chunks(mongo_manager, document_id):
+    return list(
+        mongo_manager.document_chunks.find({"parent_id": document_id}, {"_id": 0}).sort(
+            "chunk_index"
+        )
+    )
+
+
+def test_documents_are_chunked_on_create_and_update(mongo_manager, embedding_generator):
+    from src.models import DocumentEntry
+
+    mongo_manager.embedding_generator = embedding_generator
+    text = _words(500) + " testa " + _words(99, "x")
+    mongo_manager.create_document(DocumentEntry(document_id="d", user_id="u", text=text))
+
+    chunks = _document_chunks(mongo_manager, "d")
+    assert [(c["chunk_id"], c["start"], c["end"]) for c in chunks] == [
+        ("d:0", 0, 512),
+        ("d:1", 448, 600),
+    ]
+    assert [c["embedding_model"] for c in chunks] == [embedding_generator.model] * 2
+    document = mongo_manager.documents.find_one({"document_id": "d"})
+    assert document["embedding_model"] == embedding_generator.model
+
+    mongo_manager.update_document("d", {"text": "mal di testa"})
+    (chunk,) = _document_chunks(mongo_manager, "d")
+    assert (chunk["chunk_id"], chunk["text"]) == ("d:0", "mal di testa")
+    results = mongo_manager.hybrid_search(
+        "documents", "testa", [1.0, 0.0], {"user_id": "u"}, chunks=True
+    )
+    assert results[0]["best_chunk"]["chunk_id"] == "d:0"
+
+
+def test_documents_without_a_generator_get_text_only_chunks(mongo_manager):
+    from src.models import DocumentEntry
+
+    mongo_manager.create_document(DocumentEntry(document_id="d", user_id="u", text="referto"))
+    (chunk,) = _document_chunks(mongo_manager, "d")
+    assert chunk["text"] == "referto" and chunk["embedding"] is None
+
+
+def test_reembed_rechunks_documents(mongo_manager, embedding_generator):
+    from src.models import DocumentEntry
+    from src.reembed import reembed_collection
+
+    mongo_manager.create_document(
+        DocumentEntry(
+            document_id="d",
+            user_id="u",
+            text="mal di testa",
+            embedding=[0.0, 1.0],
+            embedding_model="old-model",
+        )
+    )
+    assert _document_chunks(mongo_manager, "d")[0]["embedding"] is None
+
+    assert reembed_collection(mongo_manager, embedding_generator, "documents") == 1
+    (chunk,) = _document_chunks(mongo_manager, "d")
+    assert chunk["embedding_model"] == embedding_generator.model
+    document = mongo_manager.documents.find_one({"document_id": "d"})
+    assert document["embedding_model"] == embedding_generator.model
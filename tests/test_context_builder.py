@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from src.context_builder import ContextBuilder
+from src.tokens import count_tokens
+from src.models import DocumentEntry, RollingSummary, SummaryEntry
+from src.mongo import PROJECTIONS
+
+SUMMARY_TEXT = PROJECTIONS["summary-text"]
+
+NOW = datetime.now()
+
+
+def _store_summary(mongo_manager, embedding_generator, key, days_ago, text, embedding=None):
+    mongo_manager.create_summary(
+        SummaryEntry(
+            summary_id=key,
+            user_id="u",
+            day=NOW - timedelta(days=days_ago),
+            summary=text,
+            session_ids=[],
+            embedding=embedding or embedding_generator.create(text),
+        )
+    )
+    # As ChatManager loads them
+    return mongo_manager.summaries.find_one({"summary_id": key}, SUMMARY_TEXT)
+
+
+def _conversation(*contents):
+    return {
+        "session_id": "s",
+        "messages": [
+            {
+                "role": "user",
+                "content": content,
+                "timestamp": NOW - timedelta(minutes=10 * (len(contents) - i)),
+            }
+            for i, content in enumerate(contents)
+        ],
+    }
+
+
+def test_recency_only_without_embeddings(mongo_manager):
+    summaries = [
+        {"summary_id": f"d{i}", "day": NOW - timedelta(days=i), "summary": "parola " * 20}
+        for i in range(1, 6)
+    ]
+    builder = ContextBuilder(mongo_manager, budget=60)
+    built = builder.build("u", summaries, [_conversation("ciao")])
+
+    assert [item.key for item in built.summaries] == ["d2", "d1"]
+    assert [item.key for item in built.turns] == ["s:0"]
+    assert built.report.used_tokens <= 60
+    assert built.report.included == {"summary": 2, "turn": 1}
+    assert {d.key for d in built.report.dropped} == {"d3", "d4", "d5"}
+
+
+def test_summaries_do_not_depend_on_the_session(mongo_manager, embedding_generator):
+    summaries = [
+        _store_summary(mongo_manager, embedding_generator, "recent", 1, "dormito bene " * 10),
+        _store_summary(mongo_manager, embedding_generator, "old", 6, "mal di testa " * 7),
+    ]
+    builder = ContextBuilder(
+        mongo_manager, embedding_generator, budget=40, relevance_weight=0.7, max_documents=0
+    )
+    for conversation in [_conversation("ho di nuovo mal di testa"), _conversation("tutto bene")]:
+        built = builder.build("u", summaries, [conversation])
+        assert [item.key for item in built.summaries] == ["recent"]
+
+
+def test_turns_are_only_embedded_when_they_compete(mongo_manager, embedding_generator):
+    embedded = []
+    embed = embedding_generator.backend.embed
+    embedding_generator.backend.embed = lambda texts: embedded.extend(texts) or embed(texts)
+    conversation = _conversation("mal di testa", "dormito bene")
+
+    ContextBuilder(mongo_manager, embedding_generator, budget=1000).build("u", [], [conversation])
+    assert len(embedded) == 1  # The query
+
+    embedded.clear()
+    ContextBuilder(mongo_manager, embedding_generator, budget=8).build("u", [], [conversation])
+    assert len(embedded) == 3
+
+
+def test_turns_are_scored_by_similarity(mongo_manager, embedding_generator):
+    conversation = _conversation(
+        "mal di testa ieri sera", *["dormito bene"] * 6, "ancora testa"
+    )
+    turns = [
+        f"[{msg['timestamp']}] user: {msg['content']}" for msg in conversation["messages"]
+    ]
+    budget = sum(count_tokens(text) for text in (turns[0], turns[-1]))
+
+    recency_only = ContextBuilder(mongo_manager, budget=budget).build("u", [], [conversation])
+    assert [item.key for item in recency_only.turns] == ["s:6", "s:7"]
+
+    builder = ContextBuilder(mongo_manager, embedding_generator, budget=budget, max_documents=0)
+    built = builder.build("u", [], [conversation])
+    assert [item.key for item in built.turns] == ["s:0", "s:7"]
+
+
+def test_document_passages_are_added(mongo_manager, embedding_generator):
+    mongo_manager.embedding_generator = embedding_generator
+    mongo_manager.create_document(
+        DocumentEntry(document_id="doc", user_id="u", text="referto: cefalea, testa")
+    )
+    builder = ContextBuilder(mongo_manager, embedding_generator, budget=1000)
+    built = builder.build("u", [], [_conversation("mal di testa")])
+    assert [(item.key, item.text) for item in built.documents] == [
+        ("doc:0", "[doc] referto: cefalea, testa")
+    ]
+
+
+def test_rolling_summary_leads_the_turns(mongo_manager):
+    rolling = RollingSummary(
+        user_id="u", day=NOW, summary="mattina tranquilla", covered_until=NOW - timedelta(hours=2)
+    )
+    built = ContextBuilder(mongo_manager, budget=1000).build(
+        "u", [], [_conversation("ciao")], rolling=rolling
+    )
+    assert [item.key for item in built.turns] == ["rolling", "s:0"]
+    assert "mattina tranquilla" in built.turns[0].text
@@ -0,0 +1,107 @@
+import threading
+import pytest
+from src import embedding
+from src.embedding import EmbeddingGenerator
+from src.embedding_backends import EmbeddingBackend
+from src.embedding_cache import EmbeddingCache
+
+
+class StubBackend(EmbeddingBackend):
+    """Embeds a text as [number of characters, 1], failing the calls told to"""
+
+    model = "stub"
+    max_tokens = 100
+
+    def __init__(self, failures=None):
+        # Text -> number of calls containing it that fail
+        self.failures = dict(failures or {})
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def truncate(self, text):
+        return text, len(text.split())
+
+    def embed(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+            for text in texts:
+                if self.failures.get(text, 0) > 0:
+                    self.failures[text] -= 1
+                    raise ConnectionError(f"failed on {text}")
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def _vector(text):
+    return [float(len(text)), 1.0]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(embedding.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_requests_are_packed_by_items_and_tokens():
+    backend = StubBackend()
+    generator = EmbeddingGenerator(backend=backend, use_cache=False)
+    texts = ["a", "b c", "d", "e", "f g h i", "j k", "l m n o p q r"]
+
+    result = generator.create_batch(texts, max_items=3, max_tokens=5, concurrency=1)
+
+    assert backend.calls == [
+        ["a", "b c", "d"],  # max_items
+        ["e", "f g h i"],  # max_tokens
+        ["j k"],
+        ["l m n o p q r"],  # Over max_tokens on its own: sent alone
+    ]
+    assert result == [_vector(text) for text in texts]
+
+
+def test_repeats_are_embedded_once_and_order_is_restored():
+    backend = StubBackend()
+    generator = EmbeddingGenerator(backend=backend, use_cache=False)
+
+    result = generator.create_batch(
+        ["mal di testa", "", "febbre", "mal di testa", "  ", "tosse"], max_items=2, concurrency=4
+    )
+
+    assert sorted(text for call in backend.calls for text in call) == [
+        "febbre",
+        "mal di testa",
+        "tosse",
+    ]
+    assert result == [
+        _vector("mal di testa"),
+        None,
+        _vector("febbre"),
+        _vector("mal di testa"),
+        None,
+        _vector("tosse"),
+    ]
+
+
+def test_failed_requests_are_retried_then_given_up(sleeps):
+    backend = StubBackend(failures={"b": 1, "c": 10})
+    generator = EmbeddingGenerator(backend=backend, use_cache=False)
+
+    result = generator.create_batch(["a", "b", "c"], max_items=1, max_retries=2, concurrency=1)
+
+    # "b" succeeds on its retry; "c" fails all three attempts
+    assert result == [_vector("a"), _vector("b"), None]
+    assert backend.calls == [["a"], ["b"], ["b"], ["c"], ["c"], ["c"]]
+    assert [int(delay) for delay in sleeps] == [1, 1, 2]
+
+
+def test_cached_texts_are_not_requested_and_failures_are_not_cached(sleeps):
+    cache = EmbeddingCache(path=None)
+    cache.put("stub", "a", [9.0, 9.0])
+    backend = StubBackend(failures={"c": 10})
+    generator = EmbeddingGenerator(backend=backend, cache=cache)
+
+    result = generator.create_batch(["a", "b", "c"], max_items=1, max_retries=0, concurrency=1)
+
+    assert result == [[9.0, 9.0], _vector("b"), None]
+    assert backend.calls == [["b"], ["c"]]
+    assert cache.get("stub", "b") == _vector("b")
+    assert cache.get("stub", "c") is None
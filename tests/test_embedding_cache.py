@@ -0,0 +1,57 @@
+import numpy as np
+from src.embedding_cache import EmbeddingCache
+
+
+def _cache(tmp_path, max_entries=2):
+    path = tmp_path / "cache" / "embeddings.sqlite3"
+    return EmbeddingCache(path=str(path), max_entries=max_entries)
+
+
+def test_memory_tier_evicts_the_least_recently_used():
+    cache = EmbeddingCache(path=None, max_entries=2)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]  # "b" is now the least recently used
+    cache.put("m", "c", [3.0])
+
+    assert cache.get_many("m", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+    stats = cache.stats()
+    assert (stats["evictions"], stats["memory_entries"]) == (1, 2)
+    assert (stats["memory_hits"], stats["misses"]) == (3, 1)
+
+
+def test_sqlite_tier_reads_through_and_promotes(tmp_path):
+    writer = _cache(tmp_path)
+    writer.put_many("m", ["a", "b", "c"], [[1.0, 0.5], [2.0, 0.5], None])
+
+    # A new process sharing the file
+    cache = _cache(tmp_path)
+    assert cache.get_many("m", ["a", "b", "c"]) == [[1.0, 0.5], [2.0, 0.5], None]
+    assert cache.stats()["disk_hits"] == 2
+    # Promoted to the memory tier by the read
+    assert cache.get("m", "a") == [1.0, 0.5]
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 2, 1)
+
+    # Evicted from memory, still on disk
+    cache.put("m", "d", [4.0])
+    cache.put("m", "e", [5.0])
+    assert cache.get("m", "a") == [1.0, 0.5]
+    assert cache.stats()["disk_hits"] == 3
+
+
+def test_vectors_are_stored_as_float32(tmp_path):
+    _cache(tmp_path).put("m", "a", [0.1, 0.2])
+    vector = _cache(tmp_path).get("m", "a")
+    assert vector == np.asarray([0.1, 0.2], dtype=np.float32).tolist()
+
+
+def test_keys_depend_on_the_model_and_the_normalized_text(tmp_path):
+    cache = _cache(tmp_path, max_entries=10)
+    cache.put("small", "mal  di\ttesta ", [1.0])
+    cache.put("large", "mal di testa", [2.0])
+
+    assert cache.get("small", "mal di testa") == [1.0]
+    assert cache.get("large", " mal di testa") == [2.0]
+    assert cache.get("other", "mal di testa") is None
+    assert _cache(tmp_path).get_many("small", ["mal di testa", "febbre"]) == [[1.0], None]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from bson import BSON, Binary
+from src.embedding_codec import (
+    EMBEDDING_BINARY_SUBTYPE,
+    decode_embedding,
+    encode_embedding,
+    stored_dtype,
+)
+
+VECTOR = [0.25, -1.5, 3.0, 0.0, -0.125]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_float_dtypes_round_trip_exactly(dtype):
+    stored = encode_embedding(VECTOR, dtype)
+    assert isinstance(stored, Binary) and stored.subtype == EMBEDDING_BINARY_SUBTYPE
+    assert stored_dtype(stored) == dtype
+    decoded = decode_embedding(stored)
+    assert decoded.dtype == np.float32
+    assert decoded.tolist() == VECTOR
+
+
+def test_int8_round_trip_within_quantization_error():
+    stored = encode_embedding(VECTOR, "int8")
+    assert stored_dtype(stored) == "int8"
+    assert len(stored) == 4 + 4 + len(VECTOR)
+    np.testing.assert_allclose(decode_embedding(stored), VECTOR, atol=3.0 / 127)
+
+
+def test_int8_of_zero_vector_does_not_divide_by_zero():
+    assert decode_embedding(encode_embedding([0.0, 0.0], "int8")).tolist() == [0.0, 0.0]
+
+
+def test_legacy_lists_are_kept_and_decoded():
+    stored = encode_embedding(VECTOR, "list")
+    assert stored == VECTOR
+    assert stored_dtype(stored) == "list"
+    assert decode_embedding(stored).tolist() == VECTOR
+
+
+def test_encoding_survives_a_bson_round_trip():
+    stored = BSON.encode({"embedding": encode_embedding(VECTOR, "float32")})
+    assert decode_embedding(BSON(stored).decode()["embedding"]).tolist() == VECTOR
+
+
+def test_missing_embeddings_and_unknown_dtypes():
+    assert encode_embedding(None) is None
+    assert encode_embedding([]) is None
+    assert decode_embedding(None) is None
+    assert stored_dtype([]) is None
+    with pytest.raises(ValueError):
+        encode_embedding(VECTOR, "float64")
@@ -0,0 +1,62 @@
+from datetime import datetime
+from src.CONSTANTS import KEYWORDS_PER_DOCUMENT
+from src.embedding_codec import decode_embedding
+from src.models import Message
+from src.text_index import extract_keywords
+
+
+def _message(content, role="user"):
+    return Message(role=role, content=content, timestamp=datetime(2024, 5, 13, 9))
+
+
+def _words(prefix, n):
+    return " ".join(f"{prefix}parola{i}" for i in range(n))
+
+
+def _stored(mongo_manager):
+    return mongo_manager.conversations.find_one({"session_id": "s"})
+
+
+def test_append_creates_the_conversation(mongo_manager):
+    mongo_manager.append_conversation_messages(
+        "s", "u", [_message("$ho mal di testa"), _message("da quando?", "assistant")]
+    )
+    stored = _stored(mongo_manager)
+    assert stored["user_id"] == "u"
+    assert [m["content"] for m in stored["messages"]] == ["$ho mal di testa", "da quando?"]
+    assert stored["text_content"] == "user: $ho mal di testa\nassistant: da quando?"
+    assert stored["keywords"] == extract_keywords(stored["text_content"])
+    assert (stored["document_ids"], stored["model_params"]) == ([], {})
+    assert stored["created_at"] == stored["updated_at"]
+    assert "embedding" not in stored
+
+
+def test_append_grows_the_conversation_and_caps_its_keywords(mongo_manager):
+    mongo_manager.append_conversation_messages("s", "u", [_message(_words("a", 15))], [1.0, 0.0])
+    created = _stored(mongo_manager)
+    mongo_manager.append_conversation_messages("s", "u", [_message(_words("b", 15))])
+
+    stored = _stored(mongo_manager)
+    assert len(stored["messages"]) == 2
+    assert stored["text_content"] == f"user: {_words('a', 15)}\nuser: {_words('b', 15)}"
+    assert stored["created_at"] == created["created_at"]
+    assert stored["updated_at"] > created["updated_at"]
+    # The stored keywords come first, the new ones fill up to the cap
+    assert len(stored["keywords"]) == KEYWORDS_PER_DOCUMENT
+    assert stored["keywords"][: len(created["keywords"])] == created["keywords"]
+    # No embedding given: the stored one is kept
+    assert decode_embedding(stored["embedding"]).tolist() == [1.0, 0.0]
+
+
+def test_embedding_refresh_recomputes_the_keywords(mongo_manager):
+    mongo_manager.append_conversation_messages("s", "u", [_message(_words("a", 15))])
+    mongo_manager.append_conversation_messages("s", "u", [_message(_words("b", 15) + " testa")])
+    mongo_manager.append_conversation_messages(
+        "s", "u", [_message("testa testa testa")], [0.0, 1.0], "other-model"
+    )
+
+    stored = _stored(mongo_manager)
+    assert stored["keywords"] == extract_keywords(stored["text_content"])
+    assert stored["keywords"][0] == "testa"
+    assert decode_embedding(stored["embedding"]).tolist() == [0.0, 1.0]
+    assert stored["embedding_model"] == "other-model"
@@ -0,0 +1,70 @@
+from datetime import datetime
+import logging
+from src.mongo_indexes import ensure_indexes, find_duplicates
+from src.models import ConversationEntry
+
+
+def _conversation(session_id, hour, text):
+    return ConversationEntry(
+        session_id=session_id,
+        user_id="u",
+        text_content=text,
+        updated_at=datetime(2024, 5, 13, hour),
+    ).model_dump()
+
+
+def _seed_duplicates(db):
+    db.conversations.insert_many(
+        [
+            _conversation("a", 9, "prima"),
+            _conversation("a", 11, "ultima"),
+            _conversation("a", 10, "seconda"),
+            _conversation("b", 9, "unica"),
+        ]
+    )
+    db.users.insert_many([{"user_id": "u", "name": "vecchio"}, {"user_id": "u", "name": "nuovo"}])
+
+
+def test_registry_skips_unique_indexes_over_duplicates(mongo_client, caplog):
+    db = mongo_client.medassistant
+    _seed_duplicates(db)
+
+    with caplog.at_level(logging.ERROR):
+        created = ensure_indexes(db)
+
+    assert created["conversations"] == ["user_id_created_at"]
+    assert created["users"] == []
+    assert created["summaries"] == [
+        "summary_id_unique",
+        "user_id_day",
+        "user_id_created_at_desc",
+        "day",
+    ]
+    assert "session_id_unique on conversations" in caplog.text
+    assert "user_id_unique on users" in caplog.text
+
+
+def test_remove_duplicates_keeps_the_latest_document(mongo_client, mongo_manager):
+    db = mongo_client.medassistant
+    _seed_duplicates(db)
+    assert len(find_duplicates(db, "conversations")) == 2
+
+    assert mongo_manager.remove_duplicates(dry_run=True)["conversations"] == 2
+    assert db.conversations.count_documents({}) == 4
+
+    counts = mongo_manager.remove_duplicates()
+    assert (counts["conversations"], counts["users"], counts["summaries"]) == (2, 1, 0)
+    assert sorted(d["text_content"] for d in db.conversations.find()) == ["ultima", "unica"]
+    assert [u["name"] for u in db.users.find()] == ["nuovo"]
+
+    created = ensure_indexes(db)
+    assert "session_id_unique" in created["conversations"]
+    assert created["users"] == ["user_id_unique"]
+
+
+def test_manager_starts_on_a_database_with_duplicates(mongo_client):
+    from src.mongo import MongoManager
+
+    _seed_duplicates(mongo_client.duplicates)
+    MongoManager(db_name="duplicates", ensure_indexes=True)
+    assert "user_id_created_at" in mongo_client.duplicates.conversations.index_information()
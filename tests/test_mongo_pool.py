@@ -0,0 +1,103 @@
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import pytest
+from src import mongo_pool
+from src.CONSTANTS import MONGO_MAX_POOL_SIZE
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+class FakeClient:
+    """Records how the factory builds and closes clients, without connecting"""
+
+    created = []
+
+    def __init__(self, connection_string, **options):
+        self.connection_string = connection_string
+        self.options = options
+        self.closed = False
+        FakeClient.created.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool(monkeypatch):
+    FakeClient.created = []
+    monkeypatch.setattr(mongo_pool, "MongoClient", FakeClient)
+    monkeypatch.setattr(mongo_pool, "AsyncIOMotorClient", FakeClient)
+    monkeypatch.setattr(mongo_pool, "_clients", {})
+    monkeypatch.setattr(mongo_pool, "_async_clients", {})
+    monkeypatch.setattr(mongo_pool, "_listeners", {})
+
+
+def test_one_client_per_connection_string(monkeypatch):
+    monkeypatch.setenv("MONGO_CONNECTION_STRING", "mongodb://a")
+    client = mongo_pool.get_mongo_client()
+
+    assert mongo_pool.get_mongo_client("mongodb://a") is client
+    assert mongo_pool.get_mongo_client("mongodb://b") is not client
+    assert len(FakeClient.created) == 2
+    assert client.options["maxPoolSize"] == MONGO_MAX_POOL_SIZE
+    # Options only apply to the first call
+    assert mongo_pool.get_mongo_client("mongodb://a", maxPoolSize=1) is client
+    assert client.options["maxPoolSize"] == MONGO_MAX_POOL_SIZE
+
+
+def test_async_clients_are_shared_apart_from_the_sync_ones():
+    client = mongo_pool.get_async_mongo_client("mongodb://a")
+
+    assert mongo_pool.get_async_mongo_client("mongodb://a") is client
+    assert mongo_pool.get_mongo_client("mongodb://a") is not client
+    assert mongo_pool.get_pool_stats("mongodb://a", asynchronous=True)["checkouts"] == 0
+    assert mongo_pool.get_pool_stats("mongodb://unknown") == {}
+
+
+def test_concurrent_callers_share_one_client():
+    clients = []
+
+    def connect():
+        clients.append(mongo_pool.get_mongo_client("mongodb://a"))
+
+    threads = [threading.Thread(target=connect) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(FakeClient.created) == 1
+    assert all(client is clients[0] for client in clients)
+
+
+def test_close_closes_every_client():
+    sync_client = mongo_pool.get_mongo_client("mongodb://a")
+    async_client = mongo_pool.get_async_mongo_client("mongodb://a")
+
+    mongo_pool.close_mongo_clients()
+
+    assert sync_client.closed and async_client.closed
+    assert mongo_pool.get_pool_stats("mongodb://a") == {}
+    assert mongo_pool.get_mongo_client("mongodb://a") is not sync_client
+
+
+def test_clients_are_closed_at_exit():
+    script = "\n".join(
+        [
+            "from src import mongo_pool",
+            "client = mongo_pool.get_mongo_client('mongodb://localhost', connect=False)",
+            "close = client.close",
+            "client.close = lambda: (print('closed'), close())",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["closed"]
@@ -0,0 +1,194 @@
+from types import SimpleNamespace
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import (
+    Choice,
+    ChoiceDelta,
+    ChoiceDeltaToolCall,
+    ChoiceDeltaToolCallFunction,
+)
+from openai.types.completion_usage import PromptTokensDetails
+from src.metrics import Metrics
+from src.models import DocumentEntry
+from src.openai import DailyAgent
+
+
+def _chunk(content=None, tool_calls=None, finish_reason=None):
+    return ChatCompletionChunk(
+        id="c",
+        created=0,
+        model="m",
+        object="chat.completion.chunk",
+        choices=[
+            Choice(
+                index=0,
+                delta=ChoiceDelta(content=content, tool_calls=tool_calls),
+                finish_reason=finish_reason,
+            )
+        ],
+    )
+
+
+def _usage_chunk(prompt_tokens, cached_tokens):
+    return ChatCompletionChunk(
+        id="c",
+        created=0,
+        model="m",
+        object="chat.completion.chunk",
+        choices=[],
+        usage=CompletionUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=2,
+            total_tokens=prompt_tokens + 2,
+            prompt_tokens_details=PromptTokensDetails(cached_tokens=cached_tokens),
+        ),
+    )
+
+
+def _tool_call_chunk(index, call_id=None, name=None, arguments=None):
+    return _chunk(
+        tool_calls=[
+            ChoiceDeltaToolCall(
+                index=index,
+                id=call_id,
+                type="function" if call_id else None,
+                function=ChoiceDeltaToolCallFunction(name=name, arguments=arguments),
+            )
+        ]
+    )
+
+
+class FakeClient:
+    """Chat completions client answering each create() with the next scripted stream"""
+
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return iter(self.streams.pop(0))
+
+
+def test_stream_chat_input_runs_tool_calls_and_streams_the_answer(
+    chat_manager, mongo_manager
+):
+    mongo_manager.create_document(
+        DocumentEntry(document_id="d1", user_id="u1", text="referto: emicrania")
+    )
+    client = FakeClient(
+        [
+            _tool_call_chunk(0, "call_1", "get_document", '{"document_'),
+            _tool_call_chunk(0, arguments='id": "d1"}'),
+            _chunk(finish_reason="tool_calls"),
+        ],
+        [_chunk("Il referto "), _chunk("parla di emicrania."), _chunk(finish_reason="stop")],
+    )
+    chat_manager.agent.client = client
+
+    deltas = list(chat_manager.stream_chat_input("Cosa dice il referto?"))
+
+    assert deltas == ["Il referto ", "parla di emicrania."]
+    assert chat_manager.messages[-1].role == "assistant"
+    assert chat_manager.messages[-1].content == "Il referto parla di emicrania."
+    assert chat_manager.flush(5)
+
+    # The second turn sees the tool call and its result
+    assistant, tool = client.requests[1]["messages"][-2:]
+    assert assistant["tool_calls"][0]["function"] == {
+        "name": "get_document",
+        "arguments": '{"document_id": "d1"}',
+    }
+    assert tool["tool_call_id"] == "call_1"
+    assert "referto: emicrania" in tool["content"]
+    assert client.requests[1]["tools"] == chat_manager.agent.tools
+
+
+def test_stream_forbids_tools_once_the_rounds_are_used_up(chat_manager):
+    calls = [_tool_call_chunk(0, "call_x", "missing", "{}")]
+    chat_manager.agent.max_tool_rounds = 1
+    chat_manager.agent.client = client = FakeClient(calls, [_chunk("ok")])
+
+    assert list(chat_manager.agent.stream([])) == ["ok"]
+    assert "tool_choice" not in client.requests[0]
+    assert client.requests[1]["tool_choice"] == "none"
+
+
+def test_stream_yields_deltas_and_times_the_first_token_once(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    agent = DailyAgent()
+    agent.metrics = Metrics()
+    agent.client = client = FakeClient(
+        [
+            _chunk("Buon"),
+            _chunk(""),
+            _chunk("giorno"),
+            _chunk(finish_reason="stop"),
+            # With include_usage the usage arrives in a last chunk without choices
+            _usage_chunk(10, 4),
+        ]
+    )
+
+    assert list(agent.stream([])) == ["Buon", "giorno"]
+    assert "tools" not in client.requests[0]
+    snapshot = agent.metrics.snapshot()
+    assert snapshot["timings"]["agent.time_to_first_token"]["count"] == 1
+    assert snapshot["timings"]["agent.stream_duration"]["count"] == 1
+    assert snapshot["counters"]["agent.prompt_tokens"] == 10
+    assert snapshot["counters"]["agent.cached_prompt_tokens"] == 4
+
+
+def _stored_contents(chat_manager, mongo_manager):
+    assert chat_manager.flush(5)
+    stored = mongo_manager.conversations.find_one({"session_id": "s"})
+    return [message["content"] for message in stored["messages"]]
+
+
+def test_stream_chat_input_keeps_a_reply_closed_early(chat_manager, mongo_manager):
+    chat_manager.agent.client = FakeClient([_chunk("Buon"), _chunk("giorno")])
+
+    stream = chat_manager.stream_chat_input("ciao")
+    assert next(stream) == "Buon"
+    stream.close()
+
+    assert [m.content for m in chat_manager.messages] == ["ciao", "Buon"]
+    assert _stored_contents(chat_manager, mongo_manager) == ["ciao", "Buon"]
+
+
+def test_stream_chat_input_records_errors(chat_manager, mongo_manager):
+    def broken_stream():
+        yield _chunk("Buon")
+        raise ConnectionError("reset")
+
+    chat_manager.agent.client = FakeClient(broken_stream())
+
+    assert list(chat_manager.stream_chat_input("ciao")) == ["Buon"]
+    assert [(m.role, m.content) for m in chat_manager.messages] == [
+        ("user", "ciao"),
+        ("assistant", "Buon"),
+        ("system", "Chat error: reset"),
+    ]
+    assert _stored_contents(chat_manager, mongo_manager)[:2] == ["ciao", "Buon"]
+
+
+def test_record_usage_counts_cached_prompt_tokens(monkeypatch, caplog):
+    import src.openai
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(src.openai, "PROMPT_CACHE_VERIFY", True)
+    agent = DailyAgent()
+    agent.metrics = Metrics()
+
+    with caplog.at_level("INFO"):
+        agent._record_usage(_usage_chunk(100, 64).usage)
+    # Without details, e.g. from providers that do not report caching
+    agent._record_usage(
+        CompletionUsage(prompt_tokens=50, completion_tokens=2, total_tokens=52)
+    )
+    agent._record_usage(None)
+
+    counters = agent.metrics.snapshot()["counters"]
+    assert counters["agent.prompt_tokens"] == 150
+    assert counters["agent.cached_prompt_tokens"] == 64
+    assert "64 cached, 36 uncached of 100 prompt tokens" in caplog.text
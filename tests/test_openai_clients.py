@@ -0,0 +1,71 @@
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import pytest
+from src import openai_clients
+from src.CONSTANTS import OPENAI_MAX_RETRIES
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients(monkeypatch):
+    monkeypatch.setattr(openai_clients, "_clients", {})
+    yield
+    openai_clients.close_openai_clients()
+
+
+def test_one_client_per_api_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "key-a")
+    client = openai_clients.get_openai_client()
+
+    assert openai_clients.get_openai_client("key-a") is client
+    assert openai_clients.get_openai_client("key-b") is not client
+    assert client.api_key == "key-a"
+    assert client.max_retries == OPENAI_MAX_RETRIES
+
+
+def test_concurrent_callers_share_one_client():
+    clients = []
+
+    def connect():
+        clients.append(openai_clients.get_openai_client("key-a"))
+
+    threads = [threading.Thread(target=connect) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(openai_clients._clients) == 1
+    assert all(client is clients[0] for client in clients)
+
+
+def test_close_closes_the_connection_pools():
+    client = openai_clients.get_openai_client("key-a")
+
+    openai_clients.close_openai_clients()
+
+    assert client._client.is_closed
+    assert openai_clients.get_openai_client("key-a") is not client
+
+
+def test_clients_are_closed_at_exit():
+    script = "\n".join(
+        [
+            "from src import openai_clients",
+            "client = openai_clients.get_openai_client('key-a')",
+            "close = client.close",
+            "client.close = lambda: (print('closed'), close())",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["closed"]
@@ -0,0 +1,66 @@
+import os
+from src.CONSTANTS import (
+    DEFAULT_DOCUMENTS_PROMPT,
+    DEFAULT_SESSION_PROMPT,
+    DEFAULT_SUMMARIES_PROMPT,
+    DEFAULT_SYSTEM_PROMPT,
+)
+from src.prompts import DAILY, SESSION, STATIC, PromptSegment, assemble_prompt
+
+
+def test_segments_are_ordered_most_stable_first():
+    prompt = assemble_prompt(
+        [
+            PromptSegment("ora: {time}", SESSION),
+            PromptSegment("riassunti: {summaries}", DAILY),
+            PromptSegment("istruzioni per {patient}", STATIC),
+            PromptSegment("sessioni di oggi", SESSION),
+        ],
+        time="10:00",
+        summaries="nessuno",
+        patient="Mario",
+    )
+    # Segments of the same stability keep their order
+    assert prompt.split("\n\n") == [
+        "istruzioni per Mario",
+        "riassunti: nessuno",
+        "ora: 10:00",
+        "sessioni di oggi",
+    ]
+
+
+def _default_prompt(current_time, previous_sessions):
+    # As ChatManager.initialize_chat assembles it
+    return assemble_prompt(
+        [
+            PromptSegment(DEFAULT_SYSTEM_PROMPT, STATIC),
+            PromptSegment(DEFAULT_SUMMARIES_PROMPT, DAILY),
+            PromptSegment(DEFAULT_DOCUMENTS_PROMPT, SESSION),
+            PromptSegment(DEFAULT_SESSION_PROMPT, SESSION),
+        ],
+        patient="Mario",
+        n=7,
+        summaries="[2024-01-14] mal di testa",
+        documents="[d1] referto",
+        previous_sessions=previous_sessions,
+        current_time=current_time,
+    )
+
+
+def test_sessions_of_a_day_share_the_prompt_up_to_the_session_segments():
+    morning = _default_prompt("2024-01-15 09:00", "Nessuna sessione precedente trovata.")
+    evening = _default_prompt("2024-01-15 18:00", "user: ho la febbre")
+
+    stable = assemble_prompt(
+        [
+            PromptSegment(DEFAULT_SYSTEM_PROMPT, STATIC),
+            PromptSegment(DEFAULT_SUMMARIES_PROMPT, DAILY),
+        ],
+        patient="Mario",
+        n=7,
+        summaries="[2024-01-14] mal di testa",
+    )
+    shared = os.path.commonprefix([morning, evening])
+    # Everything up to the session segments can be served from the prompt cache
+    assert shared.startswith(stable)
+    assert len(shared) > len(stable) and morning != evening
@@ -0,0 +1,163 @@
+from datetime import date, datetime, time, timedelta
+from src.models import ConversationEntry, Message, RollingSummary
+from src.mongo_indexes import ensure_indexes
+
+DAY = date(2024, 1, 15)
+
+
+def _at(hour):
+    return datetime.combine(DAY, time(hour))
+
+
+class StubAgent:
+    """Agent answering each create() with a numbered summary and keeping the prompts"""
+
+    def __init__(self, on_create=None):
+        self.prompts = []
+        self.on_create = on_create
+
+    def create(self, messages, model=None):
+        self.prompts.append(messages[-1].content)
+        if self.on_create:
+            self.on_create()
+        return Message(role="assistant", content=f"riassunto {len(self.prompts)}")
+
+
+def _start_session(mongo_manager, session_id, hour, content, user_id="u1"):
+    mongo_manager.create_conversation(
+        ConversationEntry(
+            session_id=session_id,
+            user_id=user_id,
+            created_at=_at(hour),
+            messages=[Message(role="user", content=content, timestamp=_at(hour))],
+        )
+    )
+
+
+def test_update_folds_only_the_new_messages(summary_manager, mongo_manager):
+    summary_manager.agent = agent = StubAgent()
+    _start_session(mongo_manager, "s1", 9, "ho mal di testa")
+
+    first = summary_manager.update_rolling_summary("u1", DAY)
+    assert (first.summary, first.version) == ("riassunto 1", 1)
+    assert first.message_counts == {"s1": 1}
+    assert first.covered_until == _at(9)
+
+    mongo_manager.append_conversation_messages(
+        "s1", "u1", [Message(role="assistant", content="da quando?", timestamp=_at(10))]
+    )
+    _start_session(mongo_manager, "s2", 11, "ora ho la febbre")
+    second = summary_manager.update_rolling_summary("u1", DAY)
+
+    assert (second.summary, second.version) == ("riassunto 2", 2)
+    assert second.message_counts == {"s1": 2, "s2": 1}
+    assert second.covered_until == _at(11)
+    assert "riassunto 1" in agent.prompts[1]
+    assert "da quando?" in agent.prompts[1] and "ora ho la febbre" in agent.prompts[1]
+    assert "ho mal di testa" not in agent.prompts[1]
+    stored = mongo_manager.get_rolling_summary("u1", DAY)
+    assert (stored.summary, stored.version, stored.message_counts) == (
+        "riassunto 2",
+        2,
+        {"s1": 2, "s2": 1},
+    )
+
+    # Nothing new: the stored summary is returned without a model call
+    assert summary_manager.update_rolling_summary("u1", DAY).version == 2
+    assert len(agent.prompts) == 2
+
+
+def test_update_without_conversations_returns_none(summary_manager):
+    summary_manager.agent = agent = StubAgent()
+    assert summary_manager.update_rolling_summary("u1", DAY) is None
+    assert agent.prompts == []
+
+
+def test_concurrent_updates_keep_the_stored_version(summary_manager, mongo_manager):
+    ensure_indexes(mongo_manager.db)
+    _start_session(mongo_manager, "s1", 9, "ho mal di testa")
+    other = RollingSummary(
+        user_id="u1", day=_at(0), summary="dall'altro processo", message_counts={"s1": 1}
+    )
+    # Another process stores its version while the model call runs
+    summary_manager.agent = StubAgent(
+        on_create=lambda: mongo_manager.replace_rolling_summary(other, expected_version=0)
+    )
+    kept = summary_manager.update_rolling_summary("u1", DAY)
+    assert (kept.summary, kept.version) == ("dall'altro processo", 1)
+
+    # Same for an update of a stored version
+    _start_session(mongo_manager, "s2", 11, "ora ho la febbre")
+    newer = other.model_copy(update={"version": 2, "summary": "ancora dall'altro"})
+    summary_manager.agent = StubAgent(
+        on_create=lambda: mongo_manager.replace_rolling_summary(newer, expected_version=1)
+    )
+    kept = summary_manager.update_rolling_summary("u1", DAY)
+    assert (kept.summary, kept.version) == ("ancora dall'altro", 2)
+    assert mongo_manager.rolling_summaries.count_documents({}) == 1
+
+
+def test_daily_summary_promotes_the_rolling_summary(summary_manager, mongo_manager):
+    summary_manager.agent = agent = StubAgent()
+    assert summary_manager._promote_rolling_summary("u1", DAY, "m") is None
+
+    _start_session(mongo_manager, "s1", 9, "ho mal di testa")
+    summary_manager.update_rolling_summary("u1", DAY)
+    _start_session(mongo_manager, "s2", 11, "ora ho la febbre")
+
+    summary = summary_manager.summarize_user("u1", DAY, "m")
+
+    # Brought up to date with the session not folded yet, not summarized again
+    assert len(agent.prompts) == 2
+    assert "ora ho la febbre" in agent.prompts[1]
+    assert (summary.summary, summary.level, summary.day) == ("riassunto 2", "daily", _at(0))
+    assert summary.session_ids == ["s1", "s2"]
+
+
+class StubSummaryManager:
+    def __init__(self):
+        self.calls = []
+
+    def update_rolling_summary(self, user_id, day):
+        self.calls.append((user_id, day))
+
+
+def _today_session(mongo_manager, session_id, minutes_ago):
+    started = datetime.now() - timedelta(minutes=minutes_ago)
+    mongo_manager.create_conversation(
+        ConversationEntry(
+            session_id=session_id,
+            user_id="u1",
+            created_at=started,
+            messages=[Message(role="user", content="ho mal di testa", timestamp=started)],
+        )
+    )
+
+
+def test_sessions_ended_without_end_session_are_folded(chat_manager, mongo_manager):
+    chat_manager._summary_manager = stub = StubSummaryManager()
+    _today_session(mongo_manager, "chiusa", 5)
+
+    chat_manager.initialize_chat()
+
+    assert chat_manager.write_behind.flush(timeout=5)
+    assert stub.calls == [("u1", date.today())]
+
+
+def test_folded_sessions_are_not_folded_again(chat_manager, mongo_manager):
+    chat_manager._summary_manager = stub = StubSummaryManager()
+    _today_session(mongo_manager, "chiusa", 5)
+    mongo_manager.replace_rolling_summary(
+        RollingSummary(
+            user_id="u1",
+            day=datetime.combine(date.today(), time()),
+            summary="mal di testa",
+            message_counts={"chiusa": 1},
+        ),
+        expected_version=0,
+    )
+
+    chat_manager.initialize_chat()
+
+    assert chat_manager.write_behind.flush(timeout=5)
+    assert stub.calls == []
@@ -0,0 +1,98 @@
+from datetime import date, datetime
+import pytest
+from src.rollups import (
+    months_before,
+    period_start,
+    rollup_counts,
+    rollup_sources,
+    rollups_due,
+    select_summary_levels,
+    summary_key,
+    summary_label,
+    summary_level,
+)
+
+
+def test_period_start():
+    day = date(2024, 5, 15)  # a Wednesday
+    assert period_start("daily", day) == day
+    assert period_start("weekly", day) == date(2024, 5, 13)
+    assert period_start("monthly", day) == date(2024, 5, 1)
+    with pytest.raises(ValueError):
+        period_start("yearly", day)
+
+
+def test_months_before_crosses_years():
+    assert months_before(date(2024, 2, 20), 3) == date(2023, 11, 1)
+    assert months_before(date(2024, 12, 5), -1) == date(2025, 1, 1)
+
+
+def test_rollup_sources():
+    week = date(2024, 5, 13)
+    assert rollup_sources("weekly", week) == ("daily", week, date(2024, 5, 19))
+    # May 2024: the weeks ending on Sundays 5, 12, 19 and 26 May
+    month = date(2024, 5, 1)
+    assert rollup_sources("monthly", month) == ("weekly", date(2024, 4, 25), date(2024, 5, 25))
+    with pytest.raises(ValueError):
+        rollup_sources("daily", date(2024, 5, 1))
+
+
+def test_rollups_due_on_sundays_and_last_sunday_of_month():
+    assert rollups_due(date(2024, 5, 18)) == []
+    assert rollups_due(date(2024, 5, 19)) == [("weekly", date(2024, 5, 13))]
+    assert rollups_due(date(2024, 5, 26)) == [
+        ("weekly", date(2024, 5, 20)),
+        ("monthly", date(2024, 5, 1)),
+    ]
+
+
+def test_labels_levels_and_keys():
+    legacy = {"_id": "x", "day": datetime(2024, 5, 13), "summary": "s"}
+    weekly = {"summary_id": "w", "_id": "y", "day": datetime(2024, 5, 13), "level": "weekly"}
+    assert summary_level(legacy) == "daily"
+    assert summary_key(legacy) == "x" and summary_key(weekly) == "w"
+    assert summary_label(legacy) == "Day 2024-05-13"
+    assert summary_label(weekly) == "Week 2024-05-13 - 2024-05-19"
+    assert summary_label({**weekly, "level": "monthly"}) == "Month 2024-05"
+    assert rollup_counts([legacy, weekly, weekly]) == {"daily": 1, "weekly": 2}
+
+
+def _summary(key, day, words, level="daily", source_ids=None):
+    return {
+        "summary_id": key,
+        "day": datetime(2024, 5, day),
+        "summary": " ".join(["parola"] * words),
+        "level": level,
+        "source_ids": source_ids or [],
+    }
+
+
+@pytest.fixture
+def history():
+    # Two weeks of three daily summaries each, and the weekly rollup of each week
+    days = [_summary(f"d{day}", day, 10) for day in (6, 7, 8, 13, 14, 15)]
+    weeks = [
+        _summary("w1", 6, 8, "weekly", ["d6", "d7", "d8"]),
+        _summary("w2", 13, 8, "weekly", ["d13", "d14", "d15"]),
+    ]
+    return days + weeks
+
+
+def _keys(selection):
+    return [s["summary_id"] for s in selection]
+
+
+def test_selection_refines_newest_rollups_first(history):
+    assert _keys(select_summary_levels(history, budget=16)) == ["w1", "w2"]
+    assert _keys(select_summary_levels(history, budget=38)) == ["w1", "d13", "d14", "d15"]
+    days = ["d6", "d7", "d8", "d13", "d14", "d15"]
+    assert _keys(select_summary_levels(history, budget=60)) == days
+
+
+def test_selection_drops_oldest_when_even_the_coarsest_cover_does_not_fit(history):
+    assert _keys(select_summary_levels(history, budget=10)) == ["w2"]
+
+
+def test_rollups_with_missing_sources_are_not_refined(history):
+    partial = [s for s in history if s["summary_id"] != "d14"]
+    assert _keys(select_summary_levels(partial, budget=1000)) == ["d6", "d7", "d8", "w2"]
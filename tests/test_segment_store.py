@@ -0,0 +1,107 @@
+import mongomock
+import numpy as np
+import pytest
+from src.embedding_codec import encode_embedding
+
+
+def _collection(rows):
+    collection = mongomock.MongoClient().db.summaries
+    for doc_id, user_id, embedding in rows:
+        collection.insert_one(
+            {"_id": doc_id, "user_id": user_id, "embedding": encode_embedding(embedding)}
+        )
+    return collection
+
+
+def _live(store, collection, user_id=None):
+    ids, matrix, owners = store.load(collection, user_id)
+    return {doc_id: (owner, list(row)) for doc_id, owner, row in zip(ids, owners, matrix)}
+
+
+def test_append_is_ignored_until_the_collection_is_synced(segment_store):
+    segment_store.append("summaries", [("a", "u", [1.0, 0.0])])
+    assert not segment_store.has_collection("summaries")
+    assert segment_store.stats("summaries") == {"collection": "summaries", "synced": False}
+
+
+def test_resync_writes_segments_from_mongo(segment_store):
+    rows = [(f"d{i}", f"u{i % 2}", [float(i), 1.0]) for i in range(10)]
+    assert segment_store.resync("summaries", _collection(rows), batch_size=3, model="m") == 10
+
+    stats = segment_store.stats("summaries")
+    assert stats["model"] == "m" and stats["dim"] == 2
+    assert stats["segments"] == 3  # max_segment_rows is 4
+    assert _live(segment_store, "summaries") == {
+        doc_id: (user_id, embedding) for doc_id, user_id, embedding in rows
+    }
+    assert set(_live(segment_store, "summaries", "u1")) == {"d1", "d3", "d5", "d7", "d9"}
+
+
+def test_resync_skips_vectors_of_another_dimension(segment_store):
+    rows = [("a", "u", [1.0, 0.0]), ("b", "u", [1.0, 0.0, 0.0]), ("c", "u", [0.0, 1.0])]
+    assert segment_store.resync("summaries", _collection(rows)) == 2
+    assert set(_live(segment_store, "summaries")) == {"a", "c"}
+
+
+def test_rewrite_and_delete_supersede_older_rows(segment_store):
+    segment_store.resync("summaries", _collection([("a", "u", [1.0, 0.0]), ("b", "u", [0.0, 1.0])]))
+    segment_store.append("summaries", [("a", "u", [0.5, 0.5]), ("c", "u", [1.0, 1.0])])
+    segment_store.delete("summaries", ["b"])
+
+    assert _live(segment_store, "summaries") == {
+        "a": ("u", [0.5, 0.5]),
+        "c": ("u", [1.0, 1.0]),
+    }
+    stats = segment_store.stats("summaries")
+    assert (stats["rows"], stats["live_rows"], stats["dead_rows"]) == (4, 2, 2)
+
+
+def test_append_rejects_vectors_of_another_dimension(segment_store):
+    segment_store.resync("summaries", _collection([("a", "u", [1.0, 0.0])]))
+    with pytest.raises(ValueError):
+        segment_store.append("summaries", [("b", "u", [1.0, 0.0, 0.0])])
+
+
+def test_compact_drops_dead_rows_and_keeps_live_ones(segment_store):
+    rows = [(f"d{i}", "u", [float(i), 0.0]) for i in range(6)]
+    segment_store.resync("summaries", _collection(rows))
+    segment_store.delete("summaries", ["d0", "d1", "d2"])
+    segment_store.append("summaries", [("d3", "u", [9.0, 9.0])])
+    before = _live(segment_store, "summaries")
+
+    assert segment_store.compact("summaries") == 3
+    assert _live(segment_store, "summaries") == before
+    stats = segment_store.stats("summaries")
+    assert (stats["rows"], stats["dead_rows"], stats["segments"]) == (3, 0, 1)
+
+    # Sequence numbers continue, so appends after a compaction still supersede
+    segment_store.append("summaries", [("d4", "u", [1.0, 1.0])])
+    assert _live(segment_store, "summaries")["d4"] == ("u", [1.0, 1.0])
+
+
+def test_single_live_segment_is_returned_as_mmap(segment_store):
+    segment_store.resync("summaries", _collection([("a", "u", [1.0, 0.0])]))
+    _, matrix, _ = segment_store.load("summaries")
+    assert isinstance(matrix, np.memmap)
+
+
+def test_collection_synced_while_empty_takes_dimension_of_first_append(segment_store):
+    assert segment_store.resync("summaries", _collection([])) == 0
+    assert segment_store.has_collection("summaries")
+    assert segment_store.load("summaries")[0] == []
+
+    segment_store.append("summaries", [("a", "u", [1.0, 0.0, 0.0])])
+    assert segment_store.stats("summaries")["dim"] == 3
+    assert _live(segment_store, "summaries") == {"a": ("u", [1.0, 0.0, 0.0])}
+
+
+def test_documents_can_be_created_after_resyncing_an_empty_collection(mongo_manager):
+    from src.models import DocumentEntry
+
+    assert mongo_manager.resync_embedding_segments("documents") == 0
+    mongo_manager.create_document(
+        DocumentEntry(document_id="d1", user_id="u", text="referto", embedding=[0.6, 0.8])
+    )
+    ids, matrix, _ = mongo_manager.segment_store.load("documents")
+    assert len(ids) == 1
+    np.testing.assert_allclose(matrix[0], [0.6, 0.8], rtol=1e-6)
@@ -0,0 +1,155 @@
+from datetime import date, datetime, time
+import io
+import json
+import pytest
+from src.models import ConversationEntry, Message, SummaryEntry, User
+from src.summary_batch import (
+    BATCH_ENDPOINT,
+    parse_custom_id,
+    read_results,
+    summary_custom_id,
+    write_request,
+)
+
+DAY = date(2024, 1, 15)
+
+
+def test_custom_ids_round_trip_user_ids_with_separators():
+    custom_id = summary_custom_id("daily", "a|b", DAY)
+    assert custom_id == "summary|daily|a|b|2024-01-15"
+    assert parse_custom_id(custom_id) == ("daily", "a|b", DAY)
+    with pytest.raises(ValueError):
+        parse_custom_id("other|daily|u|2024-01-15")
+
+
+def test_write_request():
+    file = io.StringIO()
+    custom_id = write_request(file, "daily", "u", DAY, "gpt-4o", "Riassumi")
+    line = json.loads(file.getvalue())
+    assert line["custom_id"] == custom_id
+    assert line["url"] == BATCH_ENDPOINT
+    assert line["body"]["messages"] == [{"role": "user", "content": "Riassumi"}]
+
+
+def test_read_results_of_successes_and_failures():
+    lines = [
+        {
+            "custom_id": summary_custom_id("daily", "ok", DAY),
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "choices": [{"message": {"content": "riassunto"}}],
+                    "usage": {"prompt_tokens": 42},
+                },
+            },
+        },
+        {
+            "custom_id": summary_custom_id("daily", "http", DAY),
+            "response": {"status_code": 429, "body": {"error": {"message": "rate limited"}}},
+        },
+        {"custom_id": summary_custom_id("daily", "expired", DAY), "error": {"code": "expired"}},
+    ]
+    text = "\n".join(json.dumps(line) for line in lines) + "\n\n"
+    results = list(read_results(io.StringIO(text)))
+    assert [(r.user_id, r.content, r.error, r.prompt_tokens) for r in results] == [
+        ("ok", "riassunto", None, 42),
+        ("http", None, "rate limited", 0),
+        ("expired", None, "{'code': 'expired'}", 0),
+    ]
+
+
+def _seed_users(mongo_manager, with_conversations):
+    for user_id in ["u1", "u2", "u3", "u4"]:
+        mongo_manager.create_user(
+            User(user_id=user_id, name=user_id, email=f"{user_id}@x.it", password="pw")
+        )
+    for user_id in with_conversations:
+        started = datetime.combine(DAY, time(9))
+        mongo_manager.create_conversation(
+            ConversationEntry(
+                session_id=f"s-{user_id}",
+                user_id=user_id,
+                created_at=started,
+                messages=[Message(role="user", content="ho mal di testa", timestamp=started)],
+            )
+        )
+
+
+def _result_line(custom_id, content=None, error=None):
+    if error:
+        return {"custom_id": custom_id, "error": {"code": "expired", "message": error}}
+    return {
+        "custom_id": custom_id,
+        "response": {
+            "status_code": 200,
+            "body": {
+                "choices": [{"message": {"content": content}}],
+                "usage": {"prompt_tokens": 50},
+            },
+        },
+    }
+
+
+def test_export_then_import_batch_results(summary_manager, mongo_manager, tmp_path):
+    _seed_users(mongo_manager, ["u1", "u2", "u4"])
+    requests_path = tmp_path / "requests.jsonl"
+
+    assert summary_manager.export_batch_requests(str(requests_path), day=DAY) == 3
+    requests = [json.loads(line) for line in requests_path.read_text().splitlines()]
+    assert [r["custom_id"] for r in requests] == [
+        summary_custom_id("daily", user_id, DAY) for user_id in ["u1", "u2", "u4"]
+    ]
+    assert "ho mal di testa" in requests[0]["body"]["messages"][0]["content"]
+    checkpoints = mongo_manager.get_summary_checkpoints("daily", DAY)
+    assert {u: c["status"] for u, c in checkpoints.items()} == {
+        "u1": "exported",
+        "u2": "exported",
+        "u3": "empty",
+        "u4": "exported",
+    }
+    assert checkpoints["u1"]["session_ids"] == ["s-u1"]
+    # Exported users are not exported twice
+    assert summary_manager.export_batch_requests(str(requests_path), day=DAY) == 0
+
+    # u4 got summarized by another run before the results came back
+    mongo_manager.create_summary(
+        SummaryEntry(
+            summary_id="u4-live",
+            user_id="u4",
+            day=datetime.combine(DAY, time()),
+            summary="riassunto dal vivo",
+            session_ids=["s-u4"],
+        )
+    )
+    results_path = tmp_path / "results.jsonl"
+    results_path.write_text(
+        "\n".join(
+            json.dumps(line)
+            for line in [
+                _result_line(requests[0]["custom_id"], content="mal di testa al mattino"),
+                _result_line(requests[1]["custom_id"], error="Batch expired"),
+                _result_line(requests[2]["custom_id"], content="riassunto del batch"),
+            ]
+        )
+    )
+
+    (report,) = summary_manager.import_batch_results(str(results_path))
+    assert (report.job, report.day, report.users) == ("daily", DAY, 3)
+    assert (report.summarized, report.failed, report.skipped) == (1, 1, 1)
+    assert report.prompt_tokens == 50
+
+    stored = {s["user_id"]: s for s in mongo_manager.summaries.find({}, {"_id": 0})}
+    assert stored["u1"]["summary"] == "mal di testa al mattino"
+    assert stored["u1"]["session_ids"] == ["s-u1"]
+    assert stored["u1"]["day"] == datetime.combine(DAY, time())
+    assert stored["u1"]["embedding_model"] == summary_manager.embedding_generator.model
+    assert stored["u4"]["summary"] == "riassunto dal vivo"
+    assert "u2" not in stored
+
+    checkpoints = mongo_manager.get_summary_checkpoints("daily", DAY)
+    assert checkpoints["u1"]["status"] == "done"
+    assert checkpoints["u1"]["summary_id"] == stored["u1"]["summary_id"]
+    assert (checkpoints["u2"]["status"], checkpoints["u2"]["error"]) == ("failed", "Batch expired")
+    assert checkpoints["u3"]["status"] == "empty"
+    # The failed user is exported again, the others are finished
+    assert summary_manager.export_batch_requests(str(requests_path), day=DAY) == 1
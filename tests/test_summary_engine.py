@@ -0,0 +1,136 @@
+from datetime import date, datetime, time
+import pytest
+from src import summary_engine
+from src.models import SummaryEntry, User
+from src.summary_engine import SummaryEngine, TokenBucket
+
+DAY = date(2024, 1, 15)
+
+
+class FakeClock:
+    """Stands in for the time module of summary_engine"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_waits_follow_its_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(summary_engine, "time", clock)
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+
+    assert bucket.acquire(2) == 0
+    assert bucket.acquire(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.acquire(1) == pytest.approx(0.5)
+    # Requests larger than the bucket wait for a full bucket
+    assert bucket.acquire(5) == pytest.approx(2.0)
+    clock.now += 10
+    assert bucket.acquire(2) == 0
+    assert clock.sleeps == pytest.approx([1.0, 0.5, 2.0])
+
+
+class StubSummarizer:
+    """summarize_user replacement returning or raising the scripted outcomes of each user"""
+
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.calls = []
+
+    def __call__(self, user_id, day, model, acquire=None, level="daily"):
+        self.calls.append(user_id)
+        acquire(f"conversazioni di {user_id}")
+        script = self.outcomes[user_id]
+        outcome = script.pop(0) if len(script) > 1 else script[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome is None:
+            return None
+        return SummaryEntry(
+            user_id=user_id, level=level, day=datetime.combine(day, time()), summary=outcome
+        )
+
+
+@pytest.fixture
+def engine(monkeypatch, summary_manager, mongo_manager):
+    for user_id in ["u1", "u2", "u3", "u4"]:
+        mongo_manager.create_user(
+            User(user_id=user_id, name=user_id, email=f"{user_id}@x.it", password="pw")
+        )
+    monkeypatch.setattr(summary_engine.random, "random", lambda: 0.0)
+    return SummaryEngine(
+        summary_manager,
+        workers=1,
+        requests_per_minute=10_000,
+        tokens_per_minute=1_000_000,
+        max_retries=2,
+    )
+
+
+def test_failures_are_retried_then_checkpointed(monkeypatch, engine, mongo_manager):
+    sleeps = []
+    monkeypatch.setattr(summary_engine.time, "sleep", sleeps.append)
+    stub = StubSummarizer(
+        {
+            "u1": ["riassunto u1"],
+            "u2": [None],
+            "u3": [TimeoutError("timeout")],
+            "u4": [TimeoutError("timeout"), "riassunto u4"],
+        }
+    )
+    engine.summary_manager.summarize_user = stub
+
+    report = engine.run("daily", DAY, "m")
+
+    assert (report.users, report.skipped) == (4, 0)
+    assert (report.summarized, report.empty, report.failed) == (2, 1, 1)
+    assert sorted(stub.calls) == ["u1", "u2", "u3", "u3", "u3", "u4", "u4"]
+    # Each attempt waits for its three-word prompt
+    assert report.prompt_tokens == 7 * 3
+    # Jittered backoff, doubling per attempt
+    assert sorted(sleeps) == [1.0, 1.0, 2.0]
+
+    checkpoints = mongo_manager.get_summary_checkpoints("daily", DAY)
+    assert {u: c["status"] for u, c in checkpoints.items()} == {
+        "u1": "done",
+        "u2": "empty",
+        "u3": "failed",
+        "u4": "done",
+    }
+    assert checkpoints["u3"]["error"] == "timeout"
+    stored = {s["user_id"]: s for s in mongo_manager.summaries.find()}
+    assert set(stored) == {"u1", "u4"}
+    assert checkpoints["u4"]["summary_id"] == stored["u4"]["summary_id"]
+
+
+def test_rerun_skips_done_and_empty_users(monkeypatch, engine, mongo_manager):
+    monkeypatch.setattr(summary_engine.time, "sleep", lambda seconds: None)
+    engine.summary_manager.summarize_user = StubSummarizer(
+        {
+            "u1": ["riassunto u1"],
+            "u2": [None],
+            "u3": [TimeoutError("timeout")],
+            "u4": [TimeoutError("timeout")],
+        }
+    )
+    engine.run("daily", DAY, "m")
+
+    rerun = StubSummarizer({"u3": ["riassunto u3"], "u4": [None]})
+    engine.summary_manager.summarize_user = rerun
+    report = engine.run("daily", DAY, "m")
+
+    assert sorted(rerun.calls) == ["u3", "u4"]
+    assert (report.users, report.skipped) == (4, 2)
+    assert (report.summarized, report.empty, report.failed) == (1, 1, 0)
+    checkpoints = mongo_manager.get_summary_checkpoints("daily", DAY)
+    assert (checkpoints["u3"]["status"], checkpoints["u4"]["status"]) == ("done", "empty")
+    # Nothing left for a third run
+    assert engine.run("daily", DAY, "m").skipped == 4
@@ -0,0 +1,77 @@
+from src.text_index import (
+    BM25Partition,
+    TextIndex,
+    extract_keywords,
+    reciprocal_rank_fusion,
+    stem,
+    tokenize,
+)
+
+
+def test_tokenize_folds_accents_drops_stopwords_and_splits_elisions():
+    assert tokenize("Il paziente è andato all'ospedale") == ["pazient", "andat", "all", "ospedal"]
+    assert tokenize("") == []
+
+
+def test_stem_only_strips_inflection_of_long_words():
+    assert stem("medici") == "medic"
+    assert stem("medico") == "medic"
+    assert stem("farmaci") == "farmac"
+    assert stem("testa") == "testa"
+
+
+def test_extract_keywords_ranks_by_frequency():
+    text = "Mal di testa. La testa fa male, testa pesante e nausea, nausea"
+    assert extract_keywords(text, 2) == ["testa", "nause"]
+    assert extract_keywords(None) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[("a", 9), ("b", 5)], [("b", 0.9), ("c", 0.1)]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_bm25_prefers_rarer_terms_and_shorter_documents():
+    partition = BM25Partition()
+    partition.add("a", ["testa", "dolor"])
+    partition.add("b", ["testa", "dolor", "febbr", "tosse", "nause"])
+    partition.add("c", ["febbr"])
+    results = partition.search(["testa", "dolor"], 10, 1.2, 0.75)
+    assert [doc_id for doc_id, _ in results] == ["a", "b"]
+
+
+def test_bm25_extend_and_remove_keep_statistics_consistent():
+    partition = BM25Partition()
+    partition.add("a", ["testa"])
+    partition.extend("a", ["febbr", "febbr"])
+    assert partition.lengths["a"] == 3
+    assert partition.postings["febbr"] == {"a": 2}
+
+    partition.remove("a")
+    assert partition.postings == {}
+    assert partition.total_length == 0
+    assert partition.search(["febbr"], 10, 1.2, 0.75) == []
+
+
+def test_text_index_upsert_append_remove():
+    index = TextIndex()
+    index.load("documents", "u", ["d1"], ["referto radiologico"])
+    index.load("documents", None, ["d1"], ["referto radiologico"], user_ids=["u"])
+
+    index.upsert("documents", "u", "d2", "esame del sangue")
+    index.append("documents", "u", "d1", "mal di testa")
+    assert index.search("documents", "u", "sangue", 5)[0][0] == "d2"
+    assert index.search("documents", None, "testa", 5)[0][0] == "d1"
+
+    index.remove("documents", "d2")
+    assert index.search("documents", None, "sangue", 5) == []
+
+
+def test_search_of_unloaded_partition_or_empty_query_is_empty():
+    index = TextIndex()
+    assert index.search("documents", "u", "testa", 5) == []
+    index.load("documents", "u", ["d1"], ["testa"])
+    assert index.search("documents", "u", "il di", 5) == []
+    index.invalidate()
+    assert not index.is_loaded("documents", "u")
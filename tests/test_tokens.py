@@ -0,0 +1,47 @@
+from src.models import Message
+from src.tokens import MESSAGE_TOKEN_OVERHEAD, TokenLedger, count_tokens, get_encoding
+
+
+def test_get_encoding_is_loaded_once_per_name():
+    assert get_encoding("gpt-4o") is get_encoding("gpt-4o")
+
+
+def test_count_tokens():
+    assert count_tokens("uno due tre") == 3
+    assert count_tokens("") == 0
+
+
+def _message(role, words):
+    return Message(role=role, content=" ".join(["parola"] * words))
+
+
+def test_ledger_keeps_system_message_and_longest_fitting_suffix():
+    cost = 5 + MESSAGE_TOKEN_OVERHEAD
+    ledger = TokenLedger(max_tokens=3 * cost)
+    system = _message("system", 5)
+    history = [_message("user", 5), _message("assistant", 5), _message("user", 5)]
+    ledger.extend([system] + history)
+    assert ledger.window() == [system] + history[1:]
+    assert ledger.total == 3 * cost
+
+    reply = _message("assistant", 5)
+    ledger.extend([reply])
+    assert ledger.window() == [system, history[2], reply]
+
+
+def test_ledger_ignores_later_system_messages():
+    ledger = TokenLedger(max_tokens=1000)
+    first, note = _message("system", 2), _message("system", 3)
+    user = _message("user", 1)
+    ledger.extend([first, user, note])
+    assert ledger.window() == [first, user]
+    assert ledger.total == 3 + 2 * MESSAGE_TOKEN_OVERHEAD
+
+
+def test_set_system_replaces_prompt_and_retrims():
+    ledger = TokenLedger(max_tokens=20)
+    ledger.extend([_message("user", 4), _message("user", 4)])
+    assert len(ledger.window()) == 2
+    ledger.set_system(_message("system", 6))
+    assert [m.role for m in ledger.window()] == ["system", "user"]
+    assert ledger.total <= 20
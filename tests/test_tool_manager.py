@@ -0,0 +1,136 @@
+import threading
+import time
+import pytest
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from src.tool_manager import ToolManager
+
+
+def _call(name, arguments="{}", call_id=None):
+    return ChatCompletionMessageToolCall(
+        id=call_id or f"call_{name}",
+        type="function",
+        function=Function(name=name, arguments=arguments),
+    )
+
+
+def lookup(query: str, limit: int = 3):
+    """
+    Look something up.
+
+    Args:
+        query: What to look up
+        limit: How many results
+    """
+    return {"query": query, "results": list(range(limit))}
+
+
+def test_definitions_describe_registered_tools():
+    manager = ToolManager()
+    manager.register_tool("lookup", lookup)
+    (definition,) = manager.definitions()
+    function = definition["function"]
+    assert function["name"] == "lookup"
+    assert function["description"] == "Look something up."
+    assert function["parameters"]["required"] == ["query"]
+    assert function["parameters"]["properties"]["limit"] == {
+        "type": "integer",
+        "description": "How many results",
+    }
+
+
+def test_results_errors_and_truncation():
+    manager = ToolManager(max_result_chars=20)
+    manager.register_tool("lookup", lookup)
+    manager.register_tool("echo", lambda text: text)
+    messages = manager.apply_tools(
+        [
+            _call("lookup", '{"query": "x", "limit": 1}'),
+            _call("echo", '{"text": "' + "a" * 30 + '"}'),
+            _call("missing"),
+            _call("lookup", "[1]", call_id="bad"),
+        ]
+    )
+    assert messages[0].content == '{"query": "x", "resu... [truncated, 30 characters]'
+    assert messages[1].content == "a" * 20 + "... [truncated, 30 characters]"
+    assert messages[2].content == "Error: Tool 'missing' not found"
+    assert messages[3].content.startswith("Error executing tool 'lookup'")
+    assert [m.tool_call_id for m in messages] == [
+        "call_lookup",
+        "call_echo",
+        "call_missing",
+        "bad",
+    ]
+
+
+def _sleeper(seconds):
+    def sleep():
+        time.sleep(seconds)
+        return "done"
+
+    return sleep
+
+
+def test_timeout_counts_from_when_a_call_starts():
+    # With one worker the second call waits 0.2s in the queue, then runs 0.2s
+    manager = ToolManager(workers=1, timeout=0.35)
+    manager.register_tool("sleep", _sleeper(0.2))
+    messages = manager.apply_tools([_call("sleep", call_id="a"), _call("sleep", call_id="b")])
+    assert [m.content for m in messages] == ["done", "done"]
+
+
+def test_timed_out_calls_are_abandoned_until_they_return():
+    release = threading.Event()
+    manager = ToolManager(workers=1, timeout=0.05)
+    manager.register_tool("hang", lambda: release.wait(5) and "late")
+    manager.register_tool("quick", lambda: "ok")
+
+    (message,) = manager.apply_tools([_call("hang")])
+    assert message.content == "Error executing tool 'hang': timed out after 0.05s"
+    assert manager._abandoned == 1
+
+    # Its worker is still busy: calls are refused instead of queued
+    (message,) = manager.apply_tools([_call("quick")])
+    assert message.content == "Error executing tool 'quick': no tool worker available"
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while manager._abandoned and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert manager._abandoned == 0
+    assert manager.apply_tools([_call("quick")])[0].content == "ok"
+
+
+def test_queued_call_is_cancelled_when_workers_stay_busy():
+    release = threading.Event()
+    ran = []
+    manager = ToolManager(workers=1, timeout=0.05)
+    manager.register_tool("hang", lambda: release.wait(5))
+    manager.register_tool("quick", lambda: ran.append(1) or "ok")
+    try:
+        messages = manager.apply_tools([_call("hang"), _call("quick")])
+        assert messages[0].content.endswith("timed out after 0.05s")
+        assert messages[1].content.endswith("no tool worker available")
+    finally:
+        release.set()
+    time.sleep(0.05)
+    assert ran == []
+
+
+def test_chat_manager_exposes_the_users_documents(chat_manager, mongo_manager):
+    from src.models import DocumentEntry
+
+    mongo_manager.create_document(DocumentEntry(document_id="d1", user_id="u1", text="referto"))
+    mongo_manager.create_document(DocumentEntry(document_id="d2", user_id="u2", text="altro"))
+
+    assert [tool["function"]["name"] for tool in chat_manager.agent.tools] == ["get_document"]
+    assert chat_manager.agent.tool_manager is chat_manager.tool_manager
+    messages = chat_manager.tool_manager.apply_tools(
+        [
+            _call("get_document", '{"document_id": "d1"}', "a"),
+            _call("get_document", '{"document_id": "d2"}', "b"),
+        ]
+    )
+    assert '"text": "referto"' in messages[0].content
+    assert "embedding" not in messages[0].content
+    assert messages[1].content == "Document d2 not found"
@@ -0,0 +1,100 @@
+import numpy as np
+from src.vector_index import VectorIndex, VectorPartition
+
+
+def _unit_rows(n, dim, seed=0):
+    rows = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_exact_search_returns_best_matches_in_order():
+    index = VectorIndex()
+    index.load("summaries", "u", ["a", "b", "c"], [[1, 0], [0.6, 0.8], [0, 1]])
+    results = index.search("summaries", "u", [1, 0], k=2)
+    assert [doc_id for doc_id, _ in results] == ["a", "b"]
+    assert results[0][1] == 1.0
+
+
+def test_upsert_and_remove_update_user_and_collection_partitions():
+    index = VectorIndex()
+    index.load("summaries", "u", ["a"], [[1, 0]])
+    index.load("summaries", None, ["a"], [[1, 0]], user_ids=["u"])
+    index.upsert("summaries", "u", "b", [0, 1])
+    assert index.search("summaries", "u", [0, 1], k=1)[0][0] == "b"
+    assert index.search("summaries", None, [0, 1], k=1)[0][0] == "b"
+
+    index.remove("summaries", "b")
+    assert [doc_id for doc_id, _ in index.search("summaries", None, [0, 1], k=5)] == ["a"]
+
+
+def test_upsert_into_empty_partition_takes_vector_dimension():
+    index = VectorIndex()
+    index.load("documents", "u", [], [])
+    index.upsert("documents", "u", "a", [0.0, 1.0, 0.0])
+    assert index.search("documents", "u", [0, 1, 0], k=1) == [("a", 1.0)]
+
+
+def test_mismatched_dimensions_are_skipped():
+    index = VectorIndex()
+    index.load("summaries", "u", ["a"], [[1, 0]])
+    index.upsert("summaries", "u", "b", [1, 0, 0])
+    assert index.search("summaries", "u", [1, 0, 0], k=1) == []
+    assert [doc_id for doc_id, _ in index.search("summaries", "u", [1, 0], k=5)] == ["a"]
+
+
+def test_invalidate_unloads_partitions():
+    index = VectorIndex()
+    index.load("summaries", "u", ["a"], [[1, 0]])
+    index.load("documents", "u", ["d"], [[1, 0]])
+    assert index.is_loaded("summaries", "u")
+    index.invalidate("summaries")
+    assert not index.is_loaded("summaries", "u")
+    assert index.is_loaded("documents", "u")
+
+
+def test_ttl_expires_partitions():
+    index = VectorIndex(ttl_seconds=0)
+    index.load("summaries", "u", ["a"], [[1, 0]])
+    assert not index.is_loaded("summaries", "u")
+
+
+def test_remove_moves_last_row_into_the_hole():
+    partition = VectorPartition.from_rows(["a", "b", "c"], np.eye(3, dtype=np.float32))
+    partition.remove("a")
+    assert partition.size == 2
+    assert partition.positions == {"c": 0, "b": 1}
+    assert partition.search(np.array([0, 0, 1], np.float32), 1, 10, 1) == [("c", 1.0)]
+
+
+def test_partition_loaded_from_read_only_matrix_accepts_writes():
+    matrix = np.eye(2, dtype=np.float32)
+    matrix.flags.writeable = False
+    partition = VectorPartition.from_rows(["a", "b"], matrix)
+    partition.upsert_many(["c"], np.array([[0.6, 0.8]], np.float32))
+    assert partition.size == 3
+
+
+def test_ivf_search_finds_nearest_neighbours():
+    rows = _unit_rows(400, 16)
+    ids = [f"d{i}" for i in range(len(rows))]
+    exact = VectorIndex(exact_threshold=10**6)
+    ivf = VectorIndex(exact_threshold=50, nprobe=20)
+    for index in (exact, ivf):
+        index.load("summaries", "u", ids, rows)
+
+    query = rows[7]
+    assert ivf.search("summaries", "u", query, k=1)[0][0] == "d7"
+    expected = {doc_id for doc_id, _ in exact.search("summaries", "u", query, k=10)}
+    found = {doc_id for doc_id, _ in ivf.search("summaries", "u", query, k=10)}
+    assert len(expected & found) >= 8
+
+
+def test_ivf_assigns_upserted_rows():
+    rows = _unit_rows(200, 8, seed=1)
+    index = VectorIndex(exact_threshold=50, nprobe=200)
+    index.load("summaries", "u", [f"d{i}" for i in range(len(rows))], rows)
+    index.search("summaries", "u", rows[0], k=1)  # trains the partition
+
+    new = _unit_rows(1, 8, seed=2)[0]
+    index.upsert("summaries", "u", "new", new)
+    assert index.search("summaries", "u", new, k=1)[0][0] == "new"
@@ -0,0 +1,160 @@
+import threading
+import time
+import pytest
+from src.metrics import Metrics
+from src.write_behind import WriteBehindQueue
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class Recorder:
+    """Jobs appending their name to ran, optionally held until a gate opens"""
+
+    def __init__(self):
+        self.ran = []
+        self.started = set()
+        self.lock = threading.Lock()
+
+    def job(self, name, gate=None):
+        def run():
+            with self.lock:
+                self.started.add(name)
+            if gate is not None:
+                assert gate.wait(5)
+            with self.lock:
+                self.ran.append(name)
+
+        return run
+
+
+@pytest.fixture
+def queue():
+    queue = WriteBehindQueue(workers=2, max_pending=8)
+    queue.metrics = Metrics()
+    yield queue
+    queue.shutdown(5)
+
+
+def _counter(queue, name):
+    return queue.metrics.snapshot()["counters"].get(name, 0)
+
+
+def test_waiting_jobs_of_a_key_are_coalesced(queue):
+    recorder, gate = Recorder(), threading.Event()
+    queue.submit("s", recorder.job("first", gate))
+    _wait_until(lambda: "first" in recorder.started)
+    queue.submit("s", recorder.job("second"))
+    queue.submit("s", recorder.job("third"))
+
+    assert not queue.flush("s", timeout=0.05)
+    gate.set()
+    assert queue.flush("s", timeout=5)
+    assert recorder.ran == ["first", "third"]
+    assert _counter(queue, "write_behind.coalesced") == 1
+
+
+def test_jobs_of_a_key_run_one_at_a_time(queue):
+    recorder, gate = Recorder(), threading.Event()
+    queue.submit("a", recorder.job("a1", gate))
+    _wait_until(lambda: "a1" in recorder.started)
+    queue.submit("a", recorder.job("a2"))
+    # Another key runs on the free worker meanwhile
+    queue.submit("b", recorder.job("b1"))
+    assert queue.flush("b", timeout=5)
+
+    assert recorder.ran == ["b1"] and "a2" not in recorder.started
+    gate.set()
+    assert queue.flush(timeout=5)
+    assert recorder.ran == ["b1", "a1", "a2"]
+
+
+def test_failed_jobs_do_not_stop_the_queue(queue):
+    recorder = Recorder()
+
+    def broken():
+        raise ValueError("boom")
+
+    queue.submit("s", broken)
+    assert queue.flush("s", timeout=5)
+    queue.submit("s", recorder.job("after"))
+    assert queue.flush(timeout=5)
+    assert recorder.ran == ["after"]
+    assert _counter(queue, "write_behind.failures") == 1
+
+
+def test_shutdown_drains_the_queue_and_rejects_new_jobs():
+    queue = WriteBehindQueue(workers=1)
+    queue.metrics = Metrics()
+    recorder, gate = Recorder(), threading.Event()
+    queue.submit("a", recorder.job("a", gate))
+    queue.submit("b", recorder.job("b"))
+    threading.Timer(0.05, gate.set).start()
+
+    queue.shutdown(5)
+
+    assert recorder.ran == ["a", "b"]
+    with pytest.raises(RuntimeError):
+        queue.submit("c", recorder.job("c"))
+
+
+def _full_queue(recorder, gates):
+    """Queue with its only worker held on "x" and its only slot taken by "p" """
+    queue = WriteBehindQueue(workers=1, max_pending=1)
+    queue.metrics = Metrics()
+    queue.submit("x", recorder.job("x", gates[0]))
+    _wait_until(lambda: "x" in recorder.started)
+    queue.submit("p", recorder.job("p", gates[1]))
+    return queue
+
+
+def _submit_in_thread(queue, key, job, errors):
+    def run():
+        try:
+            queue.submit(key, job)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_submits_waiting_for_room_coalesce_with_each_other():
+    recorder, gates, errors = Recorder(), [threading.Event(), threading.Event()], []
+    queue = _full_queue(recorder, gates)
+    threads = [
+        _submit_in_thread(queue, "q", recorder.job(name), errors) for name in ["q1", "q2"]
+    ]
+    _wait_until(lambda: _counter(queue, "write_behind.backpressure_waits") == 2)
+
+    # "p" starts and frees the slot: one submit takes it, the other coalesces
+    gates[0].set()
+    for thread in threads:
+        thread.join(5)
+    assert _counter(queue, "write_behind.coalesced") == 1
+    gates[1].set()
+    assert queue.flush(timeout=5)
+    assert errors == []
+    assert recorder.ran[:2] == ["x", "p"] and len(recorder.ran) == 3
+    queue.shutdown(5)
+
+
+def test_submit_waiting_for_room_fails_on_shutdown():
+    recorder, gates, errors = Recorder(), [threading.Event(), threading.Event()], []
+    queue = _full_queue(recorder, gates)
+    thread = _submit_in_thread(queue, "late", recorder.job("late"), errors)
+    _wait_until(lambda: _counter(queue, "write_behind.backpressure_waits") == 1)
+
+    queue.shutdown(0)
+    thread.join(5)
+    assert [type(e) for e in errors] == [RuntimeError]
+
+    for gate in gates:
+        gate.set()
+    queue.shutdown(5)
+    assert recorder.ran == ["x", "p"]